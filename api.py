@@ -1,20 +1,30 @@
 """FastAPI backend for DocuQuery AI — exposes RAG pipeline via REST endpoints."""
 
-import io
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import hashlib
 import logging
 import os
+import tempfile
 import time
 import traceback
+import uuid
 
-from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from dotenv import load_dotenv
-from pydantic import BaseModel
-
-from rag.parser import parse_file
-from rag.chunker import chunk_text
-from rag.embedder import embed_texts, embed_query
-from rag.store import add_chunks, query, clear
+from pydantic import BaseModel, Field
+
+from rag import jobs, metrics, startup
+from rag.parser import SUPPORTED_EXTENSIONS, file_extension
+from rag.pipeline import Revision, ingest
+from rag.embedder import (MAX_BATCH_INPUTS, cache_stats, coalescer_stats, embed_queries, embed_query,
+                          get_backend)
+from rag.store import (DEFAULT_SESSION, ID_PATTERN, add_chunks, document_embedder, document_fingerprint,
+                       document_rows, find_document, has_document, latest_document, query, query_batch)
 from rag.generator import generate_answer
 
 load_dotenv()
@@ -25,12 +35,48 @@ logging.basicConfig(level=logging.INFO)
 # --- Startup validation ---
 _openai_key = os.environ.get("OPENAI_API_KEY", "")
 if not _openai_key:
-    logger.error("OPENAI_API_KEY is not set — the API will not be able to process documents.")
+    if get_backend().remote:
+        logger.error("OPENAI_API_KEY is not set — the API will not be able to process documents.")
+    else:
+        logger.error("OPENAI_API_KEY is not set — documents can be processed, but questions cannot be answered.")
 
 MAX_FILE_SIZE_MB = 10
-MAX_FILE_SIZE_BYTES = MAX_FILE_SIZE_MB * 1024 * 1024
+# CSVs are streamed row by row, so they can be much larger
+MAX_CSV_FILE_SIZE_MB = 100
+# Uploads are spooled to a temp file beyond this size
+_SPOOL_MAX_BYTES = 4 * 1024 * 1024
+_UPLOAD_READ_BYTES = 1024 * 1024
+
+# /query/batch: questions per request (one embeddings call) and answers
+# generated concurrently
+MAX_BATCH_QUESTIONS = MAX_BATCH_INPUTS
+BATCH_GENERATION_CONCURRENCY = int(os.environ.get("DOCUQUERY_BATCH_CONCURRENCY", "8"))
+
+# How often the event loop is checked for stalls
+LOOP_LAG_INTERVAL = 0.05
+
+
+async def _watch_event_loop() -> None:
+    """Record how late the event loop wakes up: time blocking code held it."""
+    loop = asyncio.get_running_loop()
+    while True:
+        t0 = loop.time()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        metrics.observe("event_loop_lag", max(0.0, loop.time() - t0 - LOOP_LAG_INTERVAL))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Heavy dependencies load on first use; prewarming loads them in the
+    # background while the server already answers /health
+    if startup.PREWARM:
+        startup.prewarm()
+    watcher = asyncio.create_task(_watch_event_loop())
+    yield
+    watcher.cancel()
 
-app = FastAPI(title="DocuQuery AI", version="1.0.0")
+
+app = FastAPI(title="DocuQuery AI", version="1.0.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -48,6 +94,14 @@ app.add_middleware(
 
 class QueryRequest(BaseModel):
     question: str
+    session_id: str = Field(DEFAULT_SESSION, pattern=ID_PATTERN)
+    document_id: str | None = Field(None, pattern=ID_PATTERN)  # defaults to the session's latest upload
+
+
+class QueryBatchRequest(BaseModel):
+    questions: list[str] = Field(min_length=1, max_length=MAX_BATCH_QUESTIONS)
+    session_id: str = Field(DEFAULT_SESSION, pattern=ID_PATTERN)
+    document_id: str | None = Field(None, pattern=ID_PATTERN)
 
 
 class _UploadFileAdapter:
@@ -56,126 +110,269 @@ class _UploadFileAdapter:
     parse_file() expects an object with .name, .read(), and .seek() — like
     Streamlit's UploadedFile. FastAPI's UploadFile has .filename instead of
     .name, and async methods. This adapter provides a sync interface over
-    the already-read bytes.
+    our own copy of the upload, which outlives the request.
     """
 
-    def __init__(self, filename: str, content: bytes):
+    def __init__(self, filename: str, buffer):
         self.name = filename
-        self._buffer = io.BytesIO(content)
+        self._buffer = buffer
 
-    def read(self) -> bytes:
-        return self._buffer.read()
+    def read(self, size: int = -1) -> bytes:
+        return self._buffer.read(size)
 
     def seek(self, pos: int) -> None:
         self._buffer.seek(pos)
 
+    def close(self) -> None:
+        self._buffer.close()
+
 
 @app.get("/health")
 def health():
     has_key = bool(os.environ.get("OPENAI_API_KEY"))
-    return {"status": "ok" if has_key else "degraded", "version": "1.0", "openai_key_set": has_key}
+    return {
+        # Without a key, a local embedding backend still ingests documents
+        "status": "ok" if has_key or not get_backend().remote else "degraded",
+        "version": "1.0",
+        "openai_key_set": has_key,
+        "answers_available": has_key,
+        "embedding_backend": get_backend().name,
+        "embedding_cache": cache_stats(),
+        "query_coalescer": coalescer_stats(),
+        "warm": startup.status(),
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    """Per-stage latency histograms in the Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+def _previous_revision(session_id: str, document_id: str) -> Revision | None:
+    """The stored document an upload replaces, if its vectors can be reused."""
+    indexed_with = document_embedder(session_id, document_id)
+    if not has_document(session_id, document_id) or indexed_with not in (None, get_backend().name):
+        return None
+    fingerprint = document_fingerprint(session_id, document_id) or {}
+    found = document_rows(session_id, document_id)
+    if found is None:
+        return None
+    return Revision(pages=fingerprint.get("pages", []), chunks=found[0], vectors=found[1])
+
+
+def _ingest(job: jobs.Job, adapted: _UploadFileAdapter, content_hash: str) -> None:
+    """Stream one upload through parse → chunk → embed; runs on the ingest pool."""
+    timings = metrics.Timings()
+    t0 = time.perf_counter()
+    try:
+        result = ingest(adapted, job, timings, _previous_revision(job.session_id, job.document_id))
 
+        if result.file_type == "pdf" and result.text_chars < 100:
+            pass  # scanned PDF warning — frontend will handle
 
-@app.post("/upload")
-async def upload(file: UploadFile = File(...)):
-    if not os.environ.get("OPENAI_API_KEY"):
+        if not result.chunks:
+            job.update(status=jobs.FAILED, error="File appears to be empty or contains no extractable text.")
+            return
+
+        with timings.stage("index"):
+            fingerprint = {"content_hash": content_hash, "chunks": len(result.chunks), "pages": result.pages}
+            add_chunks(result.chunks, result.embeddings, session_id=job.session_id, doc_id=job.document_id,
+                       embedder=get_backend().name, fingerprint=fingerprint)
+        timings.record("ingest_total", time.perf_counter() - t0)
+
+        job.update(status=jobs.READY, chunks_embedded=len(result.chunks), chunks_reused=result.chunks_reused,
+                   timings=timings.to_dict())
+        logger.info("Ready: %s, %d chunks, %d reused", job.filename, len(result.chunks), result.chunks_reused)
+    except Exception as e:
+        logger.error("Upload failed: %s\n%s", str(e), traceback.format_exc())
+        job.update(status=jobs.FAILED, error=f"Processing error: {str(e)}")
+    finally:
+        adapted.close()
+
+
+@app.post("/upload", status_code=202)
+async def upload(file: UploadFile = File(...), session_id: str = Form(DEFAULT_SESSION, pattern=ID_PATTERN),
+                 document_id: str | None = Form(None, pattern=ID_PATTERN)):
+    """Start ingesting a file in the background and return its job id.
+
+    Poll GET /jobs/{job_id} until status is "ready" (or "failed"). Pass the
+    document_id of a stored document to upload a new revision of it; only
+    changed pages and chunks are processed again. A file identical to a
+    document of the session is not processed at all: the job is ready at
+    once and points at that document.
+    """
+    # Only OpenAI embeddings need the key here; answers are checked at query time
+    if get_backend().remote and not os.environ.get("OPENAI_API_KEY"):
         raise HTTPException(status_code=503, detail="Service unavailable: OPENAI_API_KEY not configured.")
 
-    # Read file with size limit to prevent memory exhaustion
-    content = await file.read()
-    if len(content) > MAX_FILE_SIZE_BYTES:
-        raise HTTPException(
-            status_code=413,
-            detail=f"File too large ({len(content) / 1024 / 1024:.1f} MB). Maximum allowed: {MAX_FILE_SIZE_MB} MB.",
-        )
+    ext = file_extension(file.filename)
+    if ext not in SUPPORTED_EXTENSIONS:
+        raise HTTPException(status_code=400, detail=f"Unsupported file format: .{ext or 'unknown'}")
+
+    # Copy the upload in blocks with a size limit to prevent memory exhaustion;
+    # large files spill to disk instead of being held in RAM
+    max_mb = MAX_CSV_FILE_SIZE_MB if ext == "csv" else MAX_FILE_SIZE_MB
+    buffer = tempfile.SpooledTemporaryFile(max_size=_SPOOL_MAX_BYTES)
+    digest = hashlib.sha256()
+    size = 0
+    while block := await file.read(_UPLOAD_READ_BYTES):
+        size += len(block)
+        if size > max_mb * 1024 * 1024:
+            buffer.close()
+            raise HTTPException(
+                status_code=413,
+                detail=f"File too large (over {max_mb} MB). Maximum allowed for .{ext} files: {max_mb} MB.",
+            )
+        # Hashing and spilling to disk run off the event loop
+        await run_in_threadpool(_spool, buffer, digest, block)
+    buffer.seek(0)
 
-    logger.info("Upload: %s (%.1f KB)", file.filename, len(content) / 1024)
+    logger.info("Upload: %s (%.1f KB)", file.filename, size / 1024)
 
-    try:
-        adapted = _UploadFileAdapter(file.filename, content)
+    # The duplicate lookup reads fingerprint files under the registry lock
+    job = await run_in_threadpool(_start_job, file.filename, ext, buffer, session_id, document_id,
+                                  digest.hexdigest())
+    return job.to_dict()
 
-        result = parse_file(adapted)
-        if result is None:
-            ext = file.filename.rsplit(".", 1)[-1].lower() if "." in file.filename else "unknown"
-            raise HTTPException(status_code=400, detail=f"Unsupported file format: .{ext}")
 
-        if result.file_type == "pdf" and len(result.text.strip()) < 100:
-            pass  # scanned PDF warning — frontend will handle
+def _spool(buffer, digest, block: bytes) -> None:
+    digest.update(block)
+    buffer.write(block)
 
-        clear()
 
-        if result.file_type == "csv":
-            chunks = result.chunks
-        else:
-            chunks = chunk_text(
-                result.text, result.filename,
-                file_type=result.file_type,
-                page_map=result.page_map,
-            )
+def _start_job(filename: str, ext: str, buffer, session_id: str, document_id: str | None,
+               content_hash: str) -> jobs.Job:
+    """Submit an upload for ingestion, or return a ready job if the session already has this file."""
+    existing = find_document(session_id, content_hash)
+    if existing is not None and document_id in (None, existing):
+        buffer.close()
+        n_chunks = document_fingerprint(session_id, existing).get("chunks")
+        job = jobs.Job(session_id=session_id, document_id=existing, filename=filename, file_type=ext,
+                       chunks_total=n_chunks, chunks_embedded=n_chunks or 0, chunks_reused=n_chunks or 0)
+        job.update(status=jobs.READY)
+        logger.info("Unchanged: %s is document %s", filename, existing)
+        return jobs.register(job)
 
-        if not chunks:
-            raise HTTPException(status_code=400, detail="File appears to be empty or contains no extractable text.")
+    job = jobs.Job(session_id=session_id, document_id=document_id or uuid.uuid4().hex, filename=filename)
+    jobs.submit(job, _ingest, _UploadFileAdapter(filename, buffer), content_hash)
+    return job
 
-        chunk_texts = [c["text"] for c in chunks]
-        embeddings = embed_texts(chunk_texts)
-        add_chunks(chunks, embeddings)
 
-        logger.info("Ready: %d chunks, %d embeddings", len(chunks), len(embeddings))
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job.to_dict()
 
-        return {
-            "filename": result.filename,
-            "file_type": result.file_type,
-            "num_chunks": len(chunks),
-            "status": "ready",
+
+def _resolve_document(session_id: str, document_id: str | None) -> str:
+    """Return the document a query targets, or raise the matching HTTP error."""
+    if not os.environ.get("OPENAI_API_KEY"):
+        raise HTTPException(status_code=503, detail="Service unavailable: OPENAI_API_KEY not configured.")
+
+    document_id = document_id or latest_document(session_id)
+    # A revision in progress does not block queries on the stored version
+    if document_id is None or not has_document(session_id, document_id):
+        if document_id is not None and jobs.pending_for(session_id, document_id):
+            raise HTTPException(status_code=409, detail="Document is still being processed.")
+        raise HTTPException(status_code=404, detail="Document not found. It may have expired — please upload it again.")
+    indexed_with = document_embedder(session_id, document_id)
+    if indexed_with is not None and indexed_with != get_backend().name:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Document was indexed with {indexed_with}, but queries use {get_backend().name}. "
+                   "Please upload it again.",
+        )
+    return document_id
+
+
+def _sources(results: dict) -> list[dict]:
+    return [
+        {
+            "chunk_index": meta.get("chunk_index"),
+            "page_start": meta.get("page_start"),
+            "page_end": meta.get("page_end"),
+            "row_start": meta.get("row_start"),
+            "row_end": meta.get("row_end"),
+            "distance": round(dist, 4),
+            "text_preview": doc[:150],
         }
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error("Upload failed: %s\n%s", str(e), traceback.format_exc())
-        raise HTTPException(status_code=500, detail=f"Processing error: {str(e)}")
+        for meta, dist, doc in zip(results["metadatas"][0], results["distances"][0], results["documents"][0])
+    ]
 
 
 @app.post("/query")
 def query_document(req: QueryRequest):
-    if not os.environ.get("OPENAI_API_KEY"):
-        raise HTTPException(status_code=503, detail="Service unavailable: OPENAI_API_KEY not configured.")
+    document_id = _resolve_document(req.session_id, req.document_id)
 
+    timings = metrics.Timings()
+    t0 = time.perf_counter()
     try:
-        q_embedding = embed_query(req.question)
-
-        t0 = time.time()
-        results = query(q_embedding)
-        answer = generate_answer(req.question, results)
-        latency = time.time() - t0
-
-        sources = []
-        for meta in results["metadatas"][0]:
-            source = {
-                "chunk_index": meta.get("chunk_index"),
-                "page_start": meta.get("page_start"),
-                "page_end": meta.get("page_end"),
-                "row_start": meta.get("row_start"),
-                "row_end": meta.get("row_end"),
-                "distance": None,
-                "text_preview": None,
-            }
-            sources.append(source)
-
-        for i, dist in enumerate(results["distances"][0]):
-            if i < len(sources):
-                sources[i]["distance"] = round(dist, 4)
-
-        for i, doc in enumerate(results["documents"][0]):
-            if i < len(sources):
-                sources[i]["text_preview"] = doc[:150]
+        with timings.stage("query_embed"):
+            q_embedding = embed_query(req.question)
+        with timings.stage("search"):
+            results = query(q_embedding, session_id=req.session_id, doc_id=document_id)
+        answer = generate_answer(req.question, results, timings)
+        latency = time.perf_counter() - t0
+        timings.record("query_total", latency)
 
         return {
             "answer": answer,
             "latency": round(latency, 1),
-            "sources": sources,
+            "timings": timings.to_dict(),
+            "sources": _sources(results),
         }
     except HTTPException:
         raise
     except Exception as e:
         logger.error("Query failed: %s\n%s", str(e), traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Query error: {str(e)}")
+
+
+@app.post("/query/batch")
+def query_batch_endpoint(req: QueryBatchRequest):
+    """Answer many questions about one document.
+
+    All questions are embedded in one request and searched with one
+    matrix product; answers are generated concurrently, at most
+    BATCH_GENERATION_CONCURRENCY at a time. A failed generation fails only
+    its own item, which carries an "error" instead of an "answer".
+    """
+    document_id = _resolve_document(req.session_id, req.document_id)
+
+    timings = metrics.Timings()
+    t0 = time.perf_counter()
+    try:
+        with timings.stage("batch_embed"):
+            q_embeddings = embed_queries(req.questions)
+        with timings.stage("batch_search"):
+            all_results = query_batch(q_embeddings, session_id=req.session_id, doc_id=document_id)
+    except Exception as e:
+        logger.error("Batch query failed: %s\n%s", str(e), traceback.format_exc())
+        raise HTTPException(status_code=500, detail=f"Query error: {str(e)}")
+
+    def answer(question: str, results: dict) -> dict:
+        item_timings = metrics.Timings()
+        item = {"question": question, "answer": None, "error": None, "sources": _sources(results)}
+        try:
+            item["answer"] = generate_answer(question, results, item_timings)
+        except Exception as e:
+            logger.error("Batch answer failed: %s", str(e))
+            item["error"] = f"Query error: {str(e)}"
+        item["timings"] = item_timings.to_dict()
+        return item
+
+    with timings.stage("batch_generate"):
+        workers = min(BATCH_GENERATION_CONCURRENCY, len(req.questions))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch-answer") as pool:
+            items = list(pool.map(answer, req.questions, all_results))
+    latency = time.perf_counter() - t0
+    timings.record("batch_total", latency)
+
+    return {
+        "results": items,
+        "latency": round(latency, 1),
+        "timings": timings.to_dict(),
+    }
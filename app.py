@@ -1,20 +1,68 @@
+import hashlib
+import io
 import time
+import uuid
 
+import numpy as np
 import streamlit as st
 from dotenv import load_dotenv
 
 from rag.parser import parse_file
 from rag.chunker import chunk_text
-from rag.embedder import embed_texts, embed_query
-from rag.store import add_chunks, query, clear
+from rag.embedder import embed_texts, embed_query, get_backend
+from rag.store import add_chunks, query, clear, list_documents
 from rag.generator import generate_answer
 
 load_dotenv()
 
+# Streamlit reruns this script on every interaction. Processed documents are
+# cached by file hash, shared by all sessions; answers are cached per session
+# by (document hash, question) and dropped when a new document is loaded.
+DOCUMENT_CACHE_ENTRIES = 8
+ANSWER_CACHE_ENTRIES = 100
+
+
+@st.cache_data(max_entries=DOCUMENT_CACHE_ENTRIES, show_spinner=False)
+def process_document(file_hash: str, filename: str, embedder: str, _data: bytes) -> dict | None:
+    """Parse, chunk and embed a file; None if its type is unsupported.
+
+    Cached on (file_hash, filename, embedder): the leading underscore keeps
+    Streamlit from hashing the file contents again.
+    """
+    uploaded = io.BytesIO(_data)
+    uploaded.name = filename
+    result = parse_file(uploaded)
+    if result is None:
+        return None
+
+    # Chunk (CSV provides pre-built chunks)
+    if result.file_type == "csv":
+        chunks = result.chunks
+    else:
+        chunks = chunk_text(result.text, result.filename,
+                            file_type=result.file_type,
+                            page_map=result.page_map)
+
+    # An array, not lists of floats: cached values are copied on every hit
+    embeddings = np.asarray(embed_texts([c["text"] for c in chunks]), dtype=np.float32)
+    return {
+        "filename": result.filename,
+        "file_type": result.file_type,
+        "text_chars": len(result.text.strip()),
+        "chunks": chunks,
+        "embeddings": embeddings,
+    }
+
+
 st.set_page_config(page_title="DocuQuery AI", page_icon="📄")
 st.title("DocuQuery AI")
 st.caption("Upload a document. Ask questions. Get answers with citations.")
 
+# Each browser session gets its own namespace in the shared vector store
+if "session_id" not in st.session_state:
+    st.session_state["session_id"] = uuid.uuid4().hex
+session_id = st.session_state["session_id"]
+
 # --- Sidebar: Upload ---
 with st.sidebar:
     st.header("Upload Document")
@@ -23,50 +71,42 @@ with st.sidebar:
     if uploaded_file is not None:
         if st.button("Process Document"):
             with st.spinner("Processing..."):
-                # Parse file (routes to correct parser)
-                result = parse_file(uploaded_file)
+                # Parse, chunk and embed, unless this file was processed before
+                data = uploaded_file.getvalue()
+                file_hash = hashlib.sha256(data).hexdigest()
+                doc = process_document(file_hash, uploaded_file.name, get_backend().name, data)
 
                 # Check for unsupported file type
-                if result is None:
+                if doc is None:
                     ext = uploaded_file.name.rsplit(".", 1)[-1].lower() if "." in uploaded_file.name else "unknown"
                     st.error(f"Unsupported file format: .{ext}. Please upload a .txt, .pdf, or .csv file.")
                     st.stop()
 
-                filename = result.filename
+                filename = doc["filename"]
+                chunks = doc["chunks"]
 
                 # Warn if PDF has very little text (likely scanned)
-                if result.file_type == "pdf" and len(result.text.strip()) < 100:
+                if doc["file_type"] == "pdf" and doc["text_chars"] < 100:
                     st.warning("This PDF contains very little extractable text. "
                                "It may be a scanned/image-based PDF.")
 
-                # Clear previous data
-                clear()
-
-                # Chunk (CSV provides pre-built chunks)
-                if result.file_type == "csv":
-                    chunks = result.chunks
-                else:
-                    chunks = chunk_text(result.text, result.filename,
-                                        file_type=result.file_type,
-                                        page_map=result.page_map)
-
                 # Check for empty file
                 if not chunks:
                     st.warning("This file appears to be empty or contains no extractable text. "
                                "Please upload a file with content.")
                     st.stop()
 
-                # Embed
-                chunk_texts = [c["text"] for c in chunks]
-                embeddings = embed_texts(chunk_texts)
-
-                # Store
-                add_chunks(chunks, embeddings)
+                # A new document replaces the stored one and invalidates cached answers
+                if st.session_state.get("doc_hash") != file_hash or not list_documents(session_id):
+                    clear(session_id)
+                    add_chunks(chunks, doc["embeddings"], session_id=session_id, embedder=get_backend().name)
+                    st.session_state["answers"] = {}
 
                 st.session_state["doc_loaded"] = True
+                st.session_state["doc_hash"] = file_hash
                 st.session_state["filename"] = filename
                 st.session_state["num_chunks"] = len(chunks)
-                st.session_state["file_type"] = result.file_type
+                st.session_state["file_type"] = doc["file_type"]
 
             st.success(f"Loaded **{filename}** ({len(chunks)} chunks)")
 
@@ -83,33 +123,42 @@ else:
     question = st.text_input("Ask a question about your document:")
 
     if question:
-        with st.spinner("Searching and generating answer..."):
-            t0 = time.time()
-
-            # Embed question
-            q_embedding = embed_query(question)
-
-            # Search
-            results = query(q_embedding)
-
-            # Generate
-            answer = generate_answer(question, results)
-
-            latency = time.time() - t0
+        # Reruns (e.g. opening the debug expander) reuse the cached answer
+        answers = st.session_state.setdefault("answers", {})
+        key = (st.session_state["doc_hash"], question)
+        cached = key in answers
+        if not cached:
+            with st.spinner("Searching and generating answer..."):
+                t0 = time.time()
+
+                # Embed question
+                q_embedding = embed_query(question)
+
+                # Search
+                results = query(q_embedding, session_id=session_id)
+
+                # Generate
+                answer = generate_answer(question, results)
+
+                latency = time.time() - t0
+
+            if len(answers) >= ANSWER_CACHE_ENTRIES:
+                del answers[next(iter(answers))]  # oldest first
+            answers[key] = {
+                "answer": answer,
+                "latency": latency,
+                "retrieved": [(doc, dict(meta), dist) for doc, meta, dist in zip(
+                    results["documents"][0], results["metadatas"][0], results["distances"][0])],
+            }
+        entry = answers[key]
 
         st.markdown("### Answer")
-        st.markdown(answer)
-        st.caption(f"Latency: {latency:.1f}s")
+        st.markdown(entry["answer"])
+        st.caption(f"Latency: {entry['latency']:.1f}s" + (" (cached)" if cached else ""))
 
         # Show retrieved chunks for transparency
         with st.expander("Retrieved chunks (debug)"):
-            for i, (doc, meta, dist) in enumerate(
-                zip(
-                    results["documents"][0],
-                    results["metadatas"][0],
-                    results["distances"][0],
-                )
-            ):
+            for i, (doc, meta, dist) in enumerate(entry["retrieved"]):
                 file_type = meta.get("file_type", "txt")
 
                 if file_type == "pdf":
@@ -0,0 +1,68 @@
+"""Benchmark the IVF-flat index against exact search: recall@15 and QPS.
+
+Uses a synthetic clustered corpus (real embeddings are far from uniform, and
+uniform random vectors are the worst case for any partition-based index).
+
+    python benchmarks/bench_ann.py --n 200000 --dim 1536 --nprobe 1 4 16 64
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from rag.ann import IVFIndex, top_k  # noqa: E402
+from rag.store import TOP_K, _normalize_rows  # noqa: E402
+
+
+def _clustered(rng: np.random.Generator, n: int, dim: int, n_topics: int) -> np.ndarray:
+    topics = rng.standard_normal((n_topics, dim), dtype=np.float32)
+    out = np.empty((n, dim), dtype=np.float32)
+    for i in range(0, n, 50_000):
+        m = min(50_000, n - i)
+        out[i:i + m] = topics[rng.integers(n_topics, size=m)]
+        out[i:i + m] += 0.8 * rng.standard_normal((m, dim), dtype=np.float32)
+    return _normalize_rows(out)
+
+
+def run(n: int, dim: int, n_queries: int, nprobes: list[int], nlist: int | None) -> None:
+    rng = np.random.default_rng(0)
+    matrix = _clustered(rng, n + n_queries, dim, n_topics=max(8, n // 500))
+    queries, matrix = matrix[:n_queries], matrix[n_queries:]
+
+    t0 = time.perf_counter()
+    exact = [top_k(matrix @ q, TOP_K) for q in queries]
+    exact_qps = n_queries / (time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    index = IVFIndex.train(matrix, nlist=nlist)
+    build_s = time.perf_counter() - t0
+
+    print(f"n={n} dim={dim} nlist={index.nlist} build={build_s:.1f}s")
+    print(f"{'search':>12} {'recall@15':>10} {'QPS':>9} {'speedup':>8}")
+    print(f"{'exact':>12} {1.0:>10.3f} {exact_qps:>9.0f} {'1.0x':>8}")
+    for nprobe in nprobes:
+        t0 = time.perf_counter()
+        found = [index.search(matrix, q, TOP_K, nprobe=nprobe)[0] for q in queries]
+        qps = n_queries / (time.perf_counter() - t0)
+        recall = np.mean([len(np.intersect1d(f, e)) / TOP_K for f, e in zip(found, exact)])
+        print(f"{'nprobe=' + str(nprobe):>12} {recall:>10.3f} {qps:>9.0f} {qps / exact_qps:>7.1f}x")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    args = parser.parse_args()
+    run(args.n, args.dim, args.queries, args.nprobe, args.nlist)
+
+
+if __name__ == "__main__":
+    main()
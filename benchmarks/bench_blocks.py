@@ -0,0 +1,137 @@
+"""Benchmark coarse-to-fine block search against exact search on one long document.
+
+The synthetic document is a run of sections. Each section has 2 to 40
+chunks about one topic, and there are about 1.3 chunks per page. Each
+question is a noisy copy of one chunk. Reports recall@15, QPS, rows scored
+per query (centroids included) and how often the bound made a search score
+blocks beyond its probes.
+
+First it checks that the store actually builds a block index from
+chunk_text output (and none for a CSV), since the recall table calls
+BlockIndex directly. Then it checks the bound on the same document with its
+rows shuffled, so no block is about one topic: the extra blocks must be
+scored and recall@15 must stay 1.0.
+
+    python benchmarks/bench_blocks.py --chunks 600 20000 --nprobe 2 4 8
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from rag import store  # noqa: E402
+from rag.ann import top_k  # noqa: E402
+from rag.blocks import BlockIndex  # noqa: E402
+from rag.chunker import chunk_text  # noqa: E402
+from rag.parser import parse_file  # noqa: E402
+from rag.store import TOP_K, _normalize_rows  # noqa: E402
+from synthetic import NamedBytes, synthetic_csv, synthetic_text  # noqa: E402
+
+
+def check_store(dim: int = 64) -> None:
+    """Exit 1 unless the store picks block search for text chunks and exact search for CSV rows."""
+    text, page_map = synthetic_text(60)
+    documents = {"text": chunk_text(text, "long.pdf", file_type="pdf", page_map=page_map),
+                 "csv": parse_file(NamedBytes("table.csv", synthetic_csv(2000))).chunks}
+    saved = store.INDEX_BACKEND, store.BLOCK_MIN_CHUNKS
+    store.INDEX_BACKEND, store.BLOCK_MIN_CHUNKS = "blocks", 10
+    try:
+        built = {}
+        for name, chunks in documents.items():
+            vectors = np.random.default_rng(0).standard_normal((len(chunks), dim), dtype=np.float32)
+            store.add_chunks(chunks, vectors, session_id="bench", doc_id=name)
+            built[name] = store._docs[("bench", name)].index
+        store.clear("bench")
+    finally:
+        store.INDEX_BACKEND, store.BLOCK_MIN_CHUNKS = saved
+    ok = isinstance(built["text"], BlockIndex) and built["csv"] is None
+    print(f"store: {len(documents['text'])} text chunks -> {type(built['text']).__name__}, "
+          f"{len(documents['csv'])} CSV chunks -> {type(built['csv']).__name__}"
+          + ("" if ok else "  FAILED: expected BlockIndex and NoneType"))
+    if not ok:
+        sys.exit(1)
+
+
+def check_bound(n: int = 2000, dim: int = 64, n_queries: int = 50) -> None:
+    """Exit 1 unless search stays exact on a document without section locality."""
+    rng = np.random.default_rng(0)
+    matrix, pages = _document(rng, n, dim)
+    matrix = matrix[rng.permutation(n)]
+    queries = _queries(rng, matrix, n_queries)
+    index = BlockIndex.build(matrix, pages, nprobe=2)
+    recall = np.mean([len(np.intersect1d(index.search(matrix, q, TOP_K)[0], top_k(matrix @ q, TOP_K))) / TOP_K
+                      for q in queries])
+    fallback = index.fallbacks / index.searches
+    ok = recall == 1.0 and fallback > 0
+    print(f"bound: {n} shuffled chunks, nprobe=2 -> recall@15 {recall:.3f}, extra blocks scored in "
+          f"{fallback:.0%} of searches" + ("" if ok else "  FAILED: expected recall 1.0 via the bound"))
+    if not ok:
+        sys.exit(1)
+
+
+def _queries(rng: np.random.Generator, matrix: np.ndarray, n_queries: int) -> np.ndarray:
+    """Noisy copies of random rows."""
+    picked = rng.integers(len(matrix), size=n_queries)
+    dim = matrix.shape[1]
+    return _normalize_rows(matrix[picked] + 1.2 * rng.standard_normal((n_queries, dim), dtype=np.float32)
+                           / np.sqrt(dim))
+
+
+def _document(rng: np.random.Generator, n: int, dim: int) -> tuple[np.ndarray, np.ndarray]:
+    """(unit rows, first page of each row) of a sectioned document."""
+    common = rng.standard_normal(dim, dtype=np.float32)  # what every chunk of a document shares
+    rows = np.empty((n, dim), dtype=np.float32)
+    i = 0
+    while i < n:
+        size = min(int(rng.integers(2, 41)), n - i)
+        topic = rng.standard_normal(dim, dtype=np.float32)
+        rows[i:i + size] = common + topic + 0.9 * rng.standard_normal((size, dim), dtype=np.float32)
+        i += size
+    pages = (np.arange(n) / 1.3).astype(np.int64) + 1
+    return _normalize_rows(rows), pages
+
+
+def run(sizes: list[int], dim: int, n_queries: int, nprobes: list[int]) -> None:
+    print(f"{'chunks':>7} {'search':>10} {'recall@15':>10} {'QPS':>9} {'speedup':>8} "
+          f"{'rows/query':>11} {'fallback':>9}")
+    for n in sizes:
+        rng = np.random.default_rng(n)
+        matrix, pages = _document(rng, n, dim)
+        queries = _queries(rng, matrix, n_queries)
+
+        t0 = time.perf_counter()
+        exact = [top_k(matrix @ q, TOP_K) for q in queries]
+        exact_qps = n_queries / (time.perf_counter() - t0)
+        print(f"{n:>7} {'exact':>10} {1.0:>10.3f} {exact_qps:>9.0f} {'1.0x':>8} {n:>11} {'-':>9}")
+
+        for nprobe in nprobes:
+            index = BlockIndex.build(matrix, pages, nprobe=nprobe)
+            t0 = time.perf_counter()
+            found = [index.search(matrix, q, TOP_K)[0] for q in queries]
+            qps = n_queries / (time.perf_counter() - t0)
+            recall = np.mean([len(np.intersect1d(f, e)) / TOP_K for f, e in zip(found, exact)])
+            fallback = index.fallbacks / index.searches
+            rows = index.nblocks + index.rows_scored / index.searches
+            print(f"{'':>7} {'nprobe=' + str(nprobe):>10} {recall:>10.3f} {qps:>9.0f} "
+                  f"{qps / exact_qps:>7.1f}x {rows:>11.0f} {fallback:>9.1%}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, nargs="+", default=[600, 5000, 20000])
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[2, 4, 8])
+    args = parser.parse_args()
+    check_store()
+    check_bound()
+    run(args.chunks, args.dim, args.queries, args.nprobe)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Scaling benchmark for chunk_text: time per token should stay flat.
+
+Compares the current chunker with the previous boundary-offset approach
+(decoding the growing prefix tokens[:b] for every boundary), which is
+quadratic. Synthetic PDF-like text of ~600 tokens per page, with a page_map.
+
+    python benchmarks/bench_chunker.py --pages 10 100 1000 3000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from rag import chunker  # noqa: E402
+from synthetic import synthetic_text  # noqa: E402
+
+
+def _legacy_boundary_offsets(tokens: list[int]) -> dict[int, int]:
+    """The old per-boundary prefix decode (linear number of O(n) decodes)."""
+    boundaries, pos = {0, len(tokens)}, 0
+    while pos < len(tokens):
+        end = min(pos + chunker.CHUNK_SIZE, len(tokens))
+        boundaries.update((pos, end))
+        if end >= len(tokens):
+            break
+        pos = end - chunker.CHUNK_OVERLAP
+    return {b: len(chunker.get_tokenizer().decode(tokens[:b])) for b in sorted(boundaries)}
+
+
+def run(page_counts: list[int], legacy_max_pages: int) -> None:
+    print(f"{'pages':>6} {'tokens':>9} {'chunk_text s':>13} {'us/token':>9} {'legacy offsets s':>17}")
+    for n_pages in page_counts:
+        text, page_map = synthetic_text(n_pages)
+        t0 = time.perf_counter()
+        chunker.chunk_text(text, "bench.pdf", file_type="pdf", page_map=page_map)
+        seconds = time.perf_counter() - t0
+        tokens = chunker.get_tokenizer().encode(text)
+
+        legacy = "skipped"
+        if n_pages <= legacy_max_pages:
+            t0 = time.perf_counter()
+            _legacy_boundary_offsets(tokens)
+            legacy = f"{time.perf_counter() - t0:.2f}"
+        print(f"{n_pages:>6} {len(tokens):>9} {seconds:>13.3f} {1e6 * seconds / len(tokens):>9.2f} {legacy:>17}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 100, 1000, 3000])
+    parser.add_argument("--legacy-max-pages", type=int, default=1000)
+    args = parser.parse_args()
+    run(args.pages, args.legacy_max_pages)
+
+
+if __name__ == "__main__":
+    main()
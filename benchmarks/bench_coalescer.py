@@ -0,0 +1,70 @@
+"""Query embedding coalescing under concurrent load.
+
+N threads each embed distinct questions through embed_query against the
+offline fake endpoint with --latency seconds per request, once with every
+question sent alone (batch size 1) and once per --batch-size/--wait-ms
+setting. Prints embeddings requests, batch fill, queries/s and latency.
+
+    python benchmarks/bench_coalescer.py --threads 64 --queries 2000 --latency 0.15
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from rag import embedder  # noqa: E402
+from rag.coalescer import Coalescer  # noqa: E402
+from bench_embedder import _SlowEmbeddings  # noqa: E402
+from fakes import FakeOpenAI, fake_openai  # noqa: E402
+
+
+def _run(threads: int, n_queries: int, latency: float, batch_size: int, wait_ms: float) -> tuple[dict, int, float, np.ndarray]:
+    embedder.QUERY_BATCH_SIZE = batch_size
+    embedder._query_coalescer = Coalescer(embedder._embed_query_batch, batch_size, wait_ms / 1000,
+                                          max_in_flight=embedder.MAX_CONCURRENCY)
+    calls = FakeOpenAI(1536).embeddings
+
+    def one(i: int) -> float:
+        t0 = time.perf_counter()
+        embedder.embed_query(f"question {i} about clause {i % 97}?")
+        return time.perf_counter() - t0
+
+    with fake_openai(1536) as client:
+        client.embeddings = _SlowEmbeddings(calls, latency)
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            latencies = np.array(list(pool.map(one, range(n_queries))))
+        seconds = time.perf_counter() - t0
+    return embedder._query_coalescer.stats(), calls.calls, n_queries / seconds, latencies * 1000
+
+
+def run(threads: int, n_queries: int, latency: float, batch_sizes: list[int], wait_ms: float) -> None:
+    print(f"{threads} threads, {n_queries} questions, {latency * 1000:.0f} ms per embeddings request")
+    print(f"{'batch':>6} {'wait ms':>8} {'requests':>9} {'mean fill':>10} {'queries/s':>10} "
+          f"{'p50 ms':>8} {'p99 ms':>8}")
+    for size in [1] + batch_sizes:
+        stats, requests, qps, ms = _run(threads, n_queries, latency, size, wait_ms if size > 1 else 0)
+        fill = f"{stats['mean_fill']:.2f}" if size > 1 else "-"
+        print(f"{size:>6} {wait_ms if size > 1 else 0:>8g} {requests:>9} {fill:>10} {qps:>10.0f} "
+              f"{np.percentile(ms, 50):>8.1f} {np.percentile(ms, 99):>8.1f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=64)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.15)
+    parser.add_argument("--batch-size", type=int, nargs="+", default=[8, 32])
+    parser.add_argument("--wait-ms", type=float, default=5)
+    args = parser.parse_args()
+    run(args.threads, args.queries, args.latency, args.batch_size, args.wait_ms)
+
+
+if __name__ == "__main__":
+    main()
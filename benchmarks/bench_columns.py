@@ -0,0 +1,83 @@
+"""Memory of chunk metadata: list of dicts vs the columnar ChunkTable.
+
+Builds N PDF-like chunks (10 keys each), measures both layouts with
+tracemalloc and reports bytes per chunk, the saving per million chunks, and
+the cost of building 15 query hits from each layout.
+
+    python benchmarks/bench_columns.py --chunks 200000 --text-chars 2000
+"""
+
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import numpy as np  # noqa: E402
+
+from rag.columns import ChunkTable  # noqa: E402
+
+
+def _chunks(n: int, text_chars: int) -> list[dict]:
+    base = ("The supplier shall deliver the goods described in the schedule within thirty days. " * 40)
+    return [{
+        "text": f"{i} {base[i % 80:i % 80 + text_chars]}",
+        "source": "contract.pdf",
+        "chunk_index": i,
+        "char_start": i * 1600,
+        "char_end": i * 1600 + text_chars,
+        "file_type": "pdf",
+        "page_start": i // 3 + 1,
+        "page_end": i // 3 + 2,
+        "row_start": None,
+        "row_end": None,
+    } for i in range(n)]
+
+
+def _traced(build):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    obj = build()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return obj, size
+
+
+def run(n: int, text_chars: int) -> None:
+    chunks, dict_bytes = _traced(lambda: _chunks(n, text_chars))
+    table, table_bytes = _traced(lambda: ChunkTable.from_chunks(chunks))
+    text_bytes = sum(len(c["text"]) for c in chunks)
+
+    hits = np.random.default_rng(0).choice(n, size=15, replace=False)
+    t0 = time.perf_counter()
+    for _ in range(1000):
+        [{k: v for k, v in chunks[i].items() if k != "text"} for i in hits]
+    dict_us = (time.perf_counter() - t0) * 1000
+    t0 = time.perf_counter()
+    for _ in range(1000):
+        [table.metadata(i) for i in hits]
+    view_us = (time.perf_counter() - t0) * 1000
+
+    print(f"{n} chunks, {text_chars} chars of text each ({text_bytes / 2**20:.0f} MB of text)")
+    print(f"{'layout':<14} {'MB':>8} {'bytes/chunk':>12} {'overhead/chunk':>15} {'15 hits, us':>12}")
+    for name, size, us in (("list of dicts", dict_bytes, dict_us), ("ChunkTable", table_bytes, view_us)):
+        print(f"{name:<14} {size / 2**20:>8.1f} {size / n:>12.0f} {(size - text_bytes) / n:>15.0f} {us:>12.1f}")
+    saved = (dict_bytes - table_bytes) / n * 1_000_000
+    print(f"saved per million chunks: {saved / 2**30:.2f} GB "
+          f"(a 1536-dim float32 matrix is {1536 * 4 * 1_000_000 / 2**30:.2f} GB)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=200_000)
+    parser.add_argument("--text-chars", type=int, default=2000)
+    args = parser.parse_args()
+    run(args.chunks, args.text_chars)
+
+
+if __name__ == "__main__":
+    main()
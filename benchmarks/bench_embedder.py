@@ -0,0 +1,78 @@
+"""Throughput of the local hashed n-gram embedder vs the OpenAI backend.
+
+Embeds the chunks of a synthetic PDF-like document (~500 tokens each)
+through embed_texts with each backend and prints chunks/s. The remote
+backend calls the real API when OPENAI_API_KEY is set (--remote-chunks
+caps the spend); otherwise it uses the offline fake with --remote-latency
+seconds per request, which is what dominates in production.
+
+    python benchmarks/bench_embedder.py --pages 100
+    python benchmarks/bench_embedder.py --pages 100 --remote-latency 0.4
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from rag import embedder  # noqa: E402
+from rag.chunker import chunk_text  # noqa: E402
+from rag.embed_cache import EmbeddingCache  # noqa: E402
+from fakes import FakeOpenAI, fake_openai  # noqa: E402
+from synthetic import synthetic_text  # noqa: E402
+
+
+class _SlowEmbeddings:
+    """The fake embeddings endpoint plus a fixed round-trip delay."""
+
+    def __init__(self, inner, latency: float):
+        self.inner, self.latency = inner, latency
+
+    def create(self, **kwargs):
+        time.sleep(self.latency)
+        return self.inner.create(**kwargs)
+
+
+def _time_backend(name: str, texts: list[str]) -> float:
+    embedder.EMBED_BACKEND = name
+    embedder._cache = EmbeddingCache(path=None)  # cold cache, every run
+    t0 = time.perf_counter()
+    embedder.embed_texts(texts)
+    return time.perf_counter() - t0
+
+
+def run(n_pages: int, remote_chunks: int, remote_latency: float) -> None:
+    text, page_map = synthetic_text(n_pages)
+    texts = [c["text"] for c in chunk_text(text, "bench.pdf", file_type="pdf", page_map=page_map)]
+    remote_texts = texts[:remote_chunks]
+    mb = sum(len(t.encode("utf-8")) for t in texts) / 2**20
+    print(f"{len(texts)} chunks, {mb:.1f} MB of text")
+    print(f"{'backend':<34} {'chunks':>7} {'seconds':>8} {'chunks/s':>10}")
+
+    seconds = _time_backend("local", texts)
+    print(f"{embedder.BACKENDS['local'].name:<34} {len(texts):>7} {seconds:>8.2f} {len(texts) / seconds:>10.0f}")
+
+    if os.environ.get("OPENAI_API_KEY"):
+        label = embedder.BACKENDS["openai"].name
+        seconds = _time_backend("openai", remote_texts)
+    else:
+        label = f"openai (fake, {remote_latency * 1000:.0f} ms/request)"
+        with fake_openai(1536) as client:
+            client.embeddings = _SlowEmbeddings(FakeOpenAI(1536).embeddings, remote_latency)
+            seconds = _time_backend("openai", remote_texts)
+    print(f"{label:<34} {len(remote_texts):>7} {seconds:>8.2f} {len(remote_texts) / seconds:>10.0f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--remote-chunks", type=int, default=2000, help="cap on chunks sent to the remote backend")
+    parser.add_argument("--remote-latency", type=float, default=0.3)
+    args = parser.parse_args()
+    run(args.pages, args.remote_chunks, args.remote_latency)
+
+
+if __name__ == "__main__":
+    main()
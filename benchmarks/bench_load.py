@@ -0,0 +1,303 @@
+"""Load test: api.py under concurrent uploads and queries, against a mock OpenAI.
+
+Starts benchmarks/mock_openai.py and `uvicorn api:app` as subprocesses. The
+API gets a fresh temp store and a memory-only embedding cache. The harness
+uploads --documents seed documents, then runs each --concurrency level for
+--duration seconds. At each level, that many virtual users loop. With
+probability --upload-share a user uploads a new text document (POST
+/upload, then GET /jobs/{id} until it is ready); otherwise it asks a new
+question about a seed document (POST /query).
+
+Per level it reports throughput, then error rate and latency percentiles
+for each operation: query, upload (the 202) and ingest (upload to ready).
+It also reports the 429s the mock served and the API's event-loop stall
+time, read from the event_loop_lag histogram of GET /metrics. The capacity
+is the highest level whose query p99 stays within --slo-ms and whose error
+rate stays under --max-error-rate. --json saves the numbers for comparison
+between deploys. Needs httpx besides the API's requirements:
+
+    pip install -r requirements-bench.txt
+    python benchmarks/bench_load.py --concurrency 1 4 16 64 --duration 20 --error-rate 0.02
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(BENCH_DIR, "..")
+
+SESSION = "loadtest"
+QUESTIONS = ["What is the payment deadline?", "Who are the parties?", "Summarize the termination clause.",
+             "What penalty applies to late delivery?", "When does the agreement renew?"]
+_WORDS = ("contract payment invoice liability termination clause party notice agreement schedule "
+          "delivery warranty service period renewal fee supplier goods penalty days value").split()
+_LAG_METRIC = "docuquery_stage_seconds"
+POLL_SECONDS = 0.1
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _document(rng: random.Random, kb: int) -> bytes:
+    """Random prose, so no two uploads share chunks (or cached embeddings)."""
+    words = [rng.choice(_WORDS) for _ in range(kb * 1024 // 8)]
+    lines = [" ".join(words[i:i + 14]).capitalize() + "." for i in range(0, len(words), 14)]
+    return "\n".join(lines).encode("utf-8")
+
+
+def _log_tail(log, chars: int = 2000) -> str:
+    log.flush()
+    with open(log.name, encoding="utf-8", errors="replace") as f:
+        return f.read()[-chars:]
+
+
+def _start(cmd: list[str], env: dict, log, ready_url: str, timeout: float = 60) -> subprocess.Popen:
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{' '.join(cmd[1:3])} exited with {proc.returncode}:\n{_log_tail(log)}")
+        try:
+            if httpx.get(ready_url, timeout=1).status_code == 200:
+                return proc
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f"{ready_url} not ready after {timeout:.0f}s:\n{_log_tail(log)}")
+
+
+def _event_loop_lag(metrics_text: str) -> dict:
+    """The event_loop_lag histogram: cumulative bucket counts by bound, sum and count."""
+    buckets, total, count = {}, 0.0, 0
+    for line in metrics_text.splitlines():
+        if 'stage="event_loop_lag"' not in line:
+            continue
+        value = float(line.rsplit(" ", 1)[1])
+        if line.startswith(f"{_LAG_METRIC}_bucket"):
+            bound = re.search(r'le="([^"]+)"', line).group(1)
+            buckets[float(bound)] = value
+        elif line.startswith(f"{_LAG_METRIC}_sum"):
+            total = value
+        elif line.startswith(f"{_LAG_METRIC}_count"):
+            count = int(value)
+    return {"buckets": buckets, "sum": total, "count": count}
+
+
+def _stall(before: dict, after: dict, seconds: float) -> dict:
+    """Stall time between two histogram reads, and the bucket bound of the longest stall."""
+    checks = after["count"] - before["count"]
+    longest = 0.0
+    for bound, cumulative in sorted(after["buckets"].items()):
+        if cumulative - before["buckets"].get(bound, 0) >= checks:
+            longest = bound
+            break
+    stalled = after["sum"] - before["sum"]
+    return {"stall_ms": 1000 * stalled, "stall_share": stalled / seconds, "longest_ms_le": 1000 * longest}
+
+
+class _Load:
+    """One concurrency level: virtual users and what they recorded."""
+
+    def __init__(self, client: httpx.AsyncClient, documents: list[str], upload_share: float, upload_kb: int,
+                 seed: int):
+        self.client = client
+        self.documents = documents
+        self.upload_share = upload_share
+        self.upload_kb = upload_kb
+        self.rng = random.Random(seed)
+        self.records: list[tuple[str, float, bool]] = []  # (operation, seconds, ok)
+
+    async def query(self) -> None:
+        question = f"{self.rng.choice(QUESTIONS)} (ref {self.rng.randrange(10**9)})"
+        body = {"question": question, "session_id": SESSION, "document_id": self.rng.choice(self.documents)}
+        t0 = time.perf_counter()
+        try:
+            ok = (await self.client.post("/query", json=body)).status_code == 200
+        except httpx.HTTPError:
+            ok = False
+        self.records.append(("query", time.perf_counter() - t0, ok))
+
+    async def upload(self) -> str | None:
+        """Upload a new document and wait until it is ready; returns its id, or None on failure."""
+        data = _document(self.rng, self.upload_kb)
+        t0 = time.perf_counter()
+        try:
+            response = await self.client.post("/upload", data={"session_id": SESSION},
+                                              files={"file": ("load.txt", data, "text/plain")})
+            ok = response.status_code == 202
+        except httpx.HTTPError:
+            ok = False
+        self.records.append(("upload", time.perf_counter() - t0, ok))
+        if not ok:
+            self.records.append(("ingest", time.perf_counter() - t0, False))
+            return None
+        job = response.json()
+        try:
+            while job["status"] not in ("ready", "failed"):
+                await asyncio.sleep(POLL_SECONDS)
+                job = (await self.client.get(f"/jobs/{job['job_id']}")).json()
+            ok = job["status"] == "ready"
+        except httpx.HTTPError:
+            ok = False
+        self.records.append(("ingest", time.perf_counter() - t0, ok))
+        return job["document_id"] if ok else None
+
+    async def user(self, deadline: float) -> None:
+        while time.perf_counter() < deadline:
+            if self.rng.random() < self.upload_share:
+                await self.upload()
+            else:
+                await self.query()
+
+
+def _summary(records: list[tuple[str, float, bool]], seconds: float) -> dict:
+    ops = {}
+    for op in ("query", "upload", "ingest"):
+        times = np.array([t for name, t, _ in records if name == op])
+        oks = [ok for name, _, ok in records if name == op]
+        if not oks:
+            continue
+        ops[op] = {"count": len(oks), "error_rate": 1 - sum(oks) / len(oks), "per_second": len(oks) / seconds,
+                   **{f"p{q}_ms": float(1000 * np.percentile(times, q)) for q in (50, 90, 99)}}
+    return ops
+
+
+async def _level(base_url: str, mock_url: str, documents: list[str], users: int, duration: float,
+                 args: argparse.Namespace) -> dict:
+    limits = httpx.Limits(max_connections=users + 8, max_keepalive_connections=users + 8)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        mock_before = (await client.get(f"{mock_url}/_stats")).json()
+        lag_before = _event_loop_lag((await client.get("/metrics")).text)
+        load = _Load(client, documents, args.upload_share, args.upload_kb, seed=users)
+        t0 = time.perf_counter()
+        await asyncio.gather(*(load.user(t0 + duration) for _ in range(users)))
+        seconds = time.perf_counter() - t0
+        lag_after = _event_loop_lag((await client.get("/metrics")).text)
+        mock_after = (await client.get(f"{mock_url}/_stats")).json()
+
+    def delta(key: str) -> int:
+        return sum(mock_after[key].values()) - sum(mock_before[key].values())
+
+    return {"users": users, "seconds": seconds, "ops": _summary(load.records, seconds),
+            "openai_requests": delta("requests"), "openai_429s": delta("rate_limited"),
+            **_stall(lag_before, lag_after, seconds)}
+
+
+def _print_level(level: dict) -> None:
+    for op, s in level["ops"].items():
+        print(f"{level['users']:>6} {op:>7} {s['count']:>6} {s['error_rate']:>6.1%} {s['per_second']:>7.2f} "
+              f"{s['p50_ms']:>8.0f} {s['p90_ms']:>8.0f} {s['p99_ms']:>8.0f}")
+    print(f"{'':>6} OpenAI: {level['openai_requests']} requests, {level['openai_429s']} answered 429; "
+          f"event loop stalled {level['stall_ms']:.0f} ms ({level['stall_share']:.1%}), "
+          f"longest <= {level['longest_ms_le']:g} ms")
+
+
+def _capacity(levels: list[dict], slo_ms: float, max_error_rate: float) -> dict | None:
+    """The highest level that met the SLO, if any."""
+    best = None
+    for level in levels:
+        queries = level["ops"].get("query")
+        errors = sum(s["error_rate"] * s["count"] for s in level["ops"].values())
+        total = sum(s["count"] for s in level["ops"].values())
+        if queries and queries["p99_ms"] <= slo_ms and errors / total <= max_error_rate:
+            best = level
+    return best
+
+
+async def _seed(base_url: str, n: int, upload_kb: int, timeout: float) -> list[str]:
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout) as client:
+        load = _Load(client, [], 0, upload_kb, seed=0)
+        documents = await asyncio.gather(*(load.upload() for _ in range(n)))
+    if None in documents:
+        raise RuntimeError("seed upload failed")
+    return documents
+
+
+def run(args: argparse.Namespace) -> list[dict]:
+    mock_port, api_port = _free_port(), _free_port()
+    mock_url, base_url = f"http://127.0.0.1:{mock_port}", f"http://127.0.0.1:{api_port}"
+    with tempfile.TemporaryDirectory() as store_dir:
+        env = dict(os.environ, OPENAI_BASE_URL=f"{mock_url}/v1", OPENAI_API_KEY="sk-load-test",
+                   DOCUQUERY_STORE_DIR=store_dir)
+        env.pop("DOCUQUERY_EMBED_CACHE_PATH", None)
+        mock_log = open(os.path.join(store_dir, "mock.log"), "w")
+        api_log = open(os.path.join(store_dir, "api.log"), "w")
+        procs = []
+        try:
+            procs.append(_start([sys.executable, os.path.join(BENCH_DIR, "mock_openai.py"), "--port", str(mock_port),
+                                 "--embed-latency", str(args.embed_latency), "--chat-latency", str(args.chat_latency),
+                                 "--token-ms", str(args.token_ms), "--error-rate", str(args.error_rate)],
+                                env, mock_log, f"{mock_url}/_stats"))
+            procs.append(_start([sys.executable, "-m", "uvicorn", "api:app", "--port", str(api_port),
+                                 "--log-level", "warning"], env, api_log, f"{base_url}/health"))
+
+            try:
+                documents = asyncio.run(_seed(base_url, args.documents, args.upload_kb, args.timeout))
+            except RuntimeError as e:
+                raise RuntimeError(f"{e}\n{_log_tail(api_log)}") from None
+            print(f"mock OpenAI: {args.embed_latency * 1000:.0f} ms embeddings, {args.chat_latency * 1000:.0f} ms "
+                  f"to first token, {args.error_rate:.0%} answered 429; {os.cpu_count()} CPUs")
+            print(f"{'users':>6} {'op':>7} {'count':>6} {'err%':>6} {'per s':>7} "
+                  f"{'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8}")
+            levels = []
+            for users in args.concurrency:
+                level = asyncio.run(_level(base_url, mock_url, documents, users, args.duration, args))
+                _print_level(level)
+                levels.append(level)
+        finally:
+            for proc in reversed(procs):
+                proc.terminate()
+                proc.wait()
+            mock_log.close()
+            api_log.close()
+
+    best = _capacity(levels, args.slo_ms, args.max_error_rate)
+    if best is None:
+        print(f"\ncapacity: no level kept query p99 <= {args.slo_ms:.0f} ms with errors <= {args.max_error_rate:.0%}")
+    else:
+        queries = best["ops"]["query"]
+        print(f"\ncapacity: {best['users']} concurrent users, {queries['per_second']:.1f} queries/s "
+              f"(p99 {queries['p99_ms']:.0f} ms <= {args.slo_ms:.0f} ms)")
+    return levels
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--duration", type=float, default=20, help="seconds per concurrency level")
+    parser.add_argument("--upload-share", type=float, default=0.1, help="fraction of operations that are uploads")
+    parser.add_argument("--upload-kb", type=int, default=40)
+    parser.add_argument("--documents", type=int, default=4, help="seed documents that queries target")
+    parser.add_argument("--embed-latency", type=float, default=0.1)
+    parser.add_argument("--chat-latency", type=float, default=0.5)
+    parser.add_argument("--token-ms", type=float, default=10)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of OpenAI requests answered 429")
+    parser.add_argument("--timeout", type=float, default=120, help="client timeout per request")
+    parser.add_argument("--slo-ms", type=float, default=3000, help="query p99 the capacity must stay within")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+    levels = run(args)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "levels": levels}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
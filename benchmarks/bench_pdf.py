@@ -0,0 +1,56 @@
+"""Benchmark serial vs multi-process PDF text extraction.
+
+Runs on tests/test_sample.pdf and on a synthetic text-only PDF (300 pages by
+default), checks that the parallel output is byte-identical to the serial
+path, and prints wall time per worker count.
+
+    python benchmarks/bench_pdf.py --pages 300 --workers 1 2 4
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from rag import parser  # noqa: E402
+from synthetic import NamedBytes, synthetic_pdf  # noqa: E402
+
+SAMPLE_PDF = os.path.join(os.path.dirname(__file__), "..", "tests", "test_sample.pdf")
+
+
+def _extract(data: bytes, workers: int) -> tuple[list[str], float]:
+    t0 = time.perf_counter()
+    pages = [text for _, text in parser.iter_pdf_pages(NamedBytes("bench.pdf", data), workers=workers)]
+    return pages, time.perf_counter() - t0
+
+
+def run(name: str, data: bytes, worker_counts: list[int]) -> None:
+    serial, serial_s = _extract(data, 1)
+    print(f"{name}: {len(serial)} pages")
+    print(f"  {'workers':>7} {'seconds':>8} {'speedup':>8} {'identical':>9}")
+    print(f"  {1:>7} {serial_s:>8.2f} {'1.0x':>8} {'-':>9}")
+    for workers in worker_counts:
+        if workers == 1:
+            continue
+        pages, seconds = _extract(data, workers)
+        print(f"  {workers:>7} {seconds:>8.2f} {serial_s / seconds:>7.1f}x {str(pages == serial):>9}")
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--pages", type=int, default=300)
+    arg_parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = arg_parser.parse_args()
+
+    # Start the pool before timing so spawn cost is not billed to the first run
+    parser._get_pdf_pool(max(args.workers)).submit(int).result()
+
+    with open(SAMPLE_PDF, "rb") as f:
+        run("tests/test_sample.pdf", f.read(), args.workers)
+    run("synthetic", synthetic_pdf(args.pages), args.workers)
+
+
+if __name__ == "__main__":
+    main()
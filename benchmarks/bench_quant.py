@@ -0,0 +1,64 @@
+"""Quantized search matrices: recall@15, QPS and memory vs exact float32.
+
+Same synthetic clustered corpus as bench_ann.py. Each compressed matrix is
+searched alone and with the best k * --rescore candidates rescored at full
+precision (the store reads those rows from the memory-mapped embeddings.npy;
+here they come from RAM).
+
+    python benchmarks/bench_quant.py --n 100000 --dim 1536 --rescore 4
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from rag import store  # noqa: E402
+from rag.ann import top_k  # noqa: E402
+from rag.quant import KINDS, QuantizedMatrix  # noqa: E402
+from bench_ann import _clustered  # noqa: E402
+
+
+def _run_searches(search, full, queries, rescore: int) -> tuple[list[np.ndarray], float]:
+    store.RESCORE_CANDIDATES = rescore
+    t0 = time.perf_counter()
+    found = [store._search(search, full if rescore else None, None, q, store.TOP_K)[0] for q in queries]
+    return found, len(queries) / (time.perf_counter() - t0)
+
+
+def run(n: int, dim: int, n_queries: int, rescore: int) -> None:
+    rng = np.random.default_rng(0)
+    matrix = _clustered(rng, n + n_queries, dim, n_topics=max(8, n // 500))
+    queries, matrix = matrix[:n_queries], matrix[n_queries:]
+    exact = [top_k(matrix @ q, store.TOP_K) for q in queries]
+
+    print(f"n={n} dim={dim} queries={n_queries}")
+    print(f"{'matrix':<10} {'rescore':>8} {'MB':>8} {'bytes/chunk':>12} {'recall@15':>10} {'QPS':>8}")
+    _, qps = _run_searches(matrix, None, queries, 0)
+    print(f"{'float32':<10} {'-':>8} {matrix.nbytes / 2**20:>8.0f} {matrix.nbytes / n:>12.0f} {1.0:>10.3f} {qps:>8.0f}")
+    for kind in KINDS:
+        compressed = QuantizedMatrix.quantize(matrix, kind)
+        for factor in (0, rescore):
+            found, qps = _run_searches(compressed, matrix, queries, factor)
+            recall = np.mean([len(np.intersect1d(f, e)) / store.TOP_K for f, e in zip(found, exact)])
+            label = f"{factor}x" if factor else "off"
+            print(f"{kind:<10} {label:>8} {compressed.nbytes / 2**20:>8.0f} {compressed.nbytes / n:>12.0f} "
+                  f"{recall:>10.3f} {qps:>8.0f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--rescore", type=int, default=4, help="candidates per result to rescore")
+    args = parser.parse_args()
+    run(args.n, args.dim, args.queries, args.rescore)
+
+
+if __name__ == "__main__":
+    main()
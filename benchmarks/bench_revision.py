@@ -0,0 +1,151 @@
+"""Re-uploading a revised PDF: full re-ingest vs incremental re-ingest.
+
+Ingests a synthetic --pages PDF, then a revision with one page edited, once
+from scratch and once against the stored version (pipeline.Revision).
+Embeddings come from the offline fake with --latency seconds per request
+and a cold cache each run, so "requests" is what the revision costs. PDF
+text extraction still reads every page, to hash it.
+
+With --verify N, instead checks that an incremental re-ingest equals a
+fresh one on N random revisions: a page edited, inserted or deleted, pages
+appended, the document truncated, or nothing changed. It compares chunks,
+page fingerprints and vectors, and exits 1 on any mismatch. Pages are
+served straight from strings, bypassing PDF extraction, so hundreds of
+cases take seconds.
+
+    python benchmarks/bench_revision.py --pages 200 --latency 0.3
+    python benchmarks/bench_revision.py --verify 200
+"""
+
+import argparse
+from contextlib import contextmanager
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from rag import embedder, pipeline  # noqa: E402
+from rag.columns import ChunkTable  # noqa: E402
+from rag.embed_cache import EmbeddingCache  # noqa: E402
+from rag.store import _normalize_rows  # noqa: E402
+from bench_embedder import _SlowEmbeddings  # noqa: E402
+from fakes import FakeOpenAI, fake_openai  # noqa: E402
+from synthetic import NamedBytes, synthetic_pdf  # noqa: E402
+
+
+def _ingest(data: bytes, previous=None) -> tuple[pipeline.IngestResult, float]:
+    embedder._cache = EmbeddingCache(path=None)
+    t0 = time.perf_counter()
+    result = pipeline.ingest(NamedBytes("contract.pdf", data), previous=previous)
+    return result, time.perf_counter() - t0
+
+
+_WORDS = ("alpha beta gamma delta contract clause supplier shall deliver goods "
+          "within thirty days payment invoice").split()
+
+
+class _Pages:
+    """An upload whose pages are given as strings."""
+
+    name = "contract.pdf"
+
+    def __init__(self, pages: list[str]):
+        self.pages = pages
+
+
+@contextmanager
+def _pages_from_strings():
+    saved = pipeline.iter_pdf_pages
+    pipeline.iter_pdf_pages = lambda upload, on_page=None: ((i + 1, t) for i, t in enumerate(upload.pages))
+    try:
+        yield
+    finally:
+        pipeline.iter_pdf_pages = saved
+
+
+def _random_page(rng: np.random.Generator) -> str:
+    # Empty pages and pages shorter or longer than one chunk all occur
+    if rng.random() < 0.1:
+        return ""
+    return " ".join(rng.choice(_WORDS, rng.integers(50, 700))) + "\n"
+
+
+def _revise(rng: np.random.Generator, pages: list[str]) -> list[str]:
+    pages = list(pages)
+    op = rng.integers(0, 6)
+    if op == 0 and pages:
+        pages[rng.integers(len(pages))] = _random_page(rng)
+    elif op == 1:
+        pages.insert(rng.integers(len(pages) + 1), _random_page(rng))
+    elif op == 2 and pages:
+        del pages[rng.integers(len(pages))]
+    elif op == 3:
+        pages += [_random_page(rng) for _ in range(rng.integers(1, 4))]
+    elif op == 4:
+        pages = pages[:rng.integers(len(pages) + 1)]
+    return pages  # op 5: unchanged
+
+
+def verify(n_cases: int, seed: int = 1) -> bool:
+    """Incremental re-ingest must equal a fresh ingest on random revisions."""
+    rng = np.random.default_rng(seed)
+    failures = 0
+    with fake_openai(64), _pages_from_strings():
+        for case in range(n_cases):
+            base = [_random_page(rng) for _ in range(rng.integers(0, 25))]
+            new = _revise(rng, base)
+            stored = pipeline.ingest(_Pages(base))
+            previous = pipeline.Revision(stored.pages, ChunkTable.from_chunks(stored.chunks),
+                                         _normalize_rows(stored.embeddings))
+            fresh = pipeline.ingest(_Pages(new))
+            incremental = pipeline.ingest(_Pages(new), previous=previous)
+            same = ([dict(c) for c in incremental.chunks] == fresh.chunks and incremental.pages == fresh.pages
+                    and np.allclose(_normalize_rows(incremental.embeddings), _normalize_rows(fresh.embeddings),
+                                    atol=1e-6))
+            if not same:
+                failures += 1
+                print(f"case {case}: {len(base)} -> {len(new)} pages, "
+                      f"{len(incremental.chunks)} chunks incremental vs {len(fresh.chunks)} fresh")
+    print(f"{n_cases - failures}/{n_cases} revisions identical to a fresh ingest")
+    return failures == 0
+
+
+def run(n_pages: int, latency: float) -> None:
+    base = synthetic_pdf(n_pages)
+    with fake_openai(1536) as client:
+        calls = FakeOpenAI(1536).embeddings
+        client.embeddings = _SlowEmbeddings(calls, latency)
+        stored, _ = _ingest(base)
+        previous = pipeline.Revision(stored.pages, ChunkTable.from_chunks(stored.chunks),
+                                     _normalize_rows(stored.embeddings))
+        print(f"{n_pages} pages, {len(stored.chunks)} chunks, {latency * 1000:.0f} ms per embeddings request")
+        print(f"{'edited page':>11} {'mode':<12} {'seconds':>8} {'requests':>9} {'reused':>7}")
+        for page in (1, n_pages // 2, n_pages):
+            revision = synthetic_pdf(n_pages, edited=frozenset({page}))
+            for mode, prior in (("full", None), ("incremental", previous)):
+                before = calls.calls
+                result, seconds = _ingest(revision, prior)
+                print(f"{page:>11} {mode:<12} {seconds:>8.2f} {calls.calls - before:>9} {result.chunks_reused:>7}")
+        before = calls.calls
+        result, seconds = _ingest(base, previous)
+        print(f"{'none':>11} {'incremental':<12} {seconds:>8.2f} {calls.calls - before:>9} {result.chunks_reused:>7}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--verify", type=int, metavar="N", help="check N random revisions instead")
+    args = parser.parse_args()
+    if args.verify:
+        if not verify(args.verify):
+            sys.exit(1)
+        return
+    run(args.pages, args.latency)
+
+
+if __name__ == "__main__":
+    main()
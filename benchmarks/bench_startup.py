@@ -0,0 +1,94 @@
+"""Cold start: import time of api.py and first use of each lazy dependency.
+
+Imports api in --runs fresh interpreters and reports the fastest import, the
+modules it spends most time on (python -X importtime), and any lazily loaded
+dependency (tokenizer, pdfplumber, openai) that was loaded eagerly. Then times
+the first load of each dependency, which is what prewarming moves off the
+first request. With --check, exits 1 if the import is over --budget-ms or a
+lazy dependency was loaded at import, so regressions fail CI.
+
+    python benchmarks/bench_startup.py --check --budget-ms 1500
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from rag import startup  # noqa: E402
+
+IMPORT_BUDGET_MS = 1500
+
+_CHILD = """
+import json, sys, time
+t0 = time.perf_counter()
+import api
+seconds = time.perf_counter() - t0
+from rag import startup
+eager = [m for m in ("openai", "pdfplumber") if m in sys.modules]
+eager += [name for name, loaded in startup.status().items() if loaded is not None and name not in eager]
+print(json.dumps({"seconds": seconds, "eager": eager}))
+"""
+
+
+def _child(*flags: str) -> subprocess.CompletedProcess:
+    env = dict(os.environ, DOCUQUERY_PREWARM="0")
+    return subprocess.run([sys.executable, *flags, "-c", _CHILD], cwd=ROOT, env=env,
+                          capture_output=True, text=True, check=True)
+
+
+def _slowest_imports(stderr: str, n: int) -> list[tuple[int, str]]:
+    """(cumulative microseconds, module) of top-level imports and their direct imports, slowest first."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if len(name) - len(name.lstrip()) <= 3:  # a top-level import, or one of its direct imports
+            rows.append((int(cumulative), name.rstrip()))
+    return sorted(rows, reverse=True)[:n]
+
+
+def run(runs: int, budget_ms: float) -> bool:
+    results = [json.loads(_child().stdout.splitlines()[-1]) for _ in range(runs)]
+    import_ms = 1000 * min(r["seconds"] for r in results)
+    eager = sorted({name for r in results for name in r["eager"]})
+
+    print(f"import api: {import_ms:.0f} ms (fastest of {runs}, budget {budget_ms:.0f} ms)")
+    print(f"{'cumulative ms':>14}  module")
+    for micros, name in _slowest_imports(_child("-X", "importtime").stderr, 10):
+        print(f"{micros / 1000:>14.1f}  {name}")
+
+    print(f"\n{'first use':<12} {'ms':>8}")
+    for name, get in (("tokenizer", startup.get_tokenizer), ("pdfplumber", startup.get_pdfplumber),
+                      ("openai", startup.get_openai)):
+        t0 = time.perf_counter()
+        get()
+        print(f"{name:<12} {1000 * (time.perf_counter() - t0):>8.1f}")
+
+    ok = import_ms <= budget_ms and not eager
+    if eager:
+        print(f"\nloaded at import, should be lazy: {', '.join(eager)}")
+    if import_ms > budget_ms:
+        print(f"\nimport is over budget by {import_ms - budget_ms:.0f} ms")
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument("--check", action="store_true", help="exit 1 on a budget or laziness regression")
+    args = parser.parse_args()
+    ok = run(args.runs, args.budget_ms)
+    if args.check and not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Benchmark store.query: per-query latency and index memory by corpus size.
+
+Compares the old float64 path (row norms + full argsort on every query) with
+the pre-normalized float32 index (one matvec + argpartition top-k).
+
+    python benchmarks/bench_store.py --sizes 1000 100000 1000000
+
+The legacy path is skipped when its float64 matrix would not fit in
+--legacy-max-gb of RAM.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from rag import store  # noqa: E402
+
+DIM = 1536
+
+
+def _legacy_query(embeddings: np.ndarray, query_vec: np.ndarray, k: int) -> np.ndarray:
+    norms = np.linalg.norm(embeddings, axis=1)
+    similarities = embeddings @ query_vec / (norms * np.linalg.norm(query_vec))
+    return np.argsort(similarities)[-k:][::-1]
+
+
+def _time_per_call(fn, repeats: int) -> float:
+    fn()  # warm-up
+    t0 = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - t0) / repeats
+
+
+def _random_matrix(rng: np.random.Generator, n: int, dim: int) -> np.ndarray:
+    """Fill a float32 matrix in blocks so 1M x 1536 never needs a float64 copy."""
+    out = np.empty((n, dim), dtype=np.float32)
+    for i in range(0, n, 50_000):
+        out[i:i + 50_000] = rng.standard_normal((min(50_000, n - i), dim), dtype=np.float32)
+    return out
+
+
+def run(sizes: list[int], dim: int, repeats: int, legacy_max_gb: float) -> None:
+    rng = np.random.default_rng(0)
+    print(f"{'chunks':>9} {'legacy ms':>10} {'legacy MB':>10} {'new ms':>8} {'new MB':>8} {'speedup':>8}")
+    for n in sizes:
+        raw = _random_matrix(rng, n, dim)
+        query_vec = rng.standard_normal(dim)
+
+        legacy_ms = legacy_mb = None
+        if n * dim * 8 <= legacy_max_gb * 1024 ** 3:
+            legacy = raw.astype(np.float64)
+            legacy_mb = legacy.nbytes / 1024 ** 2
+            legacy_ms = 1000 * _time_per_call(lambda: _legacy_query(legacy, query_vec, store.TOP_K), repeats)
+            del legacy
+
+        store.clear()
+        store.add_chunks([{"text": ""} for _ in range(n)], raw, session_id="bench", doc_id="bench")
+        del raw
+        index = store._docs[("bench", "bench")].embeddings
+        new_mb = index.nbytes / 1024 ** 2
+        new_ms = 1000 * _time_per_call(
+            lambda: store.query(query_vec, session_id="bench", doc_id="bench"), repeats)
+
+        if legacy_ms is None:
+            print(f"{n:>9} {'skipped':>10} {'-':>10} {new_ms:>8.2f} {new_mb:>8.0f} {'-':>8}")
+        else:
+            print(f"{n:>9} {legacy_ms:>10.2f} {legacy_mb:>10.0f} {new_ms:>8.2f} {new_mb:>8.0f} "
+                  f"{legacy_ms / new_ms:>7.1f}x")
+    store.clear()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=DIM)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--legacy-max-gb", type=float, default=4.0)
+    args = parser.parse_args()
+    store.MEMORY_BUDGET_BYTES = 1 << 62  # never evict the benchmark index
+    run(args.sizes, args.dim, args.repeats, args.legacy_max_gb)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Query throughput with several worker processes sharing one store directory.
+
+Writes one --chunks x --dim document to a temp DOCUQUERY_STORE_DIR, then
+runs 1, 2, 4 ... --max-workers processes that each query it for --seconds,
+the way uvicorn --workers N would. Every process memory-maps the same
+embeddings.npy, so the matrix is in RAM once however many workers search it.
+BLAS is limited to one thread per process so the scaling is the workers'.
+
+    python benchmarks/bench_workers.py --chunks 100000 --dim 1536 --max-workers 8
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def _worker(store_dir: str, dim: int, seconds: float, start, counts) -> None:
+    os.environ["DOCUQUERY_STORE_DIR"] = store_dir
+    sys.path.insert(0, ROOT)
+    from rag import store
+
+    queries = np.random.default_rng(os.getpid()).standard_normal((64, dim), dtype=np.float32)
+    store.query(queries[0], session_id="bench", doc_id="bench")  # map the files
+    start.wait()
+    n, deadline = 0, time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        store.query(queries[n % len(queries)], session_id="bench", doc_id="bench")
+        n += 1
+    counts.put(n)
+
+
+def _write_document(store_dir: str, n: int, dim: int) -> None:
+    os.environ["DOCUQUERY_STORE_DIR"] = store_dir
+    sys.path.insert(0, ROOT)
+    from rag import store
+
+    rng = np.random.default_rng(0)
+    store.add_chunks([{"text": f"chunk {i}", "chunk_index": i} for i in range(n)],
+                     rng.standard_normal((n, dim), dtype=np.float32), "bench", "bench")
+
+
+def run(n: int, dim: int, max_workers: int, seconds: float) -> None:
+    ctx = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as store_dir:
+        writer = ctx.Process(target=_write_document, args=(store_dir, n, dim))
+        writer.start()
+        writer.join()
+        print(f"{n} chunks x {dim} dims ({n * dim * 4 / 2**20:.0f} MB), {os.cpu_count()} CPUs")
+        print(f"{'workers':>8} {'QPS':>10} {'speedup':>8}")
+        base = None
+        workers = 1
+        while workers <= max_workers:
+            start, counts = ctx.Event(), ctx.Queue()
+            procs = [ctx.Process(target=_worker, args=(store_dir, dim, seconds, start, counts))
+                     for _ in range(workers)]
+            for p in procs:
+                p.start()
+            time.sleep(1.0)  # let every worker import and map the document
+            start.set()
+            qps = sum(counts.get() for _ in procs) / seconds
+            for p in procs:
+                p.join()
+            base = base or qps
+            print(f"{workers:>8} {qps:>10.0f} {qps / base:>7.2f}x")
+            workers *= 2
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seconds", type=float, default=3.0)
+    args = parser.parse_args()
+    for var in ("OPENBLAS_NUM_THREADS", "OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[var] = "1"  # inherited by the spawned workers
+    run(args.chunks, args.dim, args.max_workers, args.seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Deterministic, offline stand-ins for the OpenAI client."""
+
+from contextlib import contextmanager
+import hashlib
+import re
+from types import SimpleNamespace
+
+import numpy as np
+
+from rag import embedder, generator
+from rag.embed_cache import EmbeddingCache
+
+
+def fake_vector(text: str, dim: int) -> list[float]:
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    return np.random.default_rng(seed).standard_normal(dim, dtype=np.float32).tolist()
+
+
+class _Embeddings:
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.calls = 0
+
+    def create(self, model: str, input: list[str], **kwargs):
+        self.calls += 1
+        return SimpleNamespace(data=[SimpleNamespace(embedding=fake_vector(t, self.dim)) for t in input])
+
+
+class _Completions:
+    def create(self, model: str, messages: list[dict], stream: bool = False, **kwargs):
+        prompt_chars = sum(len(m["content"]) for m in messages)
+        text = f"Answer based on {prompt_chars} prompt characters."
+        if stream:
+            return iter([SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word))])
+                         for word in re.findall(r"\S+\s*", text)])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+
+
+class FakeOpenAI:
+    """Embeddings are seeded by a hash of the text; chat echoes prompt size."""
+
+    def __init__(self, dim: int = 256):
+        self.embeddings = _Embeddings(dim)
+        self.chat = SimpleNamespace(completions=_Completions())
+
+
+@contextmanager
+def fake_openai(dim: int = 256):
+    """Route rag.embedder and rag.generator to a FakeOpenAI, with a cold cache."""
+    client = FakeOpenAI(dim)
+    saved = embedder._client, generator._client, embedder._cache
+    embedder._client = generator._client = client
+    embedder._cache = EmbeddingCache(path=None)
+    try:
+        yield client
+    finally:
+        embedder._client, generator._client, embedder._cache = saved
@@ -0,0 +1,167 @@
+"""Local stand-in for the OpenAI HTTP API, for load tests.
+
+Serves POST /v1/embeddings (float or base64 encoding) and POST
+/v1/chat/completions (plain or streamed), which is all the API uses. Every
+request waits its configured latency (plus up to --jitter of it), and a
+random --error-rate of requests are answered 429 with a Retry-After, the
+way the real API rate-limits. Vectors are the deterministic fake_vector of
+fakes.py. GET /_stats returns request and 429 counts.
+
+    python benchmarks/mock_openai.py --port 8100 --embed-latency 0.1 --error-rate 0.02
+    OPENAI_BASE_URL=http://127.0.0.1:8100/v1 OPENAI_API_KEY=sk-mock uvicorn api:app
+"""
+
+import argparse
+import base64
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fakes import fake_vector  # noqa: E402
+
+_ANSWER = ("According to the document, the supplier must deliver within thirty days [Chunk 3, Page 2]. "
+           "Late delivery incurs a penalty of 0.5% per day, capped at 10% of the contract value.")
+
+
+class _Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests: dict[str, int] = {}
+        self.rate_limited: dict[str, int] = {}
+
+    def count(self, kind: str, limited: bool) -> None:
+        with self.lock:
+            self.requests[kind] = self.requests.get(kind, 0) + 1
+            if limited:
+                self.rate_limited[kind] = self.rate_limited.get(kind, 0) + 1
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            return {"requests": dict(self.requests), "rate_limited": dict(self.rate_limited)}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "MockOpenAI"
+
+    def log_message(self, format, *args):  # quiet: one line per request would swamp the output
+        pass
+
+    def _json(self, status: int, body: dict, headers: dict | None = None) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/_stats":
+            self._json(200, self.server.stats.to_dict())
+        else:
+            self._json(404, {"error": {"message": "Not found"}})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path.endswith("/embeddings"):
+            kind, latency = "embeddings", self.server.embed_latency
+        elif self.path.endswith("/chat/completions"):
+            kind, latency = "chat", self.server.chat_latency
+        else:
+            self._json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+
+        limited = random.random() < self.server.error_rate
+        self.server.stats.count(kind, limited)
+        time.sleep(latency * (1 + self.server.jitter * random.random()))
+        if limited:
+            self._json(429, {"error": {"message": "Rate limit reached (mock)", "type": "requests",
+                                       "code": "rate_limit_exceeded"}},
+                       {"Retry-After": f"{self.server.retry_after:g}"})
+        elif kind == "embeddings":
+            self._embeddings(body)
+        elif body.get("stream"):
+            self._chat_stream(body)
+        else:
+            self._json(200, {"id": "chatcmpl-mock", "object": "chat.completion", "created": int(time.time()),
+                             "model": body.get("model"),
+                             "choices": [{"index": 0, "finish_reason": "stop",
+                                          "message": {"role": "assistant", "content": _ANSWER}}],
+                             "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}})
+
+    def _embeddings(self, body: dict) -> None:
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        data = []
+        for i, text in enumerate(inputs):
+            vector = fake_vector(str(text), self.server.dim)
+            if body.get("encoding_format") == "base64":
+                vector = base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode("ascii")
+            data.append({"object": "embedding", "index": i, "embedding": vector})
+        self._json(200, {"object": "list", "data": data, "model": body.get("model"),
+                         "usage": {"prompt_tokens": 0, "total_tokens": 0}})
+
+    def _chat_stream(self, body: dict) -> None:
+        # HTTP/1.0: the stream ends when the connection closes
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        for word in re.findall(r"\S+\s*", _ANSWER):
+            chunk = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": body.get("model"),
+                     "choices": [{"index": 0, "delta": {"content": word}, "finish_reason": None}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(self.server.token_seconds)
+        self.wfile.write(b"data: [DONE]\n\n")
+
+
+class MockOpenAI(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, port: int = 0, embed_latency: float = 0.1, chat_latency: float = 0.5,
+                 token_seconds: float = 0.01, error_rate: float = 0.0, jitter: float = 0.2,
+                 retry_after: float = 0.2, dim: int = 256):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.embed_latency = embed_latency
+        self.chat_latency = chat_latency  # before the first token
+        self.token_seconds = token_seconds
+        self.error_rate = error_rate
+        self.jitter = jitter
+        self.retry_after = retry_after
+        self.dim = dim
+        self.stats = _Stats()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--embed-latency", type=float, default=0.1, help="seconds per embeddings request")
+    parser.add_argument("--chat-latency", type=float, default=0.5, help="seconds to the first token")
+    parser.add_argument("--token-ms", type=float, default=10, help="delay between streamed tokens")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered 429")
+    parser.add_argument("--jitter", type=float, default=0.2, help="latency varies by up to this fraction")
+    parser.add_argument("--dim", type=int, default=256)
+    args = parser.parse_args()
+    server = MockOpenAI(args.port, args.embed_latency, args.chat_latency, args.token_ms / 1000,
+                        args.error_rate, args.jitter, dim=args.dim)
+    print(f"mock OpenAI at {server.base_url}", flush=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""Offline micro-benchmark suite: time and peak memory per pipeline stage.
+
+Runs parse → chunk → embed → index → search → prompt on the tests/ fixtures
+and on synthetic PDFs (1 to 1000 pages) and CSVs (1k to 1M rows). OpenAI is
+replaced by the deterministic fake in fakes.py, so the numbers measure this
+code and not the network. Search and prompt are averaged per query.
+"ingest" times rag.pipeline.ingest, the streamed parse+chunk+embed path
+that /upload runs, end to end. Lazy imports (tiktoken, pdfplumber, the
+OpenAI SDK) are loaded before anything is timed.
+
+Results are written as JSON and compared with a stored baseline; a stage
+is flagged when it is slower (or uses more memory) than the baseline by
+more than --threshold. --check fails when there is no baseline, or when
+the baseline shares no stage with this run, rather than passing on an
+empty comparison.
+
+    python benchmarks/suite.py --quick
+    python benchmarks/suite.py --save-baseline          # on the reference machine
+    python benchmarks/suite.py --check                  # exit 1 on regressions
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import numpy as np  # noqa: E402
+
+from rag import pipeline, startup, store  # noqa: E402
+from rag.chunker import chunk_text  # noqa: E402
+from rag.embedder import embed_texts  # noqa: E402
+from rag.generator import generate_answer  # noqa: E402
+from rag.parser import file_extension, parse_file  # noqa: E402
+from fakes import fake_openai, fake_vector  # noqa: E402
+from synthetic import NamedBytes, synthetic_csv, synthetic_pdf  # noqa: E402
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+TESTS_DIR = os.path.join(BENCH_DIR, "..", "tests")
+FIXTURES = ["test_doc.txt", "test_doc_10pages.txt", "test_sample.pdf", "test_sample.csv",
+            "test_sample_cr.csv"]  # the same table with old-Mac "\r" line endings
+DEFAULT_OUT = os.path.join(BENCH_DIR, "results", "latest.json")
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+
+STAGES = ["parse", "chunk", "embed", "index", "search", "prompt", "ingest"]
+QUESTIONS = ["What is the payment deadline?", "Who are the parties?",
+             "Summarize the termination clause.", "Which city has the largest amount?"]
+# Differences below these are noise, whatever the ratio
+MIN_SECONDS_DELTA = 0.005
+MIN_MB_DELTA = 1.0
+
+
+def _documents(pages: list[int], csv_rows: list[int]):
+    """Yield (name, filename, data) for every benchmark document."""
+    for fixture in FIXTURES:
+        with open(os.path.join(TESTS_DIR, fixture), "rb") as f:
+            yield fixture, fixture, f.read()
+    for n in pages:
+        yield f"pdf-{n}p", "synthetic.pdf", synthetic_pdf(n)
+    for n in csv_rows:
+        yield f"csv-{n}r", "synthetic.csv", synthetic_csv(n)
+
+
+def check_fixtures() -> None:
+    """Exit 1 unless every fixture parses as its own file type, into at least one chunk."""
+    failed = []
+    for fixture in FIXTURES:
+        with open(os.path.join(TESTS_DIR, fixture), "rb") as f:
+            parsed = parse_file(NamedBytes(fixture, f.read()))
+        chunks = parsed.chunks if parsed.chunks is not None else chunk_text(parsed.text, fixture)
+        if parsed.file_type != file_extension(fixture) or not chunks:
+            failed.append(f"{fixture}: parsed as {parsed.file_type}, {len(chunks)} chunks")
+    for line in failed:
+        print("FAILED " + line)
+    if failed:
+        sys.exit(1)
+
+
+def warm_up(dim: int) -> None:
+    """Load lazy dependencies and run one untimed embed, so no stage pays for imports."""
+    startup.prewarm().join()
+    with fake_openai(dim):
+        embed_texts(["warm up"])
+
+
+def _measure(fn, memory: bool) -> tuple[object, dict]:
+    """Run fn once for wall time, then once more under tracemalloc for peak memory.
+
+    tracemalloc slows allocation-heavy code several times over, so the two
+    are never taken from the same run. fn must be repeatable.
+    """
+    t0 = time.perf_counter()
+    result = fn()
+    stats = {"seconds": round(time.perf_counter() - t0, 6)}
+    if memory:
+        tracemalloc.start()
+        try:
+            fn()
+            stats["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 3)
+        finally:
+            tracemalloc.stop()
+    return result, stats
+
+
+def bench_document(name: str, filename: str, data: bytes, dim: int, memory: bool) -> dict:
+    stages = {}
+    parsed, stages["parse"] = _measure(lambda: parse_file(NamedBytes(filename, data)), memory)
+
+    if parsed.chunks is not None:  # CSV rows are chunked while parsing
+        chunks = parsed.chunks
+    else:
+        chunks, stages["chunk"] = _measure(
+            lambda: chunk_text(parsed.text, filename, file_type=parsed.file_type, page_map=parsed.page_map),
+            memory)
+    if not chunks:
+        return {"chunks": 0, "stages": stages}
+
+    texts = [c["text"] for c in chunks]
+
+    def embed():
+        # Every run starts cold, or the second one would only measure cache hits
+        with fake_openai(dim):
+            return embed_texts(texts)
+    embeddings, stages["embed"] = _measure(embed, memory)
+
+    _, stages["index"] = _measure(
+        lambda: store.add_chunks(chunks, embeddings, session_id="bench", doc_id="doc"), memory)
+
+    query_vecs = [fake_vector(q, dim) for q in QUESTIONS]
+    results, stages["search"] = _measure(
+        lambda: [store.query(v, session_id="bench", doc_id="doc") for v in query_vecs], memory)
+
+    def prompt():
+        with fake_openai(dim):
+            return [generate_answer(q, r) for q, r in zip(QUESTIONS, results)]
+    _, stages["prompt"] = _measure(prompt, memory)
+
+    def ingest():
+        with fake_openai(dim):
+            return pipeline.ingest(NamedBytes(filename, data))
+    _, stages["ingest"] = _measure(ingest, memory)
+
+    for stage in ("search", "prompt"):
+        stages[stage]["seconds"] = round(stages[stage]["seconds"] / len(QUESTIONS), 6)
+    store.clear("bench")
+    return {"chunks": len(chunks), "stages": stages}
+
+
+def run(pages: list[int], csv_rows: list[int], dim: int, memory: bool) -> dict:
+    results = {}
+    print(f"{'document':<22} {'chunks':>7} " + " ".join(f"{s:>16}" for s in STAGES))
+    for name, filename, data in _documents(pages, csv_rows):
+        entry = results[name] = bench_document(name, filename, data, dim, memory)
+        cells = []
+        for stage in STAGES:
+            s = entry["stages"].get(stage)
+            if s is None:
+                cell = "-"
+            else:
+                cell = f"{s['seconds'] * 1000:.1f}ms"
+                if "peak_mb" in s:
+                    cell += f" {s['peak_mb']:.1f}MB"
+            cells.append(f"{cell:>16}")
+        print(f"{name:<22} {entry['chunks']:>7} " + " ".join(cells), flush=True)
+    return {
+        "meta": {
+            "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "embedding_dim": dim,
+            "memory": memory,
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> tuple[list[str], int]:
+    """Return one line per stage that regressed against the baseline, and the number of stages compared."""
+    regressions = []
+    compared = 0
+    for name, entry in current["results"].items():
+        base_entry = baseline["results"].get(name)
+        if base_entry is None:
+            continue
+        for stage, stats in entry["stages"].items():
+            base = base_entry["stages"].get(stage)
+            if base is None:
+                continue
+            compared += 1
+            for metric, floor, unit in (("seconds", MIN_SECONDS_DELTA, "s"), ("peak_mb", MIN_MB_DELTA, "MB")):
+                if metric not in stats or metric not in base:
+                    continue
+                new, old = stats[metric], base[metric]
+                if new > old * (1 + threshold) and new - old > floor:
+                    regressions.append(f"{name}/{stage} {metric}: {old:.4g}{unit} -> {new:.4g}{unit} "
+                                       f"(+{(new / old - 1) * 100 if old else float('inf'):.0f}%)")
+    return regressions, compared
+
+
+def _write_json(path: str, data: dict) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+        f.write("\n")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="*", default=[1, 10, 100, 1000])
+    parser.add_argument("--csv-rows", type=int, nargs="*", default=[1000, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--quick", action="store_true", help="small sizes only (1/10 pages, 1k/10k rows)")
+    parser.add_argument("--dim", type=int, default=256, help="fake embedding dimension")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc runs")
+    parser.add_argument("--out", default=DEFAULT_OUT)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="also write the results as the baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown, as a fraction")
+    parser.add_argument("--check", action="store_true", help="exit with status 1 on regressions")
+    args = parser.parse_args()
+    if args.quick:
+        args.pages, args.csv_rows = [1, 10], [1000, 10_000]
+
+    # Keep the suite away from any persisted store or on-disk embedding cache
+    store.STORE_DIR = None
+
+    warm_up(args.dim)
+    check_fixtures()
+    current = run(args.pages, args.csv_rows, args.dim, memory=not args.no_memory)
+    _write_json(args.out, current)
+    print(f"\nresults written to {args.out}")
+
+    if args.save_baseline:
+        _write_json(args.baseline, current)
+        print(f"baseline written to {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline}; run with --save-baseline to create one")
+        if args.check:
+            sys.exit(1)
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    for key in ("machine", "python", "numpy", "embedding_dim"):
+        if baseline["meta"].get(key) != current["meta"][key]:
+            print(f"warning: baseline {key} is {baseline['meta'].get(key)}, this run is {current['meta'][key]}")
+    regressions, compared = compare(current, baseline, args.threshold)
+    print(f"compared {compared} stage(s) with baseline from {baseline['meta'].get('created_at', '?')}: "
+          f"{len(regressions)} regression(s) over {args.threshold:.0%}")
+    for line in regressions:
+        print("  " + line)
+    if args.check and (regressions or not compared):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
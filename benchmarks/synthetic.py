@@ -0,0 +1,74 @@
+"""Deterministic synthetic documents for the benchmarks."""
+
+import io
+
+_WORDS = ("contract payment invoice liability termination clause party notice "
+          "agreement schedule delivery warranty service period renewal fee").split()
+
+_SENTENCE = ("The supplier shall deliver the goods described in Schedule {n} within thirty days; "
+             "late delivery incurs a penalty of 0.5% per day — capped at 10% of the contract value. ")
+
+
+class NamedBytes(io.BytesIO):
+    """In-memory upload: what parse_file expects (.name, .read(), .seek())."""
+
+    def __init__(self, name: str, data: bytes):
+        super().__init__(data)
+        self.name = name
+
+
+def synthetic_pdf(n_pages: int, lines_per_page: int = 45, edited: frozenset[int] = frozenset()) -> bytes:
+    """Build a minimal valid PDF with n_pages of Helvetica text.
+
+    Pages listed in `edited` (1-indexed) get different words, as in a revision.
+    """
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for p in range(n_pages):
+        lines = []
+        for i in range(lines_per_page):
+            shift = 5 if p + 1 in edited else 0
+            words = " ".join(_WORDS[(p * 7 + i * 3 + j + shift) % len(_WORDS)] for j in range(12))
+            lines.append(f"({p + 1}.{i + 1} {words}) Tj 0 -15 Td")
+        stream = ("BT /F1 10 Tf 50 780 Td " + " ".join(lines) + " ET").encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_ref = len(objects)
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_ref)
+        kids.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), n_pages)
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n%s\nendobj\n" % (i, body))
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for off in offsets:
+        out.write(b"%010d 00000 n \n" % off)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+def synthetic_text(n_pages: int) -> tuple[str, list[tuple[int, int, int]]]:
+    """PDF-like text of ~600 tokens per page, with its page_map."""
+    pages, page_map, pos = [], [], 0
+    for p in range(n_pages):
+        text = "".join(_SENTENCE.format(n=p * 20 + i) for i in range(18)) + "\n"
+        pages.append(text)
+        page_map.append((p + 1, pos, pos + len(text)))
+        pos += len(text)
+    return "".join(pages), page_map
+
+
+def synthetic_csv(n_rows: int) -> bytes:
+    """A CSV export with a header and n_rows rows, some with quoted fields."""
+    lines = ["id,customer,amount,city,date,note"]
+    for i in range(n_rows):
+        note = f'"late, {i % 5} reminders"' if i % 10 == 0 else "ok"
+        lines.append(f"{i},Customer {i % 997},{i * 3.7:.2f},{_WORDS[i % len(_WORDS)]},"
+                     f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d},{note}")
+    return ("\n".join(lines) + "\n").encode("utf-8")
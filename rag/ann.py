@@ -0,0 +1,148 @@
+"""Approximate nearest-neighbour search: a pure-NumPy IVF-flat index.
+
+Vectors are clustered with spherical k-means into ``nlist`` inverted lists.
+A query scores the centroids, then scans only the ``nprobe`` closest lists
+exactly. Raising nprobe trades speed for recall; nprobe == nlist is exact.
+
+The index stores list assignments only — it scores against the caller's
+(already unit-normalized) matrix, so it adds ~8 bytes per vector.
+"""
+
+import numpy as np
+
+KMEANS_ITERS = 10
+KMEANS_SAMPLES_PER_LIST = 64  # training sample size = nlist * this
+_BLOCK_ROWS = 65_536  # rows scored per block when assigning vectors
+
+# Retrain once the index has grown this many times past its training size,
+# since incremental inserts never move the centroids.
+RETRAIN_GROWTH = 4
+
+
+def top_k(similarities: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest similarities, best first.
+
+    argpartition is O(N); only the k survivors are fully sorted.
+    """
+    if k < len(similarities):
+        candidates = np.argpartition(similarities, -k)[-k:]
+    else:
+        candidates = np.arange(len(similarities))
+    return candidates[np.argsort(similarities[candidates])[::-1]]
+
+
+def top_k_rows(similarities: np.ndarray, k: int) -> np.ndarray:
+    """Row-wise top_k of a (queries, N) similarity matrix, best first."""
+    n_rows, n = similarities.shape
+    if k < n:
+        candidates = np.argpartition(similarities, -k, axis=1)[:, -k:]
+    else:
+        candidates = np.tile(np.arange(n), (n_rows, 1))
+    order = np.argsort(np.take_along_axis(similarities, candidates, axis=1), axis=1)[:, ::-1]
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+def default_nlist(n: int) -> int:
+    """Rule of thumb: about 4 * sqrt(N) lists."""
+    return max(1, int(4 * np.sqrt(n)))
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _kmeans(vectors: np.ndarray, nlist: int, rng: np.random.Generator) -> np.ndarray:
+    """Spherical k-means on a sample of vectors; returns unit centroids."""
+    n = len(vectors)
+    sample_size = min(n, nlist * KMEANS_SAMPLES_PER_LIST)
+    sample = np.asarray(vectors[np.sort(rng.choice(n, sample_size, replace=False))], dtype=np.float32)
+    centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+    for _ in range(KMEANS_ITERS):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=nlist)
+        sums = np.zeros_like(centroids)
+        nonempty = counts > 0
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        sums[nonempty] = np.add.reduceat(sample[order], starts[nonempty], axis=0)
+        # Re-seed empty lists with random sample points
+        empty = ~nonempty
+        if empty.any():
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()), replace=False)]
+        centroids = _normalize(sums).astype(np.float32)
+    return centroids
+
+
+class IVFIndex:
+    """Inverted-file index over the rows of a unit-normalized matrix."""
+
+    def __init__(self, centroids: np.ndarray, assignments: np.ndarray, nprobe: int):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.nprobe = nprobe
+        self.trained_size = len(assignments)
+        self._set_assignments(np.asarray(assignments, dtype=np.int32))
+
+    @classmethod
+    def train(cls, matrix: np.ndarray, nlist: int | None = None, nprobe: int = 16,
+              seed: int = 0) -> "IVFIndex":
+        nlist = min(nlist or default_nlist(len(matrix)), len(matrix))
+        centroids = _kmeans(matrix, nlist, np.random.default_rng(seed))
+        index = cls(centroids, np.zeros(0, dtype=np.int32), nprobe)
+        index.add(matrix, start=0)
+        index.trained_size = len(matrix)
+        return index
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    def __len__(self) -> int:
+        return len(self.assignments)
+
+    def copy(self) -> "IVFIndex":
+        index = IVFIndex(self.centroids, self.assignments, self.nprobe)
+        index.trained_size = self.trained_size
+        return index
+
+    def needs_retrain(self) -> bool:
+        return len(self) > RETRAIN_GROWTH * self.trained_size
+
+    def _set_assignments(self, assignments: np.ndarray) -> None:
+        self.assignments = assignments
+        # Row ids grouped by list; list c is _order[_bounds[c]:_bounds[c + 1]]
+        self._order = np.argsort(assignments, kind="stable").astype(np.int32)
+        self._bounds = np.searchsorted(assignments[self._order], np.arange(self.nlist + 1))
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        out = np.empty(len(vectors), dtype=np.int32)
+        for i in range(0, len(vectors), _BLOCK_ROWS):
+            block = np.asarray(vectors[i:i + _BLOCK_ROWS], dtype=np.float32)
+            out[i:i + len(block)] = np.argmax(block @ self.centroids.T, axis=1)
+        return out
+
+    def add(self, matrix: np.ndarray, start: int) -> None:
+        """Assign rows matrix[start:] to their nearest lists (no retraining)."""
+        new = self._assign(matrix[start:])
+        self._set_assignments(np.concatenate((self.assignments[:start], new)))
+
+    def search(self, matrix: np.ndarray, query_vec: np.ndarray, k: int,
+               nprobe: int | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """Return (row ids, similarities) of the best k rows, best first.
+
+        Probes more lists if the first nprobe hold fewer than k vectors.
+        """
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        centroid_order = np.argsort(self.centroids @ query_vec)[::-1]
+        while True:
+            probe = centroid_order[:nprobe]
+            ids = np.concatenate([self._order[self._bounds[c]:self._bounds[c + 1]] for c in probe])
+            if len(ids) >= k or nprobe >= self.nlist:
+                break
+            nprobe = min(nprobe * 2, self.nlist)
+        ids.sort()  # sequential access into the (possibly memory-mapped) matrix
+        similarities = matrix[ids] @ query_vec
+        best = top_k(similarities, min(k, len(ids)))
+        return ids[best], similarities[best]
@@ -0,0 +1,123 @@
+"""Coarse-to-fine search over contiguous blocks of a document's chunks.
+
+A long document covers one subject at a time. Neighbouring chunks usually
+belong to the same section, and a question is usually answered in one or
+two places. BlockIndex splits the chunks into runs of about sqrt(N), cut
+at page boundaries when the chunks have pages, and keeps the mean vector of
+each run. A query scores the block centroids, then scores only the chunks
+of the ``nprobe`` best blocks: about (1 + nprobe) * sqrt(N) rows instead
+of N.
+
+Each block also keeps its covering radius, the largest distance from its
+mean to one of its rows. For a unit query q and any row r of the block,
+q.r = q.mean + q.(r - mean) <= q.mean + radius, so that sum bounds the
+block's best similarity from above. After the probes, every skipped block
+whose bound beats the k-th hit is scored too (all rows at once, if that is
+most of them), so the result is the exact top k, up to quantization error
+when the rows are compressed. How many rows that takes depends on the
+data: tight sections give small radii and few extra blocks, while loose or
+shuffled sections end up scoring every row, a little slower than exact
+search. Hits are row ids either way, so their metadata (and the citations
+built from it) is unchanged.
+"""
+
+import numpy as np
+
+from rag.ann import top_k
+
+MIN_BLOCK_CHUNKS = 8
+
+
+def default_block_chunks(n: int) -> int:
+    """Rule of thumb: blocks of about sqrt(N) chunks, so there are about as many blocks."""
+    return max(MIN_BLOCK_CHUNKS, int(np.sqrt(n)))
+
+
+def block_bounds(n: int, pages: np.ndarray | None, block_chunks: int) -> np.ndarray:
+    """Block boundaries: block b is rows bounds[b]:bounds[b + 1].
+
+    A block is closed once it holds block_chunks rows and the next row
+    starts a new page, or at 2 * block_chunks rows whatever the pages.
+    """
+    if pages is None:
+        starts = list(range(0, n, block_chunks))
+    else:
+        starts = [0]
+        for i in range(1, n):
+            size = i - starts[-1]
+            if size >= 2 * block_chunks or (size >= block_chunks and pages[i] != pages[i - 1]):
+                starts.append(i)
+    return np.array(starts[:n] + [n], dtype=np.int64)
+
+
+class BlockIndex:
+    """Block centroids over the rows of a unit-normalized matrix."""
+
+    def __init__(self, bounds: np.ndarray, means: np.ndarray, radii: np.ndarray, nprobe: int):
+        self.bounds = np.asarray(bounds, dtype=np.int64)
+        self.means = np.ascontiguousarray(means, dtype=np.float32)  # not normalized: see module docstring
+        self.radii = np.asarray(radii, dtype=np.float32)
+        self.nprobe = nprobe
+        self._norms = np.linalg.norm(self.means, axis=1)
+        self.centroids = self.means / np.where(self._norms > 0, self._norms, 1.0)[:, None]
+        self.searches = 0
+        self.fallbacks = 0  # searches that scored blocks beyond the probes
+        self.rows_scored = 0  # block rows scored, over all searches
+
+    @classmethod
+    def build(cls, matrix: np.ndarray, pages: np.ndarray | None = None, block_chunks: int | None = None,
+              nprobe: int = 4) -> "BlockIndex":
+        """One pass over the rows; `pages` gives each row's first page, if any."""
+        bounds = block_bounds(len(matrix), pages, block_chunks or default_block_chunks(len(matrix)))
+        means = np.empty((len(bounds) - 1, matrix.shape[1]), dtype=np.float32)
+        radii = np.empty(len(means), dtype=np.float32)
+        for b in range(len(means)):
+            rows = np.asarray(matrix[bounds[b]:bounds[b + 1]], dtype=np.float32)
+            means[b] = rows.mean(axis=0)
+            radii[b] = np.linalg.norm(rows - means[b], axis=1).max()
+        return cls(bounds, means, radii, nprobe)
+
+    @property
+    def nblocks(self) -> int:
+        return len(self.means)
+
+    def __len__(self) -> int:
+        return int(self.bounds[-1])
+
+    def search(self, matrix: np.ndarray, query_vec: np.ndarray, k: int,
+               nprobe: int | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """Return (row ids, similarities) of the best k rows, best first.
+
+        Probes more blocks if the first nprobe hold fewer than k rows, then
+        scores every other block whose upper bound beats the k-th hit.
+        """
+        self.searches += 1
+        scores = self.centroids @ query_vec
+        order = np.argsort(scores)[::-1]
+        sizes = np.diff(self.bounds)[order]
+        enough = int(np.searchsorted(np.cumsum(sizes), k)) + 1  # blocks needed to hold k rows
+        nprobe = min(max(nprobe or self.nprobe, enough), self.nblocks)
+
+        probe = np.sort(order[:nprobe])  # sequential access into the (possibly memory-mapped) matrix
+        ids = np.concatenate([np.arange(self.bounds[b], self.bounds[b + 1]) for b in probe])
+        similarities = matrix[ids] @ query_vec
+        self.rows_scored += len(ids)
+        best = top_k(similarities, min(k, len(ids)))
+        ids, sims = ids[best], similarities[best]
+
+        rest = order[nprobe:]
+        missed = np.sort(rest[scores[rest] * self._norms[rest] + self.radii[rest] > sims[-1]])
+        if not len(missed):
+            return ids, sims
+        self.fallbacks += 1
+        extra = np.concatenate([np.arange(self.bounds[b], self.bounds[b + 1]) for b in missed])
+        if 2 * (len(ids) + len(extra)) > len(self):
+            # Gathering most of the rows costs more than one pass over all of them
+            self.rows_scored += len(self) - len(ids)
+            similarities = matrix @ query_vec
+            best = top_k(similarities, k)
+            return best, similarities[best]
+        self.rows_scored += len(extra)
+        ids, sims = np.concatenate([ids, extra]), np.concatenate([sims, matrix[extra] @ query_vec])
+        best = top_k(sims, k)
+        return ids[best], sims[best]
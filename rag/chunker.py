@@ -1,6 +1,10 @@
-import tiktoken
+import bisect
+from typing import Callable, Iterable, Iterator
+
+import numpy as np
+
+from rag.startup import get_tokenizer
 
-ENCODING = tiktoken.get_encoding("cl100k_base")
 CHUNK_SIZE = 500  # tokens
 CHUNK_OVERLAP = 100  # tokens
 
@@ -10,38 +14,26 @@ def chunk_text(text: str, filename: str, file_type: str = "txt", page_map: list
 
     Returns a list of dicts with metadata including file_type and page info.
     """
-    tokens = ENCODING.encode(text)
+    encoding = get_tokenizer()
+    tokens = encoding.encode(text)
     chunks = []
     start = 0
 
-    # Pre-compute char positions at chunk boundaries to avoid O(n^2) decoding.
-    # Old code decoded tokens[:start] and tokens[:end] on EVERY iteration,
-    # which for a 300-page PDF meant 1200+ decode calls and massive allocations.
-    boundaries = set()
-    pos = 0
-    while pos < len(tokens):
-        boundaries.add(pos)
-        end = min(pos + CHUNK_SIZE, len(tokens))
-        boundaries.add(end)
-        if end >= len(tokens):
-            break
-        pos = end - CHUNK_OVERLAP
-    boundaries.add(len(tokens))
-
-    char_at = {}
-    for b in sorted(boundaries):
-        char_at[b] = len(ENCODING.decode(tokens[:b])) if b > 0 else 0
+    # Char offset of every token boundary, computed in one linear pass.
+    # (Decoding tokens[:b] per boundary was quadratic in document length.)
+    char_at = _token_char_offsets(text, tokens)
+    pages = _PageIndex(page_map) if page_map is not None else None
 
     while start < len(tokens):
         end = min(start + CHUNK_SIZE, len(tokens))
         chunk_tokens = tokens[start:end]
-        chunk_text_decoded = ENCODING.decode(chunk_tokens)
+        chunk_text_decoded = encoding.decode(chunk_tokens)
 
-        char_start = char_at[start]
-        char_end = char_at[end]
+        char_start = int(char_at[start])
+        char_end = int(char_at[end])
 
         # Find page range for PDF
-        page_start, page_end = _find_pages(char_start, char_end, page_map)
+        page_start, page_end = pages.find(char_start, char_end) if pages is not None else (None, None)
 
         chunks.append({
             "text": chunk_text_decoded,
@@ -63,19 +55,115 @@ def chunk_text(text: str, filename: str, file_type: str = "txt", page_map: list
     return chunks
 
 
-def _find_pages(char_start: int, char_end: int, page_map: list | None) -> tuple[int | None, int | None]:
-    """Find the first and last page that intersect [char_start, char_end]."""
-    if page_map is None:
-        return None, None
+class _PageIndex:
+    """Sorted page boundaries for O(log P) chunk → page lookups."""
 
-    first_page = None
-    last_page = None
+    def __init__(self, page_map: list | None = None):
+        self.numbers: list[int] = []
+        self.starts: list[int] = []
+        self.ends: list[int] = []
+        for page_num, p_start, p_end in page_map or ():
+            self.add(page_num, p_start, p_end)
 
-    for page_num, p_start, p_end in page_map:
-        # Check if this page intersects with the chunk range
-        if p_end > char_start and p_start < char_end:
-            if first_page is None:
-                first_page = page_num
-            last_page = page_num
+    def add(self, page_num: int, p_start: int, p_end: int) -> None:
+        """Append a page; pages must arrive in document order."""
+        self.numbers.append(page_num)
+        self.starts.append(p_start)
+        self.ends.append(p_end)
 
-    return first_page, last_page
+    def find(self, char_start: int, char_end: int) -> tuple[int | None, int | None]:
+        """Find the first and last page that intersect [char_start, char_end]."""
+        first = bisect.bisect_right(self.ends, char_start)  # first page ending after char_start
+        last = bisect.bisect_left(self.starts, char_end) - 1  # last page starting before char_end
+        if first > last:
+            return None, None
+        return self.numbers[first], self.numbers[last]
+
+
+def _token_char_offsets(text: str, tokens: list[int]) -> np.ndarray:
+    """Char offset in `text` of every token boundary (len(tokens) + 1 entries).
+
+    Linear: sums token byte lengths, then maps byte offsets to char offsets
+    through a cumulative count of UTF-8 lead bytes. A boundary that falls
+    inside a multi-byte character maps to the end of that character.
+    """
+    raw = np.frombuffer(text.encode("utf-8"), dtype=np.uint8)
+    chars_before = np.zeros(len(raw) + 1, dtype=np.int64)
+    np.cumsum((raw & 0xC0) != 0x80, out=chars_before[1:])
+    byte_offsets = np.zeros(len(tokens) + 1, dtype=np.int64)
+    np.cumsum(np.fromiter(map(len, get_tokenizer().decode_tokens_bytes(tokens)), dtype=np.int64,
+                          count=len(tokens)), out=byte_offsets[1:])
+    return chars_before[byte_offsets]
+
+
+def iter_chunks(pages: Iterable[tuple[int | None, str]], filename: str,
+                file_type: str = "txt", on_page_tokens: Callable[[int], None] | None = None,
+                resume: tuple[int, int, int] | None = None) -> Iterator[dict]:
+    """Incremental chunk_text: consume (page_number, text) pairs, yield chunks.
+
+    Same 500/100-token windows and chunk dicts as chunk_text, but a chunk is
+    yielded as soon as its tokens have arrived, and only the unfinished tail
+    of the token stream is held in memory. The overlap carries across page
+    boundaries. Pages are tokenized one at a time, so a token is never split
+    across a page break. Pass page_number=None for documents without pages.
+
+    on_page_tokens(n) receives the token count of every page. To continue a
+    document part-way, pass resume=(chunk_index, skip_tokens, char_offset):
+    the first page then starts at char_offset, its first skip_tokens tokens
+    are dropped, and chunks are numbered from chunk_index. With skip_tokens
+    = chunk_index * (CHUNK_SIZE - CHUNK_OVERLAP) minus the tokens of the
+    pages left out, the chunks are the ones a full run would yield from
+    chunk_index on.
+    """
+    encoding = get_tokenizer()
+    chunk_index, skip, char_count = resume or (0, 0, 0)
+    tokens: list[int] = []
+    starts: list[int] = []  # global char offset of each token in `tokens`
+    page_index = _PageIndex()
+    has_pages = False
+    # tokens at the front of `tokens` already in a chunk
+    emitted_tail = CHUNK_OVERLAP if chunk_index else 0
+
+    def make_chunk(end: int, char_end: int) -> dict:
+        char_start = starts[0]
+        page_start, page_end = page_index.find(char_start, char_end) if has_pages else (None, None)
+        return {
+            "text": encoding.decode(tokens[:end]),
+            "source": filename,
+            "chunk_index": chunk_index,
+            "char_start": char_start,
+            "char_end": char_end,
+            "file_type": file_type,
+            "page_start": page_start,
+            "page_end": page_end,
+            "row_start": None,
+            "row_end": None,
+        }
+
+    for page_num, page_text in pages:
+        page_start_char = char_count
+        page_tokens = encoding.encode(page_text)
+        offsets = _token_char_offsets(page_text, page_tokens)
+        if on_page_tokens is not None:
+            on_page_tokens(len(page_tokens))
+        tokens.extend(page_tokens)
+        starts.extend((offsets[:-1] + page_start_char).tolist())
+        if skip:
+            del tokens[:skip]
+            del starts[:skip]
+            skip = 0
+        char_count += len(page_text)
+        if page_num is not None:
+            has_pages = True
+            page_index.add(page_num, page_start_char, char_count)
+
+        while len(tokens) >= CHUNK_SIZE:
+            char_end = starts[CHUNK_SIZE] if len(tokens) > CHUNK_SIZE else char_count
+            yield make_chunk(CHUNK_SIZE, char_end)
+            chunk_index += 1
+            del tokens[:CHUNK_SIZE - CHUNK_OVERLAP]
+            del starts[:CHUNK_SIZE - CHUNK_OVERLAP]
+            emitted_tail = CHUNK_OVERLAP
+
+    if len(tokens) > emitted_tail:
+        yield make_chunk(len(tokens), char_count)
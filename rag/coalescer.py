@@ -0,0 +1,90 @@
+"""Request coalescing: merge concurrent single-item calls into batched calls.
+
+Callers block on coalescer(item). A collector thread takes the first waiting
+item, keeps collecting until max_batch items or max_wait seconds, then
+hands the batch to fn(items) -> results on a small pool and fans the
+results back out. While every in-flight slot is busy the collector does not
+start a new batch, so under load batches fill up instead of queueing.
+"""
+
+from concurrent.futures import Future, ThreadPoolExecutor
+import queue
+import threading
+import time
+from typing import Callable
+
+
+class Coalescer:
+    def __init__(self, fn: Callable[[list], list], max_batch: int, max_wait: float, max_in_flight: int = 4):
+        self.fn = fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._slots = threading.Semaphore(max_in_flight)
+        self._pool = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="coalesce")
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._largest = 0
+        self._wait_total = 0.0  # seconds items spent queued before dispatch
+
+    def __call__(self, item):
+        return self.submit(item).result()
+
+    def submit(self, item) -> Future:
+        future: Future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._collect, name="coalescer", daemon=True)
+                    self._thread.start()
+        return future
+
+    def _collect(self) -> None:
+        while True:
+            self._slots.acquire()
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.perf_counter()
+                try:
+                    batch.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            now = time.perf_counter()
+            with self._lock:
+                self._batches += 1
+                self._items += len(batch)
+                self._largest = max(self._largest, len(batch))
+                self._wait_total += sum(now - queued for _, _, queued in batch)
+            self._pool.submit(self._dispatch, batch)
+
+    def _dispatch(self, batch: list) -> None:
+        try:
+            results = self.fn([item for item, _, _ in batch])
+        except BaseException as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+        else:
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+        finally:
+            self._slots.release()
+
+    def stats(self) -> dict:
+        """Batch fill: how many calls each dispatched batch absorbed."""
+        with self._lock:
+            mean = self._items / self._batches if self._batches else 0.0
+            return {
+                "batches": self._batches,
+                "items": self._items,
+                "calls_saved": self._items - self._batches,
+                "mean_batch_size": round(mean, 2),
+                "mean_fill": round(mean / self.max_batch, 3),
+                "largest_batch": self._largest,
+                "mean_wait_ms": round(1000 * self._wait_total / self._items, 2) if self._items else 0.0,
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait * 1000,
+            }
@@ -0,0 +1,216 @@
+"""Columnar storage for chunk metadata.
+
+A document's chunks are held as one column per key instead of one dict per
+chunk: int64 arrays for indices, offsets, pages and rows (None stored as a
+sentinel), dictionary-encoded codes for repeated strings such as source and
+file_type, and every chunk text in one UTF-8 buffer sliced by an offsets
+array. Query hits are ChunkViews, read-only mappings over one row, so
+returning a result copies nothing but the hit's text.
+"""
+
+from collections.abc import Mapping
+
+import numpy as np
+
+_NONE = np.iinfo(np.int64).min  # stands for None in integer columns
+
+
+class _IntColumn:
+    __slots__ = ("values",)
+
+    def __init__(self, values: np.ndarray):
+        self.values = values
+
+    @classmethod
+    def from_list(cls, items: list) -> "_IntColumn":
+        return cls(np.fromiter((_NONE if v is None else v for v in items), dtype=np.int64, count=len(items)))
+
+    def get(self, i: int) -> int | None:
+        v = self.values[i]
+        return None if v == _NONE else int(v)
+
+    def to_list(self) -> list:
+        return [None if v == _NONE else v for v in self.values.tolist()]
+
+    def concat(self, other):
+        if isinstance(other, _IntColumn):
+            return _IntColumn(np.concatenate((self.values, other.values)))
+        return None
+
+    @property
+    def nbytes(self) -> int:
+        return self.values.nbytes
+
+
+class _StrColumn:
+    """Dictionary-encoded strings: one small list of distinct values plus codes."""
+
+    __slots__ = ("categories", "codes")
+
+    def __init__(self, categories: list, codes: np.ndarray):
+        self.categories = categories
+        self.codes = codes
+
+    @classmethod
+    def from_list(cls, items: list) -> "_StrColumn":
+        lookup: dict = {}
+        codes = np.fromiter((lookup.setdefault(v, len(lookup)) for v in items), dtype=np.int32, count=len(items))
+        return cls(list(lookup), codes)
+
+    def get(self, i: int) -> str | None:
+        return self.categories[self.codes[i]]
+
+    def to_list(self) -> list:
+        return [self.categories[c] for c in self.codes.tolist()]
+
+    def concat(self, other):
+        if not isinstance(other, _StrColumn):
+            return None
+        lookup = {v: i for i, v in enumerate(self.categories)}
+        remap = np.array([lookup.setdefault(v, len(lookup)) for v in other.categories], dtype=np.int32)
+        return _StrColumn(list(lookup), np.concatenate((self.codes, remap[other.codes])))
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + sum(len(c or "") + 49 for c in self.categories)
+
+
+class _ObjectColumn:
+    """Fallback for values that are neither ints nor strings."""
+
+    __slots__ = ("values",)
+
+    def __init__(self, values: list):
+        self.values = values
+
+    @classmethod
+    def from_list(cls, items: list) -> "_ObjectColumn":
+        return cls(list(items))
+
+    def get(self, i: int):
+        return self.values[i]
+
+    def to_list(self) -> list:
+        return list(self.values)
+
+    def concat(self, other):
+        return _ObjectColumn(self.values + other.to_list())
+
+    @property
+    def nbytes(self) -> int:
+        return 64 * len(self.values)  # rough: pointer plus a small object
+
+
+def _column(items: list):
+    if all(v is None or (isinstance(v, int) and not isinstance(v, bool)) for v in items):
+        return _IntColumn.from_list(items)
+    if all(v is None or isinstance(v, str) for v in items):
+        return _StrColumn.from_list(items)
+    return _ObjectColumn.from_list(items)
+
+
+class ChunkView(Mapping):
+    """Read-only mapping over one row of a ChunkTable.
+
+    Behaves like the chunk dict it replaces (get, [], keys, dict(view)).
+    Metadata views leave out "text".
+    """
+
+    __slots__ = ("_table", "_row", "_with_text")
+
+    def __init__(self, table: "ChunkTable", row: int, with_text: bool):
+        self._table = table
+        self._row = row
+        self._with_text = with_text
+
+    def __getitem__(self, key: str):
+        if key == "text" and self._with_text:
+            return self._table.text(self._row)
+        column = self._table._columns.get(key)
+        if column is None:
+            raise KeyError(key)
+        return column.get(self._row)
+
+    def __iter__(self):
+        if self._with_text:
+            yield "text"
+        yield from self._table._columns
+
+    def __len__(self) -> int:
+        return len(self._table._columns) + self._with_text
+
+    def __repr__(self) -> str:
+        return f"ChunkView({dict(self)!r})"
+
+
+class ChunkTable:
+    """The chunks of one document, stored by column."""
+
+    def __init__(self, text: bytes, offsets: np.ndarray, columns: dict):
+        self._text = text  # all chunk texts, UTF-8, back to back
+        self._offsets = offsets  # chunk i is _text[_offsets[i]:_offsets[i + 1]]
+        self._columns = columns
+
+    @classmethod
+    def from_columns(cls, columns: dict[str, list]) -> "ChunkTable":
+        """Build from {key: values}; "text" is required."""
+        encoded = [t.encode("utf-8") for t in columns["text"]]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)), out=offsets[1:])
+        return cls(b"".join(encoded), offsets,
+                   {key: _column(values) for key, values in columns.items() if key != "text"})
+
+    @classmethod
+    def from_chunks(cls, chunks: list[dict]) -> "ChunkTable":
+        keys = dict.fromkeys(k for c in chunks for k in c)
+        keys.setdefault("text")
+        return cls.from_columns({k: [c.get(k) for c in chunks] for k in keys})
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, row: int) -> ChunkView:
+        return ChunkView(self, row, with_text=True)
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def text(self, row: int) -> str:
+        return self._text[self._offsets[row]:self._offsets[row + 1]].decode("utf-8")
+
+    def metadata(self, row: int) -> ChunkView:
+        """Every field of a chunk except its text."""
+        return ChunkView(self, row, with_text=False)
+
+    def ints(self, key: str) -> np.ndarray | None:
+        """An integer column as int64 (None stored as a sentinel).
+
+        None if the column is absent, not integers, or None on every row:
+        text and PDF chunks carry "row_start": None, for example.
+        """
+        column = self._columns.get(key)
+        if not isinstance(column, _IntColumn) or (column.values == _NONE).all():
+            return None
+        return column.values
+
+    def to_columns(self) -> dict[str, list]:
+        columns = {"text": [self.text(i) for i in range(len(self))]}
+        columns.update((key, column.to_list()) for key, column in self._columns.items())
+        return columns
+
+    def concat(self, other: "ChunkTable") -> "ChunkTable":
+        """A new table with other's rows after this one's."""
+        if list(self._columns) != list(other._columns):
+            return ChunkTable.from_chunks([dict(v) for v in self] + [dict(v) for v in other])
+        columns = {}
+        for key, column in self._columns.items():
+            merged = column.concat(other._columns[key])
+            if merged is None:  # kinds differ, e.g. ints then strings
+                merged = _column(column.to_list() + other._columns[key].to_list())
+            columns[key] = merged
+        offsets = np.concatenate((self._offsets, other._offsets[1:] + len(self._text)))
+        return ChunkTable(self._text + other._text, offsets, columns)
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._text) + self._offsets.nbytes + sum(c.nbytes for c in self._columns.values())
@@ -0,0 +1,102 @@
+"""Content-addressed cache for embedding vectors.
+
+Keys are sha256(model + text), so the same chunk text never costs a second
+API call — whether it comes from a re-uploaded PDF or boilerplate shared by
+many contracts. Two tiers:
+
+- memory: an LRU of float32 vectors (DOCUQUERY_EMBED_CACHE_SIZE entries)
+- disk (optional): a SQLite table at DOCUQUERY_EMBED_CACHE_PATH, which
+  survives restarts and is shared by every process pointing at it
+"""
+
+from collections import OrderedDict
+import hashlib
+import os
+import sqlite3
+import threading
+
+import numpy as np
+
+MEMORY_ENTRIES = int(os.environ.get("DOCUQUERY_EMBED_CACHE_SIZE", "10000"))
+DISK_PATH = os.environ.get("DOCUQUERY_EMBED_CACHE_PATH") or None
+
+
+def cache_key(model: str, text: str) -> bytes:
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    def __init__(self, max_entries: int = MEMORY_ENTRIES, path: str | None = DISK_PATH):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vec BLOB NOT NULL)")
+            self._db.commit()
+
+    def _remember(self, key: bytes, vec: np.ndarray) -> None:
+        self._memory[key] = vec
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get_many(self, model: str, texts: list[str]) -> list[np.ndarray | None]:
+        """Look up every text; misses come back as None.
+
+        Hits are the cached float32 vectors themselves: callers must not modify them.
+        """
+        keys = [cache_key(model, t) for t in texts]
+        found: dict[bytes, np.ndarray] = {}
+        with self._lock:
+            for key in keys:
+                vec = self._memory.get(key)
+                if vec is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vec
+
+            missing = [k for k in dict.fromkeys(keys) if k not in found]
+            if self._db is not None and missing:
+                # Stay well under SQLite's bound-parameter limit
+                for i in range(0, len(missing), 500):
+                    part = missing[i:i + 500]
+                    rows = self._db.execute(
+                        f"SELECT key, vec FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part)
+                    for key, blob in rows:
+                        vec = np.frombuffer(blob, dtype=np.float32)
+                        found[key] = vec
+                        self._remember(key, vec)
+
+            results = [found.get(k) for k in keys]
+            hits = sum(r is not None for r in results)
+            self.hits += hits
+            self.misses += len(results) - hits
+        return results
+
+    def put_many(self, model: str, texts: list[str], vectors) -> None:
+        rows = []
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                key = cache_key(model, text)
+                vec = np.asarray(vector, dtype=np.float32)
+                self._remember(key, vec)
+                rows.append((key, vec.tobytes()))
+            if self._db is not None and rows:
+                self._db.executemany("INSERT OR REPLACE INTO embeddings (key, vec) VALUES (?, ?)", rows)
+                self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "memory_entries": len(self._memory),
+                "disk": self._db is not None,
+            }
@@ -1,37 +1,275 @@
-from openai import OpenAI
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import os
+import random
+import time
+from typing import TYPE_CHECKING, Callable, Iterable, Mapping, Sequence
+
+import numpy as np
+
+from rag import local_embedder, metrics
+from rag.coalescer import Coalescer
+from rag.embed_cache import EmbeddingCache
+from rag.startup import get_openai
+
+if TYPE_CHECKING:
+    from openai import OpenAI
 
 MODEL = "text-embedding-3-small"
 
 _client = None
 
 
-def _get_client() -> OpenAI:
+def _get_client() -> "OpenAI":
     global _client
     if _client is None:
-        _client = OpenAI()
+        # Retries are handled per batch in _embed_batch
+        _client = get_openai().OpenAI(max_retries=0)
     return _client
 
 
-BATCH_SIZE = 50
+# Per-request limits of the embeddings API are 2048 inputs and 300k tokens.
+# Batches are sized by UTF-8 byte length, which is a free upper bound on the
+# token count (every token is at least one byte).
+MAX_BATCH_INPUTS = 256
+MAX_BATCH_TOKENS = 300_000
+MAX_CONCURRENCY = int(os.environ.get("DOCUQUERY_EMBED_CONCURRENCY", "4"))
+# Smaller batches for streamed ingestion, so the first request leaves early
+STREAM_BATCH_INPUTS = 64
 
+MAX_RETRIES = 5
+RETRY_BASE_DELAY = 0.5  # seconds, doubled on every attempt
 
-def embed_texts(texts: list[str]) -> list[list[float]]:
-    """Embed a list of texts using OpenAI text-embedding-3-small.
 
-    Processes in batches of 50 to avoid memory spikes on large documents.
-    Returns a list of embedding vectors.
-    """
+def _retryable_errors() -> tuple[type[Exception], ...]:
+    openai = get_openai()
+    return (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError, openai.InternalServerError)
+
+
+_cache = EmbeddingCache()
+
+
+def _batches(texts: list[str]) -> list[list[str]]:
+    """Group texts into batches under both per-request limits, in order."""
+    batches = []
+    current: list[str] = []
+    current_tokens = 0
+    for text in texts:
+        tokens = len(text.encode("utf-8"))
+        if current and (len(current) >= MAX_BATCH_INPUTS or current_tokens + tokens > MAX_BATCH_TOKENS):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _embed_batch(batch: list[str]) -> np.ndarray:
+    """Embed one batch, retrying with jittered exponential backoff; one float32 row per text."""
     client = _get_client()
-    all_embeddings = []
+    retryable = _retryable_errors()
+    t0 = time.perf_counter()
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            response = client.embeddings.create(model=MODEL, input=batch)
+            break
+        except retryable:
+            if attempt == MAX_RETRIES:
+                raise
+            time.sleep(RETRY_BASE_DELAY * 2 ** attempt * (0.5 + random.random()))
+    metrics.observe("embed_batch", time.perf_counter() - t0)
+    vectors = np.array([item.embedding for item in response.data], dtype=np.float32)
+    _cache.put_many(MODEL, batch, vectors)
+    return vectors
+
+
+def _embed_local_batch(batch: list[str]) -> np.ndarray:
+    """Embed one batch with the local backend, timed like an API request."""
+    t0 = time.perf_counter()
+    vectors = local_embedder.embed_batch(batch)
+    metrics.observe("embed_batch", time.perf_counter() - t0)
+    return vectors
+
+
+@dataclass(frozen=True)
+class Backend:
+    name: str  # recorded by the store with every index built from its vectors
+    embed_batch: Callable[[list[str]], np.ndarray]  # (len(texts), dim) float32
+    remote: bool  # remote backends are cached, retried and called concurrently
+
+
+BACKENDS = {
+    "openai": Backend(f"openai/{MODEL}", _embed_batch, remote=True),
+    "local": Backend(local_embedder.MODEL, _embed_local_batch, remote=False),
+}
+# Which backend embeds documents and questions: "openai" or "local".
+# Documents must be queried with the backend that indexed them.
+EMBED_BACKEND = os.environ.get("DOCUQUERY_EMBED_BACKEND", "openai")
+if EMBED_BACKEND not in BACKENDS:
+    raise ValueError(f"DOCUQUERY_EMBED_BACKEND must be one of {sorted(BACKENDS)}, got {EMBED_BACKEND!r}")
+
+
+def get_backend() -> Backend:
+    return BACKENDS[EMBED_BACKEND]
+
+
+def embed_texts(texts: list[str], on_embedded: Callable[[int], None] | None = None) -> np.ndarray:
+    """Embed a list of texts with the configured backend.
+
+    For OpenAI text-embedding-3-small, texts already in the embedding cache
+    cost nothing. The distinct misses are grouped into token-bounded batches
+    and sent concurrently (up to MAX_CONCURRENCY requests in flight). The
+    local backend is computed in place, batch by batch. Returns a float32
+    matrix with one row per text, in input order.
+
+    on_embedded(n) is called with the number of texts each time a batch (or
+    the set of cache hits) is ready; it may be called from worker threads.
+    """
+    backend = get_backend()
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+    if not backend.remote:
+        parts = []
+        for batch in _batches(texts):
+            parts.append(backend.embed_batch(batch))
+            if on_embedded is not None:
+                on_embedded(len(batch))
+        return np.concatenate(parts)
+
+    results = _cache.get_many(MODEL, texts)
+    misses = list(dict.fromkeys(t for t, r in zip(texts, results) if r is None))
+    if on_embedded is not None:
+        on_embedded(len(texts) - len(misses))
+    if not misses:
+        return np.array(results, dtype=np.float32)
+
+    def embed(batch: list[str]) -> np.ndarray:
+        vectors = backend.embed_batch(batch)
+        if on_embedded is not None:
+            on_embedded(len(batch))
+        return vectors
+
+    batches = _batches(misses)
+    if len(batches) == 1:
+        batch_vectors = [embed(batches[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=min(MAX_CONCURRENCY, len(batches))) as pool:
+            batch_vectors = list(pool.map(embed, batches))
+
+    fresh = {}
+    for batch, vectors in zip(batches, batch_vectors):
+        fresh.update(zip(batch, vectors))
+    return np.array([r if r is not None else fresh[t] for t, r in zip(texts, results)], dtype=np.float32)
+
+
+class _Rows:
+    """A float32 matrix filled by row position, grown by doubling as rows arrive."""
+
+    def __init__(self):
+        self.matrix: np.ndarray | None = None
+
+    def put(self, positions: list[int], rows) -> None:
+        rows = np.asarray(rows, dtype=np.float32).reshape(len(positions), -1)
+        needed = positions[-1] + 1
+        if self.matrix is None:
+            self.matrix = np.empty((max(needed, 4 * STREAM_BATCH_INPUTS), rows.shape[1]), dtype=np.float32)
+        elif needed > len(self.matrix):
+            grown = np.empty((max(needed, 2 * len(self.matrix)), self.matrix.shape[1]), dtype=np.float32)
+            grown[:len(self.matrix)] = self.matrix
+            self.matrix = grown
+        self.matrix[positions] = rows
+
+    def result(self, n: int) -> np.ndarray:
+        if self.matrix is None:
+            return np.zeros((0, 0), dtype=np.float32)
+        return self.matrix[:n]
+
+
+def embed_chunk_stream(chunks: Iterable[dict],
+                       on_embedded: Callable[[int], None] | None = None,
+                       known: Mapping[str, Sequence[float]] | None = None) -> tuple[list[dict], np.ndarray]:
+    """Embed chunks while they are still being produced.
+
+    Every STREAM_BATCH_INPUTS chunks are handed to the worker pool straight
+    away, so the first embedding requests are in flight while later pages are
+    still being parsed. Chunks whose text is in `known` take that vector
+    instead of being embedded. Returns (chunks, float32 vectors) in stream
+    order; finished batches are copied into the matrix as the stream goes,
+    so memory stays at about 4 bytes per dimension per chunk.
+    """
+    collected: list[dict] = []
+    vectors = _Rows()
+    futures: deque = deque()
+    batch: list[str] = []
+    positions: list[int] = []
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENCY) as pool:
+        for chunk in chunks:
+            collected.append(chunk)
+            vector = known.get(chunk["text"]) if known else None
+            if vector is not None:
+                vectors.put([len(collected) - 1], vector)
+                if on_embedded is not None:
+                    on_embedded(1)
+                continue
+            batch.append(chunk["text"])
+            positions.append(len(collected) - 1)
+            if len(batch) >= STREAM_BATCH_INPUTS:
+                futures.append((positions, pool.submit(embed_texts, batch, on_embedded)))
+                batch, positions = [], []
+            while futures and futures[0][1].done():
+                batch_positions, future = futures.popleft()
+                vectors.put(batch_positions, future.result())
+        if batch:
+            futures.append((positions, pool.submit(embed_texts, batch, on_embedded)))
+        for batch_positions, future in futures:
+            vectors.put(batch_positions, future.result())
+    return collected, vectors.result(len(collected))
+
+
+def _embed_query_batch(queries: list[str]) -> list[np.ndarray]:
+    """One embeddings request for a coalesced batch of questions."""
+    unique = list(dict.fromkeys(queries))
+    vectors = dict(zip(unique, get_backend().embed_batch(unique)))
+    return [vectors[q] for q in queries]
+
+
+# Concurrent embed_query calls arriving within QUERY_BATCH_WAIT_MS of each
+# other share one embeddings request, up to QUERY_BATCH_SIZE questions.
+# A batch size of 1 sends every question on its own.
+QUERY_BATCH_SIZE = min(int(os.environ.get("DOCUQUERY_QUERY_BATCH_SIZE", "32")), MAX_BATCH_INPUTS)
+QUERY_BATCH_WAIT_MS = float(os.environ.get("DOCUQUERY_QUERY_BATCH_WAIT_MS", "5"))
+_query_coalescer = Coalescer(_embed_query_batch, QUERY_BATCH_SIZE, QUERY_BATCH_WAIT_MS / 1000,
+                             max_in_flight=MAX_CONCURRENCY)
+
+
+def embed_query(query: str) -> np.ndarray:
+    """Embed a single query string.
+
+    Cached questions return at once; the others wait up to
+    QUERY_BATCH_WAIT_MS to share a request with concurrent questions.
+    """
+    backend = get_backend()
+    if QUERY_BATCH_SIZE <= 1 or not backend.remote:
+        return embed_texts([query])[0]
+    cached = _cache.get_many(MODEL, [query])[0]
+    if cached is not None:
+        return cached
+    return _query_coalescer(query)
+
+
+def embed_queries(queries: list[str]) -> np.ndarray:
+    """Embed many query strings; up to MAX_BATCH_INPUTS go in one request."""
+    return embed_texts(queries)
 
-    for i in range(0, len(texts), BATCH_SIZE):
-        batch = texts[i : i + BATCH_SIZE]
-        response = client.embeddings.create(model=MODEL, input=batch)
-        all_embeddings.extend(item.embedding for item in response.data)
 
-    return all_embeddings
+def cache_stats() -> dict:
+    """Hit/miss counters of the embedding cache."""
+    return _cache.stats()
 
 
-def embed_query(query: str) -> list[float]:
-    """Embed a single query string."""
-    return embed_texts([query])[0]
+def coalescer_stats() -> dict:
+    """Batch fill of coalesced query embeddings."""
+    return _query_coalescer.stats()
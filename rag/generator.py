@@ -1,14 +1,26 @@
-from openai import OpenAI
+import os
+import time
+from typing import TYPE_CHECKING
+
+from rag.metrics import Timings
+from rag.startup import get_openai, get_tokenizer
+
+if TYPE_CHECKING:
+    from openai import OpenAI
 
 MODEL = "gpt-4o-mini"
 
+# Token budget for the packed context. The best chunk is always sent, even
+# if it alone is over budget.
+PROMPT_TOKEN_BUDGET = int(os.environ.get("DOCUQUERY_PROMPT_TOKEN_BUDGET", "4000"))
+
 _client = None
 
 
-def _get_client() -> OpenAI:
+def _get_client() -> "OpenAI":
     global _client
     if _client is None:
-        _client = OpenAI()
+        _client = get_openai().OpenAI()
     return _client
 
 
@@ -31,6 +43,9 @@ def _format_chunk_header(meta: dict) -> str:
     file_type = meta.get("file_type", "txt")
     source = meta["source"]
     chunk_idx = meta["chunk_index"]
+    last_idx = meta.get("chunk_index_end", chunk_idx)
+    if last_idx != chunk_idx:  # packed run of neighbouring chunks
+        chunk_idx = f"{chunk_idx}-{last_idx}"
 
     if file_type == "pdf":
         page_start = meta.get("page_start")
@@ -63,21 +78,107 @@ def _add_paragraph_markers(text: str) -> str:
     return "\n\n".join(f"[P{i+1}] {p}" for i, p in enumerate(paragraphs))
 
 
-def generate_answer(question: str, search_results: dict) -> str:
-    """Generate an answer with citations using GPT-4o-mini."""
+def _can_join(prev: dict, nxt: dict) -> bool:
+    """True if chunk `nxt` continues or overlaps `prev` (sorted by position)."""
+    a, b = prev["meta"], nxt["meta"]
+    if a["source"] != b["source"] or a.get("file_type") != b.get("file_type"):
+        return False
+    if a.get("file_type") == "csv":
+        return (a.get("row_end") is not None and b.get("row_start") == a["row_end"] + 1
+                and prev["text"].split("\n\n", 1)[0] == nxt["text"].split("\n\n", 1)[0])
+    # Char offsets must describe the text exactly for the overlap cut to be safe
+    return (b["char_start"] <= a["char_end"]
+            and len(prev["text"]) == a["char_end"] - a["char_start"]
+            and len(nxt["text"]) == b["char_end"] - b["char_start"])
+
+
+def _join(prev: dict, nxt: dict) -> dict:
+    """Merge two joinable chunks, dropping the duplicated span."""
+    a, b = prev["meta"], nxt["meta"]
+    meta = dict(a, chunk_index_end=max(a.get("chunk_index_end", a["chunk_index"]),
+                                       b.get("chunk_index_end", b["chunk_index"])))
+    if a.get("file_type") == "csv":
+        # Same header line; keep it once
+        text = prev["text"] + "\n" + nxt["text"].split("\n\n", 1)[1]
+        meta["row_end"] = b["row_end"]
+    elif b["char_end"] <= a["char_end"]:
+        text = prev["text"]  # fully contained
+    else:
+        text = prev["text"] + nxt["text"][a["char_end"] - b["char_start"]:]
+        meta["char_end"] = b["char_end"]
+        meta["page_end"] = b.get("page_end") or a.get("page_end")
+    return {"text": text, "meta": meta, "rank": min(prev["rank"], nxt["rank"])}
+
+
+def _merge_neighbours(items: list[dict]) -> list[dict]:
+    """Merge overlapping/adjacent chunks per source; blocks ordered by best rank."""
+    def position(item):
+        m = item["meta"]
+        return (m["source"], m.get("file_type") or "", m.get("row_start") or 0, m["char_start"])
+
+    blocks: list[dict] = []
+    for item in sorted(items, key=position):
+        if blocks and _can_join(blocks[-1], item):
+            blocks[-1] = _join(blocks[-1], item)
+        else:
+            blocks.append(item)
+    return sorted(blocks, key=lambda b: b["rank"])
+
+
+def _render_block(block: dict) -> str:
+    return f"{_format_chunk_header(block['meta'])}\n{_add_paragraph_markers(block['text'])}"
+
+
+def pack_context(documents: list[str], metadatas: list[dict],
+                 budget: int = PROMPT_TOKEN_BUDGET) -> str:
+    """Assemble the prompt context from retrieved chunks under a token budget.
+
+    Chunks are taken in relevance order. Neighbouring chunks of the same
+    source are merged into one block, so their 100-token overlaps (or
+    repeated CSV header lines) are sent once. A chunk whose addition would
+    push the context over `budget` tokens is skipped. Blocks are emitted
+    most relevant first, each with a citation header covering its full
+    page/row/char range.
+    """
+    items = [{"text": doc, "meta": meta, "rank": rank}
+             for rank, (doc, meta) in enumerate(zip(documents, metadatas))]
+    token_cache: dict[str, int] = {}
+
+    def cost(blocks: list[dict]) -> int:
+        total = 0
+        for block in blocks:
+            rendered = _render_block(block)
+            if rendered not in token_cache:
+                token_cache[rendered] = len(get_tokenizer().encode_ordinary(rendered))
+            total += token_cache[rendered] + 1  # separator
+        return total
+
+    selected: list[dict] = []
+    for item in items:
+        candidate = selected + [item]
+        if not selected or cost(_merge_neighbours(candidate)) <= budget:
+            selected = candidate
+
+    return "\n\n".join(_render_block(b) for b in _merge_neighbours(selected))
+
+
+def generate_answer(question: str, search_results: dict, timings: Timings | None = None) -> str:
+    """Generate an answer with citations using GPT-4o-mini.
+
+    The completion is streamed so that time-to-first-token can be recorded
+    on `timings` (llm_ttft), along with prompt_build and the full llm call.
+    """
+    timings = timings if timings is not None else Timings()
     documents = search_results["documents"][0]
     metadatas = search_results["metadatas"][0]
 
     # Build context from retrieved chunks
-    context_parts = []
-    for doc, meta in zip(documents, metadatas):
-        header = _format_chunk_header(meta)
-        marked_doc = _add_paragraph_markers(doc)
-        context_parts.append(f"{header}\n{marked_doc}")
-    context = "\n\n".join(context_parts)
+    with timings.stage("prompt_build"):
+        context = pack_context(documents, metadatas)
 
     client = _get_client()
-    response = client.chat.completions.create(
+    t0 = time.perf_counter()
+    stream = client.chat.completions.create(
         model=MODEL,
         max_tokens=1024,
         messages=[
@@ -87,5 +188,13 @@ def generate_answer(question: str, search_results: dict) -> str:
                 "content": f"Context:\n{context}\n\nQuestion: {question}",
             },
         ],
+        stream=True,
     )
-    return response.choices[0].message.content
+    parts = []
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            if not parts:
+                timings.record("llm_ttft", time.perf_counter() - t0)
+            parts.append(chunk.choices[0].delta.content)
+    timings.record("llm", time.perf_counter() - t0)
+    return "".join(parts)
@@ -0,0 +1,223 @@
+"""Background ingestion jobs with per-stage progress.
+
+/upload submits a job and returns its id at once. The work runs on a small
+thread pool, off the event loop, while GET /jobs/{id} reads its progress.
+
+With DOCUQUERY_STORE_DIR set, every job is also mirrored to a JSON file
+under it, so whichever API worker a status request lands on can answer it.
+Files are pruned at startup and whenever pending_for scans the directory:
+any older than JOB_FILE_TTL go, and of those no longer being written, all
+but the newest MAX_FINISHED_JOBS, whichever worker or process lifetime
+wrote them.
+"""
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+INGEST_WORKERS = int(os.environ.get("DOCUQUERY_INGEST_WORKERS", "2"))
+MAX_FINISHED_JOBS = 1000  # finished jobs kept for status lookups
+
+# "." keeps the directory out of the store's session namespace
+_STORE_DIR = os.environ.get("DOCUQUERY_STORE_DIR") or None
+JOBS_DIR = os.path.join(_STORE_DIR, ".jobs") if _STORE_DIR else None
+SAVE_INTERVAL = 0.5  # seconds between mirrored progress counters
+STALE_AFTER = 300  # seconds without a write before another worker's unfinished job is presumed dead
+JOB_FILE_TTL = 24 * 3600  # seconds a mirrored job file is kept at most
+_JOB_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+# Parsing and chunking are streamed together; "embedding" means every page
+# has been read and only embedding requests are still in flight.
+QUEUED, PARSING, EMBEDDING, READY, FAILED = "queued", "parsing", "embedding", "ready", "failed"
+
+
+@dataclass
+class Job:
+    session_id: str
+    document_id: str
+    filename: str
+    job_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = QUEUED
+    file_type: str | None = None
+    pages_total: int | None = None
+    pages_parsed: int = 0
+    chunks_total: int | None = None
+    chunks_embedded: int = 0
+    chunks_reused: int = 0  # of chunks_embedded, vectors kept from the previous revision
+    error: str | None = None
+    timings: dict[str, float] | None = None  # seconds per stage, once ready
+    created_at: float = field(default_factory=time.time)
+    finished_at: float | None = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in (READY, FAILED)
+
+    def update(self, **fields) -> None:
+        with _lock:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            if self.done and self.finished_at is None:
+                self.finished_at = time.time()
+        _save(self)
+
+    def advance(self, name: str, n: int = 1) -> None:
+        """Increment a progress counter; safe to call from worker threads."""
+        with _lock:
+            setattr(self, name, getattr(self, name) + n)
+        _save(self, throttle=True)
+
+    def to_dict(self) -> dict:
+        with _lock:
+            return asdict(self)
+
+
+_jobs: "OrderedDict[str, Job]" = OrderedDict()
+_lock = threading.Lock()
+_saved_at: dict[str, float] = {}  # job_id -> when it was last mirrored
+_executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="ingest")
+
+
+def _job_path(job_id: str) -> str:
+    return os.path.join(JOBS_DIR, f"{job_id}.json")
+
+
+def _save(job: Job, throttle: bool = False) -> None:
+    """Mirror a job to JOBS_DIR; throttled writes are skipped if one was recent."""
+    if JOBS_DIR is None:
+        return
+    now = time.monotonic()
+    with _lock:
+        if throttle and now - _saved_at.get(job.job_id, 0.0) < SAVE_INTERVAL:
+            return
+        _saved_at[job.job_id] = now
+        state = asdict(job)
+    tmp = f"{_job_path(job.job_id)}.tmp-{threading.get_ident()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp, _job_path(job.job_id))
+
+
+def _load(path: str) -> Job | None:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return Job(**json.load(f))
+    except (FileNotFoundError, ValueError, TypeError):
+        return None
+
+
+def _prune(entries: list[tuple[float, str]]) -> None:
+    """Remove expired job files and cap the rest; entries are (mtime, path) of every file in JOBS_DIR."""
+    now = time.time()
+    with _lock:
+        running = {jid for jid, j in _jobs.items() if not j.done}
+    # Files written within STALE_AFTER may belong to jobs still running somewhere
+    idle = sorted(((mtime, path) for mtime, path in entries if mtime < now - STALE_AFTER), reverse=True)
+    keep = MAX_FINISHED_JOBS - (len(entries) - len(idle))
+    for i, (mtime, path) in enumerate(idle):
+        if i < keep and mtime >= now - JOB_FILE_TTL and path.endswith(".json"):  # else expired or a dead .tmp
+            continue
+        if os.path.basename(path)[:32] in running:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:  # another worker pruned it first
+            pass
+
+
+def _scan() -> list[tuple[float, str]]:
+    entries = []
+    for entry in os.scandir(JOBS_DIR):
+        try:
+            entries.append((entry.stat().st_mtime, entry.path))
+        except FileNotFoundError:
+            pass
+    return entries
+
+
+def prune() -> None:
+    """Apply JOB_FILE_TTL and the MAX_FINISHED_JOBS cap to JOBS_DIR."""
+    if JOBS_DIR is not None:
+        _prune(_scan())
+
+
+def register(job: Job) -> Job:
+    """Make a job visible to get(); submit() does this for you."""
+    with _lock:
+        _jobs[job.job_id] = job
+        finished = [jid for jid, j in _jobs.items() if j.done]
+        dropped = finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]
+        for jid in dropped:
+            del _jobs[jid]
+            _saved_at.pop(jid, None)
+    _save(job)
+    for jid in dropped if JOBS_DIR is not None else ():
+        try:
+            os.remove(_job_path(jid))
+        except FileNotFoundError:
+            pass
+    return job
+
+
+def submit(job: Job, fn, *args) -> Job:
+    """Register a job and run fn(job, *args) in the background.
+
+    An exception raised by fn marks the job as failed with its message.
+    """
+    register(job)
+
+    def run():
+        try:
+            fn(job, *args)
+        except Exception as e:
+            job.update(status=FAILED, error=str(e))
+
+    _executor.submit(run)
+    return job
+
+
+def get(job_id: str) -> Job | None:
+    """A job of this process, or a snapshot of one mirrored by another worker."""
+    with _lock:
+        job = _jobs.get(job_id)
+    if job is None and JOBS_DIR is not None and _JOB_ID_RE.match(job_id):
+        job = _load(_job_path(job_id))
+    return job
+
+
+def pending_for(session_id: str, document_id: str) -> Job | None:
+    """Return the unfinished job building (session_id, document_id), if any.
+
+    Other workers' jobs are found by scanning JOBS_DIR, so this is meant for
+    the rare case where the document is not in the store yet.
+    """
+    with _lock:
+        for job in _jobs.values():
+            if job.session_id == session_id and job.document_id == document_id and not job.done:
+                return job
+    if JOBS_DIR is None:
+        return None
+    entries = _scan()
+    cutoff = time.time() - STALE_AFTER
+    found = None
+    for mtime, path in entries:
+        if not path.endswith(".json") or mtime < cutoff:
+            continue
+        job = _load(path)
+        if job is not None and job.session_id == session_id and job.document_id == document_id and not job.done:
+            found = job
+            break
+    if len(entries) > MAX_FINISHED_JOBS or any(mtime < time.time() - JOB_FILE_TTL for mtime, _ in entries):
+        _prune(entries)
+    return found
+
+
+if JOBS_DIR is not None:
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    prune()
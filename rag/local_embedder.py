@@ -0,0 +1,57 @@
+"""Local CPU embeddings: signed feature hashing of character n-grams.
+
+No network, no fee, no model download. Each text is lower-cased and its
+byte 3-, 4- and 5-grams are hashed into DIM signed buckets; counts are
+damped with log1p and rows are L2-normalized. A whole batch is hashed at
+once with NumPy, so the cost is a few array passes over its bytes.
+
+Retrieval is lexical (shared substrings, robust to inflections and typos)
+rather than semantic, which suits exact lookups in contracts and exports.
+"""
+
+import os
+
+import numpy as np
+
+DIM = int(os.environ.get("DOCUQUERY_LOCAL_EMBED_DIM", "1024"))
+NGRAM_SIZES = (3, 4, 5)
+MODEL = f"local/hash-ngram-{DIM}"
+
+_PRIME = np.uint64(0x100000001B3)
+_MIX = np.uint64(0xFF51AFD7ED558CCD)
+
+
+def embed_matrix(texts: list[str]) -> np.ndarray:
+    """Return a (len(texts), DIM) float32 matrix with unit-length rows."""
+    # Pad with spaces so word starts and ends form their own n-grams
+    encoded = [f" {' '.join(t.lower().split())} ".encode("utf-8") for t in texts]
+    lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+    data = np.frombuffer(b"".join(encoded), dtype=np.uint8).astype(np.uint64)
+    owner = np.repeat(np.arange(len(texts), dtype=np.int64), lengths)
+
+    counts = np.zeros(len(texts) * DIM, dtype=np.float64)
+    for n in NGRAM_SIZES:
+        m = len(data) - n + 1
+        if m <= 0:
+            continue
+        h = np.full(m, n, dtype=np.uint64)  # seeded by n, so sizes hash apart
+        for j in range(n):
+            h = h * _PRIME + data[j:j + m]  # wraps mod 2**64
+        same_text = owner[:m] == owner[n - 1:n - 1 + m]
+        h, rows = h[same_text], owner[:m][same_text]
+        h ^= h >> np.uint64(33)
+        h *= _MIX
+        h ^= h >> np.uint64(33)
+        buckets = (h % np.uint64(DIM)).astype(np.int64)
+        signs = np.where(h >> np.uint64(63), -1.0, 1.0)
+        counts += np.bincount(rows * DIM + buckets, weights=signs, minlength=len(counts))
+
+    matrix = counts.reshape(len(texts), DIM)
+    matrix = (np.sign(matrix) * np.log1p(np.abs(matrix))).astype(np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def embed_batch(texts: list[str]) -> np.ndarray:
+    return embed_matrix(texts)
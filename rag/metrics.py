@@ -0,0 +1,108 @@
+"""Latency histograms for the hot path, exported in Prometheus text format.
+
+Every stage duration is observed into a process-wide histogram labelled by
+stage (served by GET /metrics), and a per-request Timings object keeps the
+same durations for the response's own breakdown.
+
+Stages: parse, chunk, embed, index, ingest_total for uploads; query_embed,
+search, prompt_build, llm_ttft, llm, query_total for queries; batch_embed,
+batch_search, batch_generate, batch_total for /query/batch; embed_batch
+for every embeddings API request or local backend batch; event_loop_lag, how late the API's event
+loop woke up from each check (its sum is the total stall time).
+"""
+
+import bisect
+from contextlib import contextmanager
+import math
+import threading
+import time
+from typing import Iterable, Iterator
+
+METRIC_NAME = "docuquery_stage_seconds"
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, math.inf)
+
+
+class _Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)  # per bucket, made cumulative on render
+        self.sum = 0.0
+        self.count = 0
+
+
+_histograms: dict[str, _Histogram] = {}
+_lock = threading.Lock()
+
+
+def observe(stage: str, seconds: float) -> None:
+    """Record one duration; safe to call from worker threads."""
+    with _lock:
+        hist = _histograms.get(stage)
+        if hist is None:
+            hist = _histograms[stage] = _Histogram()
+        hist.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        hist.sum += seconds
+        hist.count += 1
+
+
+def render() -> str:
+    """All histograms in the Prometheus text exposition format."""
+    lines = [f"# HELP {METRIC_NAME} Time spent in each pipeline stage.",
+             f"# TYPE {METRIC_NAME} histogram"]
+    with _lock:
+        for stage in sorted(_histograms):
+            hist = _histograms[stage]
+            cumulative = 0
+            for le, n in zip(BUCKETS, hist.counts):
+                cumulative += n
+                bound = "+Inf" if le == math.inf else repr(le)
+                lines.append(f'{METRIC_NAME}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{METRIC_NAME}_sum{{stage="{stage}"}} {hist.sum:.6f}')
+            lines.append(f'{METRIC_NAME}_count{{stage="{stage}"}} {hist.count}')
+    return "\n".join(lines) + "\n"
+
+
+class Timings:
+    """Stage durations of one request; every record also feeds the histograms."""
+
+    def __init__(self):
+        self.stages: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        observe(stage, seconds)
+
+    @contextmanager
+    def stage(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - t0)
+
+    def to_dict(self) -> dict[str, float]:
+        """Seconds per stage, rounded to the millisecond."""
+        with self._lock:
+            return {name: round(seconds, 3) for name, seconds in self.stages.items()}
+
+
+def timed_iter(items: Iterable, on_done) -> Iterator:
+    """Yield from items, then call on_done(seconds spent producing them).
+
+    Only the time inside the producer counts, not the time the consumer
+    spends between items, so a lazily parsed stream can be measured without
+    collecting it first.
+    """
+    spent = 0.0
+    iterator = iter(items)
+    while True:
+        t0 = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            spent += time.perf_counter() - t0
+            break
+        spent += time.perf_counter() - t0
+        yield item
+    on_done(spent)
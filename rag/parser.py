@@ -1,38 +1,66 @@
 """File parser module — routes uploaded files to the correct parser."""
 
+import codecs
+from concurrent.futures import ProcessPoolExecutor
+import csv
 from dataclasses import dataclass, field
 import io
+import math
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+from typing import Callable, Iterator
 
-import pdfplumber
-import tiktoken
+from rag.startup import get_pdfplumber, get_tokenizer
 
-ENCODING = tiktoken.get_encoding("cl100k_base")
 CSV_CHUNK_TOKEN_LIMIT = 400
+# Rows are read in blocks. Token counts are exact for the first block, which
+# also calibrates a tokens-per-char estimate for the rest of the file, since
+# tokenizing every row of a 1M-row export would dominate ingest time.
+CSV_ROW_BLOCK = 2048
+CSV_TOKEN_ESTIMATE_MARGIN = 1.1
+CSV_READ_BLOCK_BYTES = 1 << 20
 SUPPORTED_EXTENSIONS = {"txt", "pdf", "csv"}
 
+# Processes used to extract PDF text; 1 keeps extraction in-process.
+PDF_WORKERS = int(os.environ.get("DOCUQUERY_PDF_WORKERS", "1"))
+PDF_PARALLEL_MIN_PAGES = 16  # below this, pool overhead outweighs the gain
+PDF_PAGES_PER_TASK = 8
+
+_pdf_pool: ProcessPoolExecutor | None = None
+_pdf_pool_lock = threading.Lock()
+
 
 @dataclass
 class ParseResult:
-    text: str
+    text: str  # "" for CSV, whose rows are streamed straight into chunks
     filename: str
     file_type: str  # "txt", "pdf", "csv"
     page_map: list[tuple[int, int, int]] | None = None  # [(page_num, char_start, char_end)]
     chunks: list[dict] | None = None  # Pre-built chunks for CSV
 
 
-def parse_file(uploaded_file) -> ParseResult | None:
+def file_extension(filename: str) -> str:
+    """Lower-cased extension without the dot, or "" if there is none."""
+    return filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+
+
+def parse_file(uploaded_file, on_page: Callable[[int, int], None] | None = None) -> ParseResult | None:
     """Route an uploaded file to the appropriate parser based on extension.
 
+    on_page(pages_done, pages_total) is called after each PDF page.
     Returns None if the file type is unsupported.
     """
     filename = uploaded_file.name
-    ext = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+    ext = file_extension(filename)
 
     if ext not in SUPPORTED_EXTENSIONS:
         return None
 
     if ext == "pdf":
-        return _parse_pdf(uploaded_file, filename)
+        return _parse_pdf(uploaded_file, filename, on_page)
     elif ext == "csv":
         return _parse_csv(uploaded_file, filename)
     else:
@@ -49,24 +77,93 @@ def _parse_txt(uploaded_file, filename: str) -> ParseResult:
     return ParseResult(text=text, filename=filename, file_type="txt")
 
 
-def _parse_pdf(uploaded_file, filename: str) -> ParseResult:
-    """Parse a PDF file, extracting text page-by-page with a page_map."""
+def _page_text(page) -> str:
+    """Extract one page's text, newline-terminated if non-empty."""
+    page_text = page.extract_text() or ""
+    if page_text and not page_text.endswith("\n"):
+        page_text += "\n"
+    # Release pdfplumber's per-page layout cache as we go
+    page.flush_cache()
+    return page_text
+
+
+def _extract_page_range(path: str, start: int, stop: int) -> list[str]:
+    """Worker task: text of pages [start, stop) of the PDF at path."""
+    with get_pdfplumber().open(path) as pdf:
+        return [_page_text(pdf.pages[i]) for i in range(start, stop)]
+
+
+def _get_pdf_pool(workers: int) -> ProcessPoolExecutor:
+    """Shared process pool, created on first use.
+
+    Uses spawn so workers never inherit the server's threads or locks.
+    """
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            _pdf_pool = ProcessPoolExecutor(max_workers=workers,
+                                            mp_context=multiprocessing.get_context("spawn"))
+        return _pdf_pool
+
+
+def _iter_pages_parallel(pdf_bytes: bytes, n_pages: int, workers: int) -> Iterator[str]:
+    """Yield page texts in order, extracted by a process pool in page ranges.
+
+    Workers read the PDF from a temp file rather than receiving its bytes.
+    """
+    with tempfile.NamedTemporaryFile(suffix=".pdf") as tmp:
+        tmp.write(pdf_bytes)
+        tmp.flush()
+        pool = _get_pdf_pool(workers)
+        futures = [pool.submit(_extract_page_range, tmp.name, start, min(start + PDF_PAGES_PER_TASK, n_pages))
+                   for start in range(0, n_pages, PDF_PAGES_PER_TASK)]
+        try:
+            for future in futures:
+                yield from future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+def iter_pdf_pages(uploaded_file,
+                   on_page: Callable[[int, int], None] | None = None,
+                   workers: int | None = None) -> Iterator[tuple[int, str]]:
+    """Yield (page_number, page_text) for each page of a PDF, 1-indexed.
+
+    Non-empty page text always ends with a newline. Pages are extracted
+    lazily, so consumers can start chunking before the whole file is read.
+    With workers > 1 (default PDF_WORKERS), long PDFs are split into page
+    ranges across a process pool; output is identical to the serial path.
+    """
+    workers = PDF_WORKERS if workers is None else workers
     uploaded_file.seek(0)
-    pdf_bytes = io.BytesIO(uploaded_file.read())
+    pdf_bytes = uploaded_file.read()
+
+    with get_pdfplumber().open(io.BytesIO(pdf_bytes)) as pdf:
+        n_pages = len(pdf.pages)
+        if workers > 1 and n_pages >= PDF_PARALLEL_MIN_PAGES:
+            texts = _iter_pages_parallel(pdf_bytes, n_pages, workers)
+        else:
+            texts = (_page_text(page) for page in pdf.pages)
+        for i, page_text in enumerate(texts):
+            yield i + 1, page_text
+            if on_page is not None:
+                on_page(i + 1, n_pages)
 
+
+def _parse_pdf(uploaded_file, filename: str,
+               on_page: Callable[[int, int], None] | None = None,
+               workers: int | None = None) -> ParseResult:
+    """Parse a PDF file, extracting text page-by-page with a page_map."""
     pages_text: list[str] = []
     page_map = []  # (page_number, char_start, char_end)
     char_count = 0
 
-    with pdfplumber.open(pdf_bytes) as pdf:
-        for i, page in enumerate(pdf.pages):
-            page_text = page.extract_text() or ""
-            if page_text and not page_text.endswith("\n"):
-                page_text += "\n"
-            char_start = char_count
-            pages_text.append(page_text)
-            char_count += len(page_text)
-            page_map.append((i + 1, char_start, char_count))  # 1-indexed page numbers
+    for page_num, page_text in iter_pdf_pages(uploaded_file, on_page, workers):
+        char_start = char_count
+        pages_text.append(page_text)
+        char_count += len(page_text)
+        page_map.append((page_num, char_start, char_count))
 
     # Single join at the end — avoids O(n^2) string concatenation
     full_text = "".join(pages_text)
@@ -83,102 +180,150 @@ def _parse_pdf(uploaded_file, filename: str) -> ParseResult:
     )
 
 
-def _parse_csv(uploaded_file, filename: str) -> ParseResult:
-    """Parse a CSV file, converting rows to prose and grouping into chunks."""
+def _detect_encoding(uploaded_file) -> str:
+    """Return "utf-8" if the whole file decodes as UTF-8, else "latin-1".
+
+    Streams the file through an incremental decoder, so it costs one cheap
+    pass and no extra memory; the file is rewound afterwards.
+    """
     uploaded_file.seek(0)
-    raw = uploaded_file.read()
+    decoder = codecs.getincrementaldecoder("utf-8")()
     try:
-        content = raw.decode("utf-8")
+        while block := uploaded_file.read(CSV_READ_BLOCK_BYTES):
+            decoder.decode(block)
+        decoder.decode(b"", final=True)
+        return "utf-8"
     except UnicodeDecodeError:
-        content = raw.decode("latin-1")
+        return "latin-1"
+    finally:
+        uploaded_file.seek(0)
+
+
+def _csv_chunk(filename: str, chunk_index: int, header_str: str, rows: list[tuple[int, str]]) -> dict:
+    return {
+        "text": header_str + "\n".join(r for _, r in rows),
+        "source": filename,
+        "chunk_index": chunk_index,
+        "char_start": 0,
+        "char_end": 0,
+        "file_type": "csv",
+        "page_start": None,
+        "page_end": None,
+        "row_start": rows[0][0],
+        "row_end": rows[-1][0],
+    }
+
+
+def iter_csv_chunks(uploaded_file, filename: str) -> Iterator[dict]:
+    """Stream a CSV file into prose chunks under CSV_CHUNK_TOKEN_LIMIT.
+
+    Rows are read with the csv module (so quoted commas and newlines work)
+    and never all held in memory. Row token counts are exact for the first
+    CSV_ROW_BLOCK rows and estimated from their tokens-per-char ratio after
+    that. Yields nothing if the file has no data rows.
+    """
+    encoding = _detect_encoding(uploaded_file)
+    reader = csv.reader(_iter_text_lines(uploaded_file, encoding))
+    header_row = next(reader, None)
+    if header_row is None:
+        return
+    headers = [h.strip() for h in header_row]
+    header_str = "Headers: " + ", ".join(headers) + "\n\n"
+    tokenizer = get_tokenizer()
+    header_tokens = len(tokenizer.encode_ordinary(header_str))
 
-    lines = content.strip().split("\n")
-    if len(lines) < 2:
-        return ParseResult(text=content, filename=filename, file_type="txt")
+    chunk_index = 0
+    current_rows: list[tuple[int, str]] = []
+    current_tokens = header_tokens
+    row_idx = 0
+    tokens_per_char = None
+
+    for block in _row_blocks(reader, CSV_ROW_BLOCK):
+        prose_rows = []
+        for values in block:
+            row_idx += 1
+            parts = [f"{h}={v.strip()}" for h, v in zip(headers, values)]
+            prose_rows.append((row_idx, f"Row {row_idx}: {', '.join(parts)}"))
+
+        if tokens_per_char is None:
+            token_counts = [len(tokenizer.encode_ordinary(p + "\n")) for _, p in prose_rows]
+            chars = sum(len(p) + 1 for _, p in prose_rows)
+            tokens_per_char = CSV_TOKEN_ESTIMATE_MARGIN * sum(token_counts) / chars
+        else:
+            token_counts = [math.ceil(tokens_per_char * (len(p) + 1)) for _, p in prose_rows]
 
-    # Parse header
-    header_line = lines[0]
-    headers = [h.strip().strip('"') for h in header_line.split(",")]
+        for (row_num, prose), row_tokens in zip(prose_rows, token_counts):
+            if current_tokens + row_tokens > CSV_CHUNK_TOKEN_LIMIT and current_rows:
+                yield _csv_chunk(filename, chunk_index, header_str, current_rows)
+                chunk_index += 1
+                current_rows = []
+                current_tokens = header_tokens
+            current_rows.append((row_num, prose))
+            current_tokens += row_tokens
 
-    # Convert each data row to prose
-    prose_rows = []
-    for row_idx, line in enumerate(lines[1:], start=1):
-        values = _split_csv_line(line)
-        parts = [f"{headers[j]}={values[j]}" for j in range(min(len(headers), len(values)))]
-        prose_rows.append((row_idx, f"Row {row_idx}: {', '.join(parts)}"))
+    if current_rows:
+        yield _csv_chunk(filename, chunk_index, header_str, current_rows)
 
-    # Group rows into chunks under the token limit
-    header_str = "Headers: " + ", ".join(headers) + "\n\n"
-    header_tokens = len(ENCODING.encode(header_str))
 
-    chunks = []
-    current_rows = []
-    current_row_start = None
-    current_tokens = header_tokens
+_LINE_END = re.compile(r"\r\n|\r|\n")
 
-    for row_num, prose in prose_rows:
-        row_tokens = len(ENCODING.encode(prose + "\n"))
-
-        if current_tokens + row_tokens > CSV_CHUNK_TOKEN_LIMIT and current_rows:
-            # Flush current chunk
-            chunk_text = header_str + "\n".join(r for _, r in current_rows)
-            chunks.append({
-                "text": chunk_text,
-                "source": filename,
-                "chunk_index": len(chunks),
-                "char_start": 0,
-                "char_end": 0,
-                "file_type": "csv",
-                "page_start": None,
-                "page_end": None,
-                "row_start": current_row_start,
-                "row_end": current_rows[-1][0],
-            })
-            current_rows = []
-            current_tokens = header_tokens
-            current_row_start = None
-
-        if current_row_start is None:
-            current_row_start = row_num
-        current_rows.append((row_num, prose))
-        current_tokens += row_tokens
-
-    # Flush last chunk
-    if current_rows:
-        chunk_text = header_str + "\n".join(r for _, r in current_rows)
-        chunks.append({
-            "text": chunk_text,
-            "source": filename,
-            "chunk_index": len(chunks),
-            "char_start": 0,
-            "char_end": 0,
-            "file_type": "csv",
-            "page_start": None,
-            "page_end": None,
-            "row_start": current_row_start,
-            "row_end": current_rows[-1][0],
-        })
+
+def _iter_text_lines(uploaded_file, encoding: str) -> Iterator[str]:
+    """Decode a binary file block by block into lines ending in "\n".
+
+    "\r\n" and a lone "\r" (old Mac files) count as line ends too, like
+    universal newlines in open().
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    pending = ""
+    while block := uploaded_file.read(CSV_READ_BLOCK_BYTES):
+        text = pending + decoder.decode(block)
+        # A trailing "\r" may be the first half of a "\r\n" split across blocks
+        cut = len(text) - 1 if text.endswith("\r") else len(text)
+        lines = _LINE_END.split(text[:cut])
+        pending = lines.pop() + text[cut:]
+        for line in lines:
+            yield line + "\n"
+    pending += decoder.decode(b"", final=True)
+    lines = _LINE_END.split(pending)
+    last = lines.pop()
+    for line in lines:
+        yield line + "\n"
+    if last:
+        yield last
+
+
+def _row_blocks(reader, size: int) -> Iterator[list[list[str]]]:
+    """Group non-blank csv rows into lists of up to `size`."""
+    block = []
+    for values in reader:
+        if not any(v.strip() for v in values):
+            continue
+        block.append(values)
+        if len(block) >= size:
+            yield block
+            block = []
+    if block:
+        yield block
+
+
+def _parse_csv(uploaded_file, filename: str) -> ParseResult:
+    """Parse a CSV file, converting rows to prose and grouping into chunks.
+
+    The file text is not kept (text is ""); a CSV without data rows, or
+    one the csv module cannot read, is returned as plain text instead.
+    """
+    try:
+        chunks = list(iter_csv_chunks(uploaded_file, filename))
+    except csv.Error:
+        chunks = []
+    if not chunks:
+        uploaded_file.seek(0)
+        return _parse_txt(uploaded_file, filename)
 
     return ParseResult(
-        text=content,
+        text="",
         filename=filename,
         file_type="csv",
         chunks=chunks,
     )
-
-
-def _split_csv_line(line: str) -> list[str]:
-    """Split a CSV line handling quoted fields with commas."""
-    fields = []
-    current = ""
-    in_quotes = False
-    for char in line:
-        if char == '"':
-            in_quotes = not in_quotes
-        elif char == "," and not in_quotes:
-            fields.append(current.strip().strip('"'))
-            current = ""
-        else:
-            current += char
-    fields.append(current.strip().strip('"'))
-    return fields
@@ -0,0 +1,207 @@
+"""Streaming ingestion: parse → chunk → embed, page by page.
+
+PDF pages flow out of pdfplumber into the incremental chunker, and finished
+chunks flow into embedding batches. The first embedding requests go out
+while later pages are still being extracted, and the full document text is
+never held in memory.
+
+Re-uploading a revision of a stored document reuses its work: the leading
+PDF pages whose text hash is unchanged are neither chunked nor embedded
+again, and any later chunk whose text is unchanged keeps its vector.
+"""
+
+from collections import deque
+import csv
+from dataclasses import dataclass, field
+import hashlib
+import itertools
+import time
+
+import numpy as np
+
+from rag import jobs
+from rag.chunker import CHUNK_OVERLAP, CHUNK_SIZE, iter_chunks
+from rag.columns import ChunkTable
+from rag.embedder import embed_chunk_stream
+from rag.metrics import Timings, timed_iter
+from rag.parser import file_extension, iter_csv_chunks, iter_pdf_pages, parse_file
+
+
+@dataclass
+class IngestResult:
+    filename: str
+    file_type: str
+    chunks: list[dict]
+    embeddings: np.ndarray  # float32, one row per chunk
+    text_chars: int  # extracted characters, to flag scanned PDFs
+    pages: list[list] = field(default_factory=list)  # [page_number, sha256, chars, tokens] per PDF page
+    chunks_reused: int = 0  # chunks whose vectors came from the previous revision
+
+
+@dataclass
+class Revision:
+    """The stored version of a document being uploaded again."""
+    pages: list[list]  # IngestResult.pages of the stored version
+    chunks: ChunkTable
+    vectors: np.ndarray  # unit-length rows, one per chunk
+
+
+_STEP = CHUNK_SIZE - CHUNK_OVERLAP  # tokens between consecutive chunk starts
+
+
+def page_hash(page_text: str) -> str:
+    return hashlib.sha256(page_text.encode("utf-8")).hexdigest()
+
+
+def _complete_chunks(n_tokens: int) -> int:
+    """Chunks that lie wholly within the first n_tokens tokens of a document."""
+    return max(0, (n_tokens - CHUNK_SIZE) // _STEP + 1)
+
+
+def _unchanged_prefix(pages, seen: list[list], previous: Revision):
+    """Read pages while their hashes match `previous`.
+
+    `seen` is filled with [page_number, hash, chars] by the page stream.
+    Returns (reused, resume, pending): how many leading chunks of `previous`
+    are unchanged, the iter_chunks resume tuple for the rest, and the pages
+    read so far that still need chunking. resume is None when every page
+    matched, so `previous` is reused whole.
+    """
+    old = previous.pages
+    pending = deque()  # (first token, last token + 1, first char, page) of pages still needed
+    tokens = chars = 0
+    for page in pages:
+        i = len(seen) - 1
+        if i >= len(old) or seen[i][:2] != old[i][:2]:
+            pending.append((tokens, None, chars, page))
+            break
+        pending.append((tokens, tokens + old[i][3], chars, page))
+        tokens += old[i][3]
+        chars += old[i][2]
+        # Pages that end before the first chunk still to be built are done with
+        start = _STEP * _complete_chunks(tokens)
+        while pending and pending[0][1] <= start:
+            pending.popleft()
+    else:
+        if len(seen) == len(old):
+            return len(previous.chunks), None, []
+
+    reused = _complete_chunks(tokens)
+    token_offset, _, char_offset, _ = pending[0] if pending else (tokens, None, chars, None)
+    resume = (reused, _STEP * reused - token_offset, char_offset)
+    return reused, resume, [page for *_, page in pending]
+
+
+def ingest(uploaded_file, job: jobs.Job | None = None, timings: Timings | None = None,
+           previous: Revision | None = None) -> IngestResult:
+    """Parse, chunk and embed an uploaded file, reporting progress on `job`.
+
+    With `previous`, the file is a new revision of that stored document: its
+    unchanged leading pages and unchanged chunks are reused (see module
+    docstring), and the result is the same as ingesting it from scratch.
+
+    Stage durations (parse, chunk, embed) are recorded on `timings`. The
+    stages overlap, so parse and chunk count only the time spent producing
+    chunks, and embed the time left waiting for embeddings afterwards. CSV
+    rows are parsed and chunked in one pass, all counted as parse.
+
+    The caller must have checked the extension against SUPPORTED_EXTENSIONS.
+    """
+    filename = uploaded_file.name
+    ext = file_extension(filename)
+    text_chars = 0
+    timings = timings if timings is not None else Timings()
+    spent = {"pages": 0.0, "parse": 0.0, "stream": 0.0, "prefix": 0.0}
+    seen: list[list] = []  # [page_number, hash, chars] of every PDF page read
+    page_tokens: list[int] = []
+    reused = 0
+
+    def spent_on(name: str):
+        return lambda seconds: spent.__setitem__(name, seconds)
+
+    def on_page(done: int, total: int) -> None:
+        if job is not None:
+            job.update(pages_parsed=done, pages_total=total)
+
+    def counted(chunks):
+        for chunk in chunks:
+            if job is not None:
+                job.advance("chunks_total")
+            yield chunk
+        # Parsing is done; only in-flight embedding batches remain
+        if job is not None:
+            job.update(status=jobs.EMBEDDING)
+
+    def on_embedded(n: int) -> None:
+        if job is not None:
+            job.advance("chunks_embedded", n)
+
+    if job is not None:
+        job.update(status=jobs.PARSING, file_type=ext, chunks_total=0)
+
+    stream = None
+    fused = False  # parse and chunk are one pass
+    if ext == "pdf":
+        def pages():
+            nonlocal text_chars
+            for page_num, page_text in iter_pdf_pages(uploaded_file, on_page):
+                text_chars += len(page_text.strip())
+                seen.append([page_num, page_hash(page_text), len(page_text)])
+                yield page_num, page_text
+        page_stream = timed_iter(pages(), spent_on("pages"))
+        resume = None
+        if previous is not None and previous.pages:
+            t0 = time.perf_counter()
+            reused, resume, pending = _unchanged_prefix(page_stream, seen, previous)
+            spent["prefix"] = time.perf_counter() - t0
+            # Pages before the first one chunked again keep their token counts
+            page_tokens = [page[3] for page in previous.pages[:len(seen) - len(pending)]]
+            page_stream = itertools.chain(pending, page_stream) if resume is not None else iter(())
+        stream = iter_chunks(page_stream, filename, file_type="pdf", on_page_tokens=page_tokens.append,
+                             resume=resume)
+    elif ext == "csv":
+        csv_chunks = timed_iter(iter_csv_chunks(uploaded_file, filename), spent_on("stream"))
+        try:
+            first = next(csv_chunks, None)
+        except csv.Error:  # unreadable before the first chunk: index it as text, as parse_file does
+            first = None
+        if first is not None:
+            stream, fused = itertools.chain([first], csv_chunks), True
+
+    if stream is None:  # plain text, or a CSV without data rows
+        t0 = time.perf_counter()
+        result = parse_file(uploaded_file)
+        spent["parse"] = time.perf_counter() - t0
+        text_chars = len(result.text.strip())
+        stream = iter_chunks([(None, result.text)], filename, file_type=result.file_type)
+        ext = result.file_type
+        if job is not None:
+            job.update(file_type=ext)
+
+    head_chunks, known = [], None
+    if previous is not None:
+        head_chunks = [dict(previous.chunks[i], source=filename) for i in range(reused)]
+        known = {previous.chunks.text(i): previous.vectors[i] for i in range(reused, len(previous.chunks))}
+        if job is not None:
+            job.advance("chunks_total", reused)
+            job.advance("chunks_embedded", reused)
+
+    t0 = time.perf_counter()
+    if not fused:
+        stream = timed_iter(stream, spent_on("stream"))
+    chunks, embeddings = embed_chunk_stream(counted(stream), on_embedded, known)
+    embed_wall = time.perf_counter() - t0
+
+    if fused:
+        timings.record("parse", spent["stream"])
+    else:
+        timings.record("parse", spent["parse"] + spent["pages"])
+        timings.record("chunk", spent["stream"] + spent["prefix"] - spent["pages"])
+    timings.record("embed", max(0.0, embed_wall - spent["stream"]))
+    matched = sum(chunk["text"] in known for chunk in chunks) if known else 0
+    if head_chunks:
+        embeddings = np.concatenate((previous.vectors[:reused], embeddings)) if chunks else previous.vectors[:reused]
+    return IngestResult(filename=filename, file_type=ext, chunks=head_chunks + chunks,
+                        embeddings=embeddings, text_chars=text_chars,
+                        pages=[page + [n_tokens] for page, n_tokens in zip(seen, page_tokens)],
+                        chunks_reused=reused + matched)
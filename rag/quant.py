@@ -0,0 +1,84 @@
+"""Compressed embedding matrices: float16 or int8 scalar quantization.
+
+float16 halves a float32 matrix; int8 quarters it, storing each
+(unit-length) row as round(row * 127 / max|row|) plus one float32 scale.
+Scoring dequantizes blocks of rows on the fly, so the full float32 matrix
+never exists in memory. Either kind can stand in for an ndarray wherever
+the store and rag.ann score rows: len(), [] and @ all work.
+"""
+
+import numpy as np
+
+KINDS = ("float16", "int8")
+_BLOCK_ROWS = 256  # rows dequantized at a time; small enough to stay in cache
+
+
+class QuantizedMatrix:
+    def __init__(self, codes: np.ndarray, scales: np.ndarray | None = None):
+        self.codes = codes  # (n, dim) float16, or int8 with per-row scales
+        self.scales = scales
+
+    @classmethod
+    def quantize(cls, matrix: np.ndarray, kind: str) -> "QuantizedMatrix":
+        if kind == "float16":
+            return cls(np.asarray(matrix, dtype=np.float16))
+        if kind != "int8":
+            raise ValueError(f"Unknown quantization {kind!r}; expected one of {KINDS}")
+        codes = np.empty(matrix.shape, dtype=np.int8)
+        scales = np.empty(len(matrix), dtype=np.float32)
+        for i in range(0, len(matrix), _BLOCK_ROWS):
+            rows = np.asarray(matrix[i:i + _BLOCK_ROWS], dtype=np.float32)
+            peak = np.abs(rows).max(axis=1) if rows.size else np.zeros(len(rows), dtype=np.float32)
+            scale = np.where(peak > 0, peak / 127, 1.0).astype(np.float32)
+            codes[i:i + len(rows)] = np.rint(rows / scale[:, None])
+            scales[i:i + len(rows)] = scale
+        return cls(codes, scales)
+
+    @property
+    def kind(self) -> str:
+        return "int8" if self.scales is not None else "float16"
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self.codes.shape
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def _dequantize(self, codes: np.ndarray, scales: np.ndarray | None) -> np.ndarray:
+        rows = codes.astype(np.float32)
+        if scales is not None:
+            rows *= scales[:, None]
+        return rows
+
+    def __getitem__(self, key):
+        """Slices stay compressed; row ids (or a single row) come back as float32."""
+        scales = self.scales[key] if self.scales is not None else None
+        if isinstance(key, slice):
+            return QuantizedMatrix(self.codes[key], scales)
+        if np.ndim(key) == 0:
+            return self[np.array([key])][0]
+        return self._dequantize(self.codes[key], scales)
+
+    def __array__(self, dtype=None, copy=None):
+        return self._dequantize(self.codes, self.scales).astype(dtype or np.float32, copy=False)
+
+    def __matmul__(self, other: np.ndarray) -> np.ndarray:
+        """Score every row against a vector (n,) or a matrix (dim, m), block by block."""
+        other = np.asarray(other, dtype=np.float32)
+        out = np.empty((len(self),) + other.shape[1:], dtype=np.float32)
+        for i in range(0, len(self), _BLOCK_ROWS):
+            scores = self.codes[i:i + _BLOCK_ROWS].astype(np.float32) @ other
+            if self.scales is not None:
+                scale = self.scales[i:i + _BLOCK_ROWS]
+                scores *= scale if scores.ndim == 1 else scale[:, None]
+            out[i:i + len(scores)] = scores
+        return out
+
+    def concat(self, other: "QuantizedMatrix") -> "QuantizedMatrix":
+        scales = None if self.scales is None else np.concatenate((self.scales, other.scales))
+        return QuantizedMatrix(np.concatenate((self.codes, other.codes)), scales)
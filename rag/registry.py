@@ -0,0 +1,94 @@
+"""Cross-process registry of persisted documents, for running several API workers.
+
+Every worker memory-maps the same DOCUQUERY_STORE_DIR, so the OS page cache
+holds one copy of each matrix however many workers search it. What the
+workers must agree on is which documents exist and which version of each is
+current. That is ``<dir>/manifest.json``: {"session/doc": version}, rewritten
+atomically by a writer holding an exclusive flock on ``<dir>/registry.lock``.
+Readers take the lock shared while they open a document's files, so they
+never see one half-replaced, and notice other workers' writes by the
+manifest's stat signature changing: one stat() per call.
+"""
+
+from contextlib import contextmanager
+import json
+import os
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, so one process per store directory
+    fcntl = None
+
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = "registry.lock"
+
+
+def _key(session_id: str, doc_id: str) -> str:
+    return f"{session_id}/{doc_id}"
+
+
+@contextmanager
+def locked(root: str, exclusive: bool):
+    """Hold the registry lock of a store directory, shared or exclusive."""
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(root, LOCK_FILE), "a+") as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def signature(root: str) -> tuple | None:
+    """Changes whenever the manifest is rewritten; None if there is none."""
+    try:
+        st = os.stat(os.path.join(root, MANIFEST_FILE))
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def read(root: str) -> dict[tuple[str, str], int] | None:
+    """{(session_id, doc_id): version}, or None if the manifest does not exist."""
+    try:
+        with open(os.path.join(root, MANIFEST_FILE), encoding="utf-8") as f:
+            entries = json.load(f)
+    except FileNotFoundError:
+        return None
+    return {tuple(key.split("/", 1)): version for key, version in entries.items()}
+
+
+def _write(root: str, manifest: dict[tuple[str, str], int]) -> None:
+    tmp = os.path.join(root, f"{MANIFEST_FILE}.tmp-{os.getpid()}")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({_key(*key): version for key, version in manifest.items()}, f, separators=(",", ":"))
+    os.replace(tmp, os.path.join(root, MANIFEST_FILE))
+
+
+def publish(root: str, session_id: str, doc_id: str) -> int:
+    """Record a new version of a document; call with the lock held exclusively."""
+    manifest = read(root) or {}
+    version = manifest.pop((session_id, doc_id), 0) + 1
+    manifest[(session_id, doc_id)] = version  # last entry: the most recently written
+    _write(root, manifest)
+    return version
+
+
+def remove(root: str, keys: list[tuple[str, str]]) -> None:
+    """Drop documents from the manifest; call with the lock held exclusively."""
+    manifest = read(root) or {}
+    for key in keys:
+        manifest.pop(key, None)
+    _write(root, manifest)
+
+
+def initialize(root: str, keys: list[tuple[str, str]]) -> dict[tuple[str, str], int]:
+    """Return the manifest, first creating it from `keys` if there is none."""
+    with locked(root, exclusive=True):
+        manifest = read(root)
+        if manifest is None:
+            manifest = {key: 1 for key in keys}
+            _write(root, manifest)
+        return manifest
@@ -0,0 +1,93 @@
+"""Lazy loading of heavy dependencies, and an optional background prewarm.
+
+Importing api.py should not pay for the cl100k_base tokenizer (seconds to
+load on a cold instance), pdfplumber or the OpenAI SDK. Each is loaded once,
+on first use, by its get_* function below; the tokenizer instance is shared
+by the chunker, the CSV parser and the prompt builder. With DOCUQUERY_PREWARM
+on, prewarm() loads them all on a daemon thread once the server is up, so
+/health answers immediately and the first upload finds everything ready.
+"""
+
+import importlib
+import logging
+import os
+import threading
+import time
+
+PREWARM = os.environ.get("DOCUQUERY_PREWARM", "1") != "0"
+TOKENIZER_NAME = "cl100k_base"
+
+logger = logging.getLogger(__name__)
+
+_loaded: dict[str, object] = {}
+_load_seconds: dict[str, float] = {}
+_prewarm_lock = threading.Lock()
+_prewarm_thread: threading.Thread | None = None
+
+
+def _load_tokenizer():
+    import tiktoken
+    return tiktoken.get_encoding(TOKENIZER_NAME)
+
+
+_LOADERS = {
+    "tokenizer": _load_tokenizer,
+    "pdfplumber": lambda: importlib.import_module("pdfplumber"),
+    "openai": lambda: importlib.import_module("openai"),
+}
+# One lock per dependency: loading the tokenizer must not hold up the others
+_locks = {name: threading.Lock() for name in _LOADERS}
+
+
+def _get(name: str):
+    value = _loaded.get(name)
+    if value is None:
+        with _locks[name]:
+            value = _loaded.get(name)
+            if value is None:
+                t0 = time.perf_counter()
+                value = _LOADERS[name]()
+                _load_seconds[name] = time.perf_counter() - t0
+                _loaded[name] = value
+    return value
+
+
+def get_tokenizer():
+    """The shared tiktoken encoding."""
+    return _get("tokenizer")
+
+
+def get_pdfplumber():
+    return _get("pdfplumber")
+
+
+def get_openai():
+    """The openai SDK module."""
+    return _get("openai")
+
+
+def _prewarm_all() -> None:
+    for name in _LOADERS:
+        try:
+            _get(name)
+        except Exception as e:  # the first request retries it and reports the error
+            logger.warning("Prewarming %s failed: %s", name, e)
+
+
+def prewarm() -> threading.Thread:
+    """Load every lazy dependency on a daemon thread; returns the thread."""
+    global _prewarm_thread
+    with _prewarm_lock:
+        if _prewarm_thread is None:
+            _prewarm_thread = threading.Thread(target=_prewarm_all, name="prewarm", daemon=True)
+            _prewarm_thread.start()
+        return _prewarm_thread
+
+
+def status() -> dict:
+    """Seconds each dependency took to load, or None if not loaded yet.
+
+    Takes no lock, so /health never waits for a load in progress.
+    """
+    seconds = dict(_load_seconds)
+    return {name: round(seconds[name], 3) if name in seconds else None for name in _LOADERS}
@@ -1,44 +1,657 @@
+"""In-memory vector store, namespaced by session and document.
+
+Each (session_id, doc_id) pair owns its own chunk list and embedding matrix,
+so concurrent uploads never overwrite each other. Whole documents are evicted
+least-recently-used once the store exceeds its RAM budget.
+
+If DOCUQUERY_STORE_DIR is set, every document is also written to disk as
+``<dir>/<session_id>/<doc_id>/embeddings.npy`` plus a ``chunks.json`` sidecar.
+On startup those directories are registered without being read; the matrix is
+memory-mapped on first query, so a restart costs page faults instead of
+re-embedding and several processes share one OS page cache. With persistence
+on, eviction only unmaps a document — it is reopened from disk when needed.
+
+Persistence is also what lets several API workers share documents: writers
+publish every document in the directory's registry (rag/registry.py), and
+each worker picks up the others' writes and deletions on its next call.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+import json
+import os
+import re
+import shutil
+import threading
+
 import numpy as np
 
-_chunks: list[dict] = []
-_embeddings: np.ndarray | None = None
+from rag import registry
+from rag.ann import IVFIndex, top_k, top_k_rows
+from rag.blocks import BlockIndex
+from rag.columns import ChunkTable
+from rag.quant import QuantizedMatrix
 
 TOP_K = 15
+DEFAULT_SESSION = "default"
+DEFAULT_DOCUMENT = "default"
+
+# RAM budget for all indexes together. The most recently added document is
+# never evicted, even if it alone exceeds the budget.
+MEMORY_BUDGET_MB = float(os.environ.get("DOCUQUERY_STORE_BUDGET_MB", "512"))
+MEMORY_BUDGET_BYTES = int(MEMORY_BUDGET_MB * 1024 * 1024)
+
+# Directory for the persistent index; unset means memory only.
+STORE_DIR = os.environ.get("DOCUQUERY_STORE_DIR") or None
+
+# Session and document ids become directory names, so keep them path-safe.
+ID_PATTERN = r"^[A-Za-z0-9_-]{1,64}$"
+_ID_RE = re.compile(ID_PATTERN)
+
+_EMBEDDINGS_FILE = "embeddings.npy"
+_CHUNKS_FILE = "chunks.json"
+_IVF_CENTROIDS_FILE = "ivf_centroids.npy"
+_IVF_ASSIGNMENTS_FILE = "ivf_assignments.npy"
+_BLOCK_BOUNDS_FILE = "block_bounds.npy"
+_BLOCK_MEANS_FILE = "block_means.npy"
+_BLOCK_RADII_FILE = "block_radii.npy"
+_QUANT_CODES_FILE = "embeddings_{kind}.npy"
+_QUANT_SCALES_FILE = "embeddings_{kind}_scales.npy"
+_FINGERPRINT_FILE = "fingerprint.json"
+
+# Search backend: "exact" (brute-force matvec), "ivf" (rag.ann.IVFIndex) or
+# "blocks" (rag.blocks.BlockIndex, page-aligned runs of chunks). IVF only
+# kicks in for documents with at least ANN_MIN_CHUNKS chunks, blocks at
+# BLOCK_MIN_CHUNKS; below that exact search is both faster and exact.
+INDEX_BACKEND = os.environ.get("DOCUQUERY_INDEX", "exact")
+ANN_MIN_CHUNKS = int(os.environ.get("DOCUQUERY_ANN_MIN_CHUNKS", "20000"))
+IVF_NPROBE = int(os.environ.get("DOCUQUERY_IVF_NPROBE", "16"))
+BLOCK_MIN_CHUNKS = int(os.environ.get("DOCUQUERY_BLOCK_MIN_CHUNKS", "256"))
+BLOCK_NPROBE = int(os.environ.get("DOCUQUERY_BLOCK_NPROBE", "4"))
+
+# Search matrix storage: "none" (float32), "float16" or "int8" (rag.quant).
+# Compressed search keeps full precision only on disk: with persistence on,
+# the best k * RESCORE_CANDIDATES hits are rescored against the float32 rows
+# of embeddings.npy (0 turns that off). Without DOCUQUERY_STORE_DIR there is
+# no full-precision copy, and compressed scores are final.
+QUANTIZE = os.environ.get("DOCUQUERY_QUANTIZE", "none")
+RESCORE_CANDIDATES = int(os.environ.get("DOCUQUERY_RESCORE_CANDIDATES", "4"))
+
+# Cap on the (questions x chunks) float32 score matrix of query_batch
+SCORE_BLOCK_BYTES = 64 * 1024 * 1024
+
+
+@dataclass
+class _Document:
+    chunks: ChunkTable | None  # None while unloaded (persisted documents only)
+    embeddings: np.ndarray | QuantizedMatrix | None  # the matrix searched
+    nbytes: int
+    path: str | None = None  # on-disk directory when persistence is enabled
+    index: IVFIndex | BlockIndex | None = None  # None means exact search
+    embedder: str | None = None  # embedding backend that built the matrix; kept while unloaded
+    full: np.ndarray | None = None  # memory-mapped float32 rows for rescoring a compressed matrix
+    # Content and page hashes of the upload that built it (see document_fingerprint);
+    # kept while unloaded, {} once known to be absent
+    fingerprint: dict | None = None
+    version: int = 0  # registry version of the files at `path`
+
+    @property
+    def loaded(self) -> bool:
+        return self.embeddings is not None
+
+    def unload(self) -> None:
+        self.chunks = None
+        self.embeddings = None
+        self.full = None
+        self.index = None
+        self.nbytes = 0
+
+
+_docs: "OrderedDict[tuple[str, str], _Document]" = OrderedDict()
+_lock = threading.RLock()
+_registry_signature: tuple | None = None  # manifest last synced into _docs
+
+
+def _normalize_rows(matrix) -> np.ndarray:
+    """Return a contiguous float32 copy of matrix with unit-length rows."""
+    matrix = np.array(matrix, dtype=np.float32, order="C")
+    if matrix.size == 0:
+        return np.zeros((len(matrix), 0), dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix
+
+
+def _build_index(matrix: np.ndarray, index: IVFIndex | BlockIndex | None = None,
+                 chunks: ChunkTable | None = None) -> IVFIndex | BlockIndex | None:
+    """Return the search index for matrix, extending an IVF `index` incrementally if given.
+
+    A block index takes one pass over the rows, so it is rebuilt rather than
+    extended; `chunks` gives it page boundaries and tells CSV rows apart.
+    """
+    if INDEX_BACKEND == "blocks":
+        # Blocks rely on neighbouring chunks sharing a subject; CSV rows need not
+        if len(matrix) < BLOCK_MIN_CHUNKS or (chunks is not None and chunks.ints("row_start") is not None):
+            return None
+        pages = chunks.ints("page_start") if chunks is not None else None
+        return BlockIndex.build(matrix, pages, nprobe=BLOCK_NPROBE)
+    if not isinstance(index, IVFIndex):
+        index = None
+    if INDEX_BACKEND != "ivf" or len(matrix) < ANN_MIN_CHUNKS:
+        return None
+    if index is not None and len(index) < len(matrix):
+        index = index.copy()  # never mutate an index a concurrent query may be using
+        index.add(matrix, start=len(index))
+    if index is None or index.needs_retrain():
+        index = IVFIndex.train(matrix, nprobe=IVF_NPROBE)
+    return index
+
+
+def _compress(matrix: np.ndarray) -> np.ndarray | QuantizedMatrix:
+    return matrix if QUANTIZE == "none" else QuantizedMatrix.quantize(matrix, QUANTIZE)
+
+
+def _estimate_nbytes(chunks: ChunkTable, embeddings: np.ndarray) -> int:
+    return embeddings.nbytes + chunks.nbytes
+
+
+def _evict_over_budget(keep: tuple[str, str]) -> None:
+    """Drop least-recently-used documents until the store fits the budget.
+
+    Persisted documents are only unloaded; in-memory ones are deleted.
+    """
+    total = sum(d.nbytes for d in _docs.values())
+    for key in list(_docs):
+        if total <= MEMORY_BUDGET_BYTES:
+            break
+        doc = _docs[key]
+        if key == keep or not doc.loaded:
+            continue
+        total -= doc.nbytes
+        if doc.path is not None:
+            doc.unload()
+        else:
+            del _docs[key]
+
+
+def _check_id(value: str) -> None:
+    if not _ID_RE.match(value):
+        raise ValueError(f"Invalid id {value!r}: expected 1-64 characters of [A-Za-z0-9_-]")
+
+
+def _doc_path(session_id: str, doc_id: str) -> str:
+    return os.path.join(STORE_DIR, session_id, doc_id)
+
+
+def _write_document(path: str, chunks: ChunkTable, matrix: np.ndarray,
+                    index: IVFIndex | BlockIndex | None = None, embedder: str | None = None,
+                    compressed: QuantizedMatrix | None = None, fingerprint: dict | None = None) -> str:
+    """Write a document's files to a temp dir next to `path`; returns the temp dir.
+
+    _replace_document then swaps it in.
+    """
+    tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    os.makedirs(tmp)
+    try:
+        np.save(os.path.join(tmp, _EMBEDDINGS_FILE), matrix)
+        if compressed is not None:
+            np.save(os.path.join(tmp, _QUANT_CODES_FILE.format(kind=compressed.kind)), compressed.codes)
+            if compressed.scales is not None:
+                np.save(os.path.join(tmp, _QUANT_SCALES_FILE.format(kind=compressed.kind)), compressed.scales)
+        if isinstance(index, IVFIndex):
+            np.save(os.path.join(tmp, _IVF_CENTROIDS_FILE), index.centroids)
+            np.save(os.path.join(tmp, _IVF_ASSIGNMENTS_FILE), index.assignments)
+        elif isinstance(index, BlockIndex):
+            np.save(os.path.join(tmp, _BLOCK_BOUNDS_FILE), index.bounds)
+            np.save(os.path.join(tmp, _BLOCK_MEANS_FILE), index.means)
+            np.save(os.path.join(tmp, _BLOCK_RADII_FILE), index.radii)
+        # One list per column, like the in-memory ChunkTable
+        sidecar = {"embedder": embedder, "columns": chunks.to_columns()}
+        with open(os.path.join(tmp, _CHUNKS_FILE), "w", encoding="utf-8") as f:
+            json.dump(sidecar, f, ensure_ascii=False, separators=(",", ":"))
+        if fingerprint:
+            with open(os.path.join(tmp, _FINGERPRINT_FILE), "w", encoding="utf-8") as f:
+                json.dump(fingerprint, f, separators=(",", ":"))
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return tmp
+
+
+def _replace_document(key: tuple[str, str], tmp: str, path: str) -> int:
+    """Swap a written temp dir into place and publish it; returns its registry version.
+
+    Other processes keep reading the old files through their maps until they
+    see the new version.
+    """
+    with registry.locked(STORE_DIR, exclusive=True):
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.replace(tmp, path)
+        return registry.publish(STORE_DIR, *key)
+
+
+def _load_document(doc: _Document) -> None:
+    """Memory-map a persisted document's matrix and read its chunk sidecar."""
+    # Shared lock: another process must not swap the files mid-read
+    with registry.locked(STORE_DIR, exclusive=False):
+        _read_document(doc)
+    doc.nbytes = _estimate_nbytes(doc.chunks, doc.embeddings)
+
+
+def _read_document(doc: _Document) -> None:
+    embeddings = np.load(os.path.join(doc.path, _EMBEDDINGS_FILE), mmap_mode="r")
+    search = embeddings
+    if QUANTIZE != "none":
+        codes_path = os.path.join(doc.path, _QUANT_CODES_FILE.format(kind=QUANTIZE))
+        scales_path = os.path.join(doc.path, _QUANT_SCALES_FILE.format(kind=QUANTIZE))
+        if os.path.exists(codes_path):
+            search = QuantizedMatrix(np.load(codes_path, mmap_mode="r"),
+                                     np.load(scales_path) if os.path.exists(scales_path) else None)
+        else:  # written before quantization was turned on
+            search = QuantizedMatrix.quantize(embeddings, QUANTIZE)
+    with open(os.path.join(doc.path, _CHUNKS_FILE), encoding="utf-8") as f:
+        sidecar = json.load(f)
+    columns = sidecar["columns"]
+    if "rows" in sidecar:  # older sidecars: column names, then one row per chunk
+        columns = {name: [row[j] for row in sidecar["rows"]] for j, name in enumerate(columns)}
+    doc.chunks = ChunkTable.from_columns(columns)
+    doc.embeddings = search
+    doc.full = embeddings if search is not embeddings else None
+    doc.embedder = sidecar.get("embedder")
+    centroids_path = os.path.join(doc.path, _IVF_CENTROIDS_FILE)
+    radii_path = os.path.join(doc.path, _BLOCK_RADII_FILE)
+    if os.path.exists(centroids_path):
+        doc.index = IVFIndex(np.load(centroids_path),
+                             np.load(os.path.join(doc.path, _IVF_ASSIGNMENTS_FILE)), IVF_NPROBE)
+    elif os.path.exists(radii_path):  # block indexes saved without radii are rebuilt below
+        doc.index = BlockIndex(np.load(os.path.join(doc.path, _BLOCK_BOUNDS_FILE)),
+                               np.load(os.path.join(doc.path, _BLOCK_MEANS_FILE)), np.load(radii_path),
+                               BLOCK_NPROBE)
+    else:
+        doc.index = _build_index(embeddings, chunks=doc.chunks)
+
+
+def _loaded_document(key: tuple[str, str]) -> _Document | None:
+    """The document under key, loaded if persisted; None if absent. Call with _lock held.
+
+    A document another process deleted since the last _sync is dropped.
+    """
+    doc = _docs.get(key)
+    if doc is None or doc.loaded:
+        return doc
+    try:
+        _load_document(doc)
+    except FileNotFoundError:
+        del _docs[key]
+        return None
+    _evict_over_budget(keep=key)
+    return doc
+
+
+def _discover() -> None:
+    """Register every persisted document without reading it, oldest first.
+
+    The registry manifest gives the order and versions; a directory written
+    before there was one gets a manifest built from what is on disk.
+    """
+    global _registry_signature
+    found = []
+    for session_id in os.listdir(STORE_DIR):
+        session_path = os.path.join(STORE_DIR, session_id)
+        if not _ID_RE.match(session_id) or not os.path.isdir(session_path):
+            continue
+        for doc_id in os.listdir(session_path):
+            path = os.path.join(session_path, doc_id)
+            marker = os.path.join(path, _CHUNKS_FILE)
+            if _ID_RE.match(doc_id) and os.path.isfile(marker):
+                found.append((os.path.getmtime(marker), session_id, doc_id, path))
+    manifest = registry.initialize(STORE_DIR, [(session_id, doc_id) for _, session_id, doc_id, _ in sorted(found)])
+    _registry_signature = registry.signature(STORE_DIR)
+    for key, version in manifest.items():
+        _docs[key] = _Document(chunks=None, embeddings=None, nbytes=0, path=_doc_path(*key), version=version)
 
 
-def add_chunks(chunks: list[dict], embeddings: list[list[float]]) -> None:
-    """Store chunks and their embeddings in memory."""
-    global _chunks, _embeddings
-    _chunks = chunks
-    _embeddings = np.array(embeddings)
+def _sync() -> None:
+    """Pick up documents that other processes wrote or removed since the last call.
 
+    A document with a newer version is unloaded, so its next use maps the
+    new files; new documents count as the most recently used.
+    """
+    global _registry_signature
+    if STORE_DIR is None:
+        return
+    signature = registry.signature(STORE_DIR)
+    if signature == _registry_signature:
+        return
+    manifest = registry.read(STORE_DIR) or {}
+    with _lock:
+        _registry_signature = signature
+        for key in [key for key, doc in _docs.items() if doc.path is not None and key not in manifest]:
+            del _docs[key]
+        for key, version in manifest.items():
+            doc = _docs.get(key)
+            if doc is None:
+                _docs[key] = _Document(chunks=None, embeddings=None, nbytes=0, path=_doc_path(*key),
+                                       version=version)
+            elif doc.version < version:
+                doc.unload()
+                doc.fingerprint = None
+                doc.version = version
+                _docs.move_to_end(key)
 
-def query(query_embedding: list[float], n_results: int = TOP_K) -> dict:
-    """Find the most similar chunks using cosine similarity."""
-    if _embeddings is None or len(_chunks) == 0:
-        return {"documents": [[]], "metadatas": [[]], "distances": [[]]}
 
-    query_vec = np.array(query_embedding)
+def add_chunks(
+    chunks: list[dict],
+    embeddings: "np.ndarray | list[list[float]]",
+    session_id: str = DEFAULT_SESSION,
+    doc_id: str = DEFAULT_DOCUMENT,
+    embedder: str | None = None,
+    fingerprint: dict | None = None,
+) -> None:
+    """Store a document's chunks and embeddings under (session_id, doc_id).
 
-    # Cosine similarity = dot product of normalized vectors
-    norms = np.linalg.norm(_embeddings, axis=1)
-    query_norm = np.linalg.norm(query_vec)
-    similarities = _embeddings @ query_vec / (norms * query_norm)
+    Rows are L2-normalized once here so queries are a single matvec.
+    Re-adding an existing namespace replaces it. `embedder` names the
+    embedding backend that produced the vectors (see document_embedder),
+    `fingerprint` the upload they came from (see document_fingerprint).
+    """
+    _check_id(session_id)
+    _check_id(doc_id)
+    matrix = _normalize_rows(embeddings)
+    table = ChunkTable.from_chunks(chunks)
+    _put_document((session_id, doc_id), table, matrix, _build_index(matrix, chunks=table), embedder,
+                  fingerprint=fingerprint)
 
-    # Get top K indices (highest similarity first)
-    k = min(n_results, len(_chunks))
-    top_indices = np.argsort(similarities)[-k:][::-1]
 
+def append_chunks(
+    chunks: list[dict],
+    embeddings: "np.ndarray | list[list[float]]",
+    session_id: str = DEFAULT_SESSION,
+    doc_id: str = DEFAULT_DOCUMENT,
+    embedder: str | None = None,
+) -> None:
+    """Add chunks to an existing namespace (or create it).
+
+    An existing IVF index is extended in place; it is only retrained once the
+    namespace has grown well past the size it was trained on. Vectors from a
+    different embedding backend than the namespace's are rejected. The
+    namespace no longer matches one upload, so its fingerprint is dropped.
+    """
+    key = (session_id, doc_id)
+    _sync()
+    with _lock:
+        doc = _loaded_document(key)
+        if doc is not None:
+            old_chunks, old_search, old_full, old_index = doc.chunks, doc.embeddings, doc.full, doc.index
+            embedder = _same_embedder(doc.embedder, embedder)
+    if doc is None:
+        add_chunks(chunks, embeddings, session_id, doc_id, embedder)
+        return
+    rows = _normalize_rows(embeddings)
+    table = old_chunks.concat(ChunkTable.from_chunks(chunks))
+    if isinstance(old_search, QuantizedMatrix):
+        # Only the new rows are quantized; full precision exists only if persisted
+        search = old_search.concat(QuantizedMatrix.quantize(rows, old_search.kind))
+        matrix = None if old_full is None else np.concatenate((old_full, rows))
+        index = _build_index(matrix if matrix is not None else search, old_index, table)
+        _put_document(key, table, matrix, index, embedder, search)
+    else:
+        matrix = np.concatenate((old_search, rows))
+        _put_document(key, table, matrix, _build_index(matrix, old_index, table), embedder)
+
+
+def _same_embedder(stored: str | None, given: str | None) -> str | None:
+    if stored is not None and given is not None and stored != given:
+        raise ValueError(f"Document was embedded with {stored}, not {given}")
+    return stored or given
+
+
+def _put_document(key: tuple[str, str], chunks: ChunkTable, matrix: np.ndarray | None,
+                  index: IVFIndex | BlockIndex | None, embedder: str | None = None,
+                  search: QuantizedMatrix | None = None, fingerprint: dict | None = None) -> None:
+    """Store a document; `matrix` holds the float32 rows, `search` their compressed form."""
+    if search is None:
+        search = _compress(matrix)
+    doc = _Document(chunks=chunks, embeddings=search, nbytes=_estimate_nbytes(chunks, search),
+                    index=index, embedder=embedder, fingerprint=fingerprint or {})
+    if STORE_DIR is not None:
+        doc.path = _doc_path(*key)
+        compressed = search if search is not matrix else None
+        tmp = _write_document(doc.path, chunks, matrix, index, embedder, compressed, fingerprint)
+        doc.version = _replace_document(key, tmp, doc.path)
+        if compressed is not None:
+            # Full precision stays on disk; rescoring pages in only the rows it reads
+            doc.full = np.load(os.path.join(doc.path, _EMBEDDINGS_FILE), mmap_mode="r")
+    with _lock:
+        _docs.pop(key, None)
+        _docs[key] = doc
+        _evict_over_budget(keep=key)
+
+
+def latest_document(session_id: str = DEFAULT_SESSION) -> str | None:
+    """Return the most recently used doc_id of a session, or None."""
+    _sync()
+    with _lock:
+        for sid, did in reversed(_docs):
+            if sid == session_id:
+                return did
+    return None
+
+
+def has_document(session_id: str, doc_id: str) -> bool:
+    _sync()
+    with _lock:
+        return (session_id, doc_id) in _docs
+
+
+def list_documents(session_id: str = DEFAULT_SESSION) -> list[str]:
+    """Return the doc_ids held for a session, least recently used first."""
+    _sync()
+    with _lock:
+        return [did for sid, did in _docs if sid == session_id]
+
+
+def document_embedder(session_id: str, doc_id: str) -> str | None:
+    """Name of the embedding backend that built a document's index.
+
+    None if the document does not exist or predates backend tracking.
+    A persisted document is loaded to read it, as its first query would.
+    """
+    _sync()
+    with _lock:
+        doc = _loaded_document((session_id, doc_id))
+        return doc.embedder if doc is not None else None
+
+
+def document_fingerprint(session_id: str, doc_id: str) -> dict | None:
+    """The fingerprint stored with a document by add_chunks, or None.
+
+    Reading it never loads the document itself.
+    """
+    _sync()
+    with _lock:
+        doc = _docs.get((session_id, doc_id))
+        if doc is None:
+            return None
+        if doc.fingerprint is None:
+            try:
+                with registry.locked(STORE_DIR, exclusive=False), \
+                        open(os.path.join(doc.path, _FINGERPRINT_FILE), encoding="utf-8") as f:
+                    doc.fingerprint = json.load(f)
+            except FileNotFoundError:
+                doc.fingerprint = {}
+        return doc.fingerprint or None
+
+
+def find_document(session_id: str, content_hash: str) -> str | None:
+    """The most recently used document of a session uploaded with this content hash."""
+    for doc_id in reversed(list_documents(session_id)):
+        fingerprint = document_fingerprint(session_id, doc_id)
+        if fingerprint is not None and fingerprint.get("content_hash") == content_hash:
+            return doc_id
+    return None
+
+
+def document_rows(session_id: str, doc_id: str) -> tuple[ChunkTable, np.ndarray] | None:
+    """A document's chunks and unit-length float32 rows, loading it if needed.
+
+    The rows are full precision when the document is persisted or not
+    quantized; otherwise they are dequantized approximations.
+    """
+    found = _searchable(session_id, doc_id)
+    if found is None:
+        return None
+    chunks, embeddings, full, _ = found
+    if full is not None:
+        return chunks, full
+    return chunks, np.asarray(embeddings, dtype=np.float32)
+
+
+def memory_usage() -> int:
+    """Return the estimated bytes held by all documents."""
+    with _lock:
+        return sum(d.nbytes for d in _docs.values())
+
+
+def _searchable(session_id: str, doc_id: str | None):
+    """(chunks, embeddings, full, index) of a document, loading it if needed; None if absent."""
+    _sync()
+    with _lock:
+        if doc_id is None:
+            doc_id = latest_document(session_id)
+        key = (session_id, doc_id)
+        doc = _loaded_document(key)
+        if doc is None:
+            return None
+        _docs.move_to_end(key)
+        return doc.chunks, doc.embeddings, doc.full, doc.index
+
+
+def _unit(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def _rescoring(full: np.ndarray | None) -> bool:
+    return full is not None and RESCORE_CANDIDATES > 0
+
+
+def _candidates(k: int, n: int, full: np.ndarray | None) -> int:
+    """How many hits to take from the searched matrix before rescoring."""
+    return min(n, k * RESCORE_CANDIDATES) if _rescoring(full) else k
+
+
+def _rescore(full: np.ndarray, ids: np.ndarray, query_vec: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """Rescore candidate rows at full precision; returns the best k (ids, similarities)."""
+    ids = np.sort(ids)  # sequential reads from the memory-mapped file
+    similarities = full[ids] @ query_vec
+    best = top_k(similarities, min(k, len(ids)))
+    return ids[best], similarities[best]
+
+
+def _search(embeddings, full: np.ndarray | None, index: IVFIndex | BlockIndex | None,
+            query_vec: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """Best k (ids, similarities) of one unit query vector."""
+    n = _candidates(k, len(embeddings), full)
+    if index is not None:
+        top_indices, top_sims = index.search(embeddings, query_vec, n)
+    else:
+        # Rows are already unit-length, so this matvec is the cosine similarity
+        similarities = embeddings @ query_vec
+        top_indices = top_k(similarities, n)
+        top_sims = similarities[top_indices]
+    if _rescoring(full):
+        return _rescore(full, top_indices, query_vec, k)
+    return top_indices, top_sims
+
+
+def _results(chunks: ChunkTable | None, top_indices, top_sims) -> dict:
+    """Result dict of one query; metadatas are read-only views, not dicts."""
     return {
-        "documents": [[_chunks[i]["text"] for i in top_indices]],
-        "metadatas": [[{k: v for k, v in _chunks[i].items() if k != "text"}
-                       for i in top_indices]],
-        "distances": [[float(1 - similarities[i]) for i in top_indices]],
+        "documents": [[chunks.text(i) for i in top_indices]],
+        "metadatas": [[chunks.metadata(i) for i in top_indices]],
+        "distances": [[float(1 - s) for s in top_sims]],
     }
 
 
-def clear() -> None:
-    """Remove all stored data."""
-    global _chunks, _embeddings
-    _chunks = []
-    _embeddings = None
+def query(
+    query_embedding: list[float],
+    n_results: int = TOP_K,
+    session_id: str = DEFAULT_SESSION,
+    doc_id: str | None = None,
+) -> dict:
+    """Find the most similar chunks of one document using cosine similarity.
+
+    If doc_id is None, the session's most recently used document is searched.
+    """
+    found = _searchable(session_id, doc_id)
+    if found is None or len(found[0]) == 0:
+        return _results(None, [], [])
+    chunks, embeddings, full, index = found
+    k = min(n_results, len(chunks))
+    return _results(chunks, *_search(embeddings, full, index, _unit(query_embedding), k))
+
+
+def query_batch(
+    query_embeddings: "np.ndarray | list[list[float]]",
+    n_results: int = TOP_K,
+    session_id: str = DEFAULT_SESSION,
+    doc_id: str | None = None,
+) -> list[dict]:
+    """query() for many questions against one document; one result dict each.
+
+    Exact search scores all questions with one matrix-matrix product (in
+    blocks of questions, to bound the score matrix to SCORE_BLOCK_BYTES)
+    and selects each row's top k together. IVF and block probes depend on
+    the question, so such an index is searched once per question.
+    """
+    found = _searchable(session_id, doc_id)
+    if found is None or len(found[0]) == 0:
+        return [_results(None, [], []) for _ in query_embeddings]
+    chunks, embeddings, full, index = found
+
+    queries = _normalize_rows(query_embeddings)
+    k = min(n_results, len(chunks))
+    if index is not None:
+        return [_results(chunks, *_search(embeddings, full, index, q, k)) for q in queries]
+
+    n = _candidates(k, len(chunks), full)
+    results = []
+    block = max(1, SCORE_BLOCK_BYTES // (4 * len(chunks)))
+    for start in range(0, len(queries), block):
+        similarities = (embeddings @ queries[start:start + block].T).T
+        top_indices = top_k_rows(similarities, n)
+        top_sims = np.take_along_axis(similarities, top_indices, axis=1)
+        for q, ids, sims in zip(queries[start:start + block], top_indices, top_sims):
+            if _rescoring(full):
+                ids, sims = _rescore(full, ids, q, k)
+            results.append(_results(chunks, ids, sims))
+    return results
+
+
+def clear(session_id: str | None = None, doc_id: str | None = None) -> None:
+    """Remove stored data.
+
+    With no arguments everything is dropped; with a session_id only that
+    session (or one of its documents, if doc_id is given) is removed.
+    Persisted copies are deleted from disk (and from the registry) as well.
+    """
+    _sync()
+    with _lock:
+        removed = [key for key in _docs
+                   if session_id is None or (key[0] == session_id and (doc_id is None or key[1] == doc_id))]
+        paths = [_docs.pop(key).path for key in removed]
+    if STORE_DIR is not None and removed:
+        with registry.locked(STORE_DIR, exclusive=True):
+            for path in paths:
+                if path is not None:
+                    shutil.rmtree(path, ignore_errors=True)
+            registry.remove(STORE_DIR, removed)
+
+
+if STORE_DIR is not None:
+    os.makedirs(STORE_DIR, exist_ok=True)
+    _discover()